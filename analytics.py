@@ -0,0 +1,244 @@
+"""
+Analytics
+---------
+Vectorized summaries of Game.stats-shaped results (a DataFrame of get_stats()
+rows, a list of those rows, or a resultstore.ResultStore), in place of
+per-round filtering loops like
+
+    for i in range(500):
+        round = results[results["round"] == i]
+        ...
+
+- summary_table: one row per (game_num, round[, by]) with hand and outcome
+  counts, money wagered and won, and how many players are in profit.
+  cached_summary keeps it in a result set's directory and only summarizes
+  games added since.
+- round_summary: per-round win rate, profit share and their running averages,
+  from a summary table (or raw rows).
+- balance_bands: percentiles of players' balances after every round.
+- ev_by_count: EV per true-count bucket.
+- drawdowns: each player's worst peak-to-trough fall in every game.
+
+`by` is a column (or list of columns) to split every result by, e.g.
+"strategy" (result sets only), "name" or "decks".
+
+    store = ResultStore.open("HiLo_100G.bjr")
+    rounds = round_summary(cached_summary(store, by="strategy"), by="strategy")
+    rounds.pivot(index="round", columns="strategy", values="win_rate").plot()
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from counting import MAX_COUNT_BUCKET, MIN_COUNT_BUCKET
+
+START_BALANCE = 1000
+
+SUMMARY_COUNTS = ("hands", "wins", "losses", "pushes", "doubles", "blackjacks", "busts")
+SUMMARY_TOTALS = SUMMARY_COUNTS + ("wagered", "net", "players", "players_in_profit", "balance_sum")
+
+
+def _by(by):
+    if by is None:
+        return []
+    return [by] if isinstance(by, str) else list(by)
+
+
+def load(data, columns=None):
+    """
+    DataFrame of results with a game_num column (0 if the data has none).
+    columns limits what is read from a ResultStore.
+    """
+    if isinstance(data, pd.DataFrame):
+        frame = data
+    elif hasattr(data, "to_pandas"):
+        if columns is not None:
+            columns = ["game" if name == "game_num" else name for name in columns]
+            if "game" not in columns:
+                columns.append("game")
+        frame = data.to_pandas(columns).rename(columns={"game": "game_num"})
+    else:
+        frame = pd.DataFrame(data)
+    if "game_num" not in frame:
+        frame = frame.assign(game_num=0)
+    return frame
+
+
+def hand_net(frame):
+    """
+    What each hand won or lost, from its result flags and (final) bet. A hand
+    the analytic dealer paid its expected value (Game.settle_expected; no
+    win, loss or push flag) is NaN: its rows don't keep what it was paid.
+    """
+    bet = frame["betAmount"].to_numpy(dtype=float)
+    # Blackjacks pay 3:2, and the flag is set on every hand paid so, a split A+10 included
+    won = np.where(frame["blackjack"].to_numpy() == 1, 1.5, 1.0)
+    outcomes = [frame[name].to_numpy() == 1 for name in ("win", "loss", "tie")]
+    return pd.Series(np.select(outcomes, [won, -1.0, 0.0], np.nan) * bet, index=frame.index)
+
+
+def _has_nan(frame, column, keys):
+    """Per group of keys, whether column has a NaN (a groupby sum would skip it and understate the total)."""
+    return frame[column].isna().groupby([frame[key] for key in keys], observed=True, sort=True).any()
+
+
+def player_rounds(frame):
+    """One row per player per round (the last hand's row), balance being the balance after the round."""
+    return frame.drop_duplicates(["game_num", "name", "round"], keep="last")
+
+
+def summary_table(data, by=None, start_balance=START_BALANCE):
+    """
+    One row per (game_num, round, *by): hands, wins, losses, pushes, doubles,
+    blackjacks and busts counted over hands; wagered and net in money (NaN
+    for a round with expected-value hands, see hand_net); players,
+    players_in_profit (balance above start_balance after the round) and
+    balance_sum over players.
+    """
+    keys = ["game_num", "round"] + _by(by)
+    frame = load(data, keys + ["name", "balance", "betAmount", "win", "loss", "tie", "double", "blackjack", "bust"])
+    hands = pd.DataFrame({
+        **{key: frame[key] for key in keys},
+        "hands": 1,
+        "wins": frame["win"],
+        "losses": frame["loss"],
+        "pushes": frame["tie"],
+        "doubles": frame["double"],
+        "blackjacks": frame["blackjack"],
+        "busts": frame["bust"],
+        "wagered": frame["betAmount"],
+        "net": hand_net(frame),
+    })
+    # The flag columns are int8; count in int64
+    hands = hands.astype({name: np.int64 for name in SUMMARY_COUNTS})
+    summary = hands.groupby(keys, observed=True, sort=True).sum()
+    summary["net"] = summary["net"].mask(_has_nan(hands, "net", keys))
+
+    players = player_rounds(frame)
+    players = pd.DataFrame({
+        **{key: players[key] for key in keys},
+        "players": 1,
+        "players_in_profit": (players["balance"] > start_balance).astype(int),
+        "balance_sum": players["balance"],
+    }).groupby(keys, observed=True, sort=True).sum()
+    return summary.join(players).reset_index()
+
+
+def cached_summary(store, by=None, start_balance=START_BALANCE):
+    """
+    summary_table of a ResultStore, cached as a CSV in its directory. Only
+    games that aren't in the cache (or whose row count changed, e.g. while
+    the set is still being written) are read and summarized; the rest come
+    from the cache.
+    """
+    keys = ["game_num", "round"] + _by(by)
+    name = "_".join(["summary"] + _by(by) + [str(start_balance), store.meta.get("id", "")[:12]])
+    path = os.path.join(store.path, f"{name}.csv")
+    cached = pd.read_csv(path, float_precision="round_trip") if os.path.exists(path) else None
+
+    games = {game_num: info["stop"] - info["start"] for game_num, info in store.games.items()}
+    fresh = list(games)
+    if cached is not None:
+        cached_hands = cached.groupby("game_num")["hands"].sum()
+        stale = [game_num for game_num in cached_hands.index if cached_hands[game_num] != games.get(game_num)]
+        cached = cached[~cached["game_num"].isin(stale)]
+        fresh = [game_num for game_num in games if game_num not in cached_hands.index or game_num in stale]
+
+    parts = [cached] if cached is not None else []
+    if fresh:
+        columns = list(dict.fromkeys(["round", "name", "balance", "betAmount", "win", "loss", "tie", "double",
+                                      "blackjack", "bust"] + _by(by)))
+        frame = store.to_pandas(columns + ["game"], games=fresh).rename(columns={"game": "game_num"})
+        parts.append(summary_table(frame, by, start_balance))
+        summary = pd.concat(parts, ignore_index=True).sort_values(keys, ignore_index=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        summary.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    else:
+        summary = parts[0]
+    return summary[summary["game_num"].isin(list(games))].reset_index(drop=True)
+
+
+def round_summary(data, by=None, start_balance=START_BALANCE):
+    """
+    Per round (and *by): the summed counts plus win_rate (wins per hand),
+    profit_share (share of players in profit), ev (net per money wagered)
+    and the running averages cum_win_rate and cum_profit_share over rounds.
+    data is a summary_table, or raw results to summarize first.
+    """
+    if isinstance(data, pd.DataFrame) and "players_in_profit" in data:
+        summary = data
+    else:
+        summary = summary_table(data, by, start_balance)
+    keys = ["round"] + _by(by)
+    rounds = summary.groupby(keys, observed=True, sort=True)[list(SUMMARY_TOTALS)].sum()
+    rounds["net"] = rounds["net"].mask(_has_nan(summary, "net", keys))
+    rounds = rounds.reset_index()
+    rounds["win_rate"] = rounds["wins"] / rounds["hands"]
+    rounds["profit_share"] = rounds["players_in_profit"] / rounds["players"]
+    rounds["ev"] = rounds["net"] / rounds["wagered"]
+    rounds["mean_balance"] = rounds["balance_sum"] / rounds["players"]
+    if _by(by):
+        grouped = rounds.groupby(_by(by), observed=True)
+        rounds["cum_win_rate"] = grouped["win_rate"].cumsum() / (grouped.cumcount() + 1)
+        rounds["cum_profit_share"] = grouped["profit_share"].cumsum() / (grouped.cumcount() + 1)
+    else:
+        rounds["cum_win_rate"] = rounds["win_rate"].expanding().mean()
+        rounds["cum_profit_share"] = rounds["profit_share"].expanding().mean()
+    return rounds
+
+
+def balance_bands(data, percentiles=(5, 25, 50, 75, 95), by=None):
+    """Percentiles of players' balances after each round: one row per round (and *by), a column p<n> per percentile."""
+    keys = ["round"] + _by(by)
+    frame = player_rounds(load(data, keys + ["game_num", "name", "balance"]))
+    quantiles = [p / 100 for p in percentiles]
+    bands = frame.groupby(keys, observed=True, sort=True)["balance"].quantile(quantiles).unstack()
+    bands.columns = [f"p{p:g}" for p in percentiles]
+    return bands.reset_index()
+
+
+def ev_by_count(data, by=None):
+    """
+    Hands, wagered, net, ev (net per money wagered), ev_per_hand and its
+    standard error per true-count bucket (floor of the true count the bets
+    were placed at, clipped like counting.true_count_bucket). A bucket with
+    expected-value hands (see hand_net) has NaN net and EV.
+    """
+    # Not the stats' true_count: that one is taken after the round, so it counts the hand's own cards
+    if "bet_true_count" not in (data.columns if hasattr(data, "columns") else pd.DataFrame(data[:1]).columns):
+        raise ValueError("The results have no bet_true_count column (they were recorded before it was)")
+    frame = load(data, ["bet_true_count", "betAmount", "win", "loss", "tie", "blackjack"] + _by(by))
+    buckets = np.clip(np.floor(frame["bet_true_count"].to_numpy()), MIN_COUNT_BUCKET, MAX_COUNT_BUCKET).astype(int)
+    hands = pd.DataFrame({
+        **{key: frame[key] for key in _by(by)},
+        "count": buckets,
+        "wagered": frame["betAmount"],
+        "net": hand_net(frame),
+    })
+    keys = _by(by) + ["count"]
+    grouped = hands.groupby(keys, observed=True, sort=True)
+    table = grouped.agg(hands=("net", "size"), wagered=("wagered", "sum"), net=("net", "sum"),
+                        ev_per_hand=("net", "mean"), std=("net", "std"))
+    table.loc[_has_nan(hands, "net", keys), ["net", "ev_per_hand", "std"]] = np.nan
+    table["ev"] = table["net"] / table["wagered"]
+    table["ev_sem"] = table["std"] / np.sqrt(table["hands"])
+    return table.drop(columns="std").reset_index()
+
+
+def drawdowns(data, by=None, start_balance=START_BALANCE):
+    """
+    One row per player per game: final balance, peak balance and
+    max_drawdown (largest fall from a running peak, the starting balance
+    counting as the first peak). Describe it by group for a distribution:
+    drawdowns(store, by="strategy").groupby("strategy")["max_drawdown"].describe()
+    """
+    keys = ["game_num", "name"] + [key for key in _by(by) if key != "name"]
+    frame = player_rounds(load(data, keys + ["round", "balance"])).sort_values(["game_num", "name", "round"])
+    balance = frame["balance"]
+    peak = balance.groupby([frame["game_num"], frame["name"]], observed=True).cummax().clip(lower=start_balance)
+    paths = pd.DataFrame({**{key: frame[key] for key in keys}, "balance": balance, "peak": peak,
+                          "drawdown": peak - balance})
+    return paths.groupby(keys, observed=True, sort=True).agg(
+        final_balance=("balance", "last"), peak=("peak", "max"), max_drawdown=("drawdown", "max")).reset_index()
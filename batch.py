@@ -0,0 +1,407 @@
+"""
+Batch Engine
+------------
+Plays many independent blackjack tables in lockstep with NumPy arrays.
+
+Every table has its own shoe, count and seats; a round deals, plays each seat's
+hands from its compiled ActionTable, plays the dealer and settles payouts for
+all tables at once. Rules follow blackjack.Game, and get_stats() returns the
+same per-hand columns as Game.stats (plus "game_num", the table index) as
+NumPy arrays.
+
+Limitations compared to Game:
+- decisions come from a table (see tables.py), and bets from the strategy's
+  BASE_BET_FRACTION/BET_RAMP, so strategies must be expressible that way
+- a seat holds at most max_hands hands; a split past that cap is played as
+  a hit, like any other split or double the game can't make
+- win/loss streaks are not tracked
+"""
+import math
+import numpy as np
+from blackjack import ACE, RANK_VALUES, HI_LO_TAGS, Game, Player, card_name
+from tables import ActionTable, STAND, HIT, DOUBLE, SPLIT, HARD, SOFT, PAIR, MIN_COUNT_BUCKET, MAX_COUNT_BUCKET
+
+_HARD_VALUES = np.array([1 if rank == ACE else value for rank, value in enumerate(RANK_VALUES)], dtype=np.int16)
+_VALUES = np.array(RANK_VALUES, dtype=np.int16)
+_TAGS = np.array(HI_LO_TAGS, dtype=np.int64)
+
+# Longest possible hand: 21 with every card counted as 1 or 2, plus the card that busts it
+MAX_CARDS = 22
+
+
+class BatchGame:
+    def __init__(self, number_of_decks, players: list, n_tables, seed=None, max_hands=8, record_cards=False):
+        """players are templates: every table seats a copy of each (name, strategy, balance)."""
+        self.rng = np.random.default_rng(seed)
+        self.n_tables = n_tables
+        self.n_seats = len(players)
+        self.max_hands = max_hands
+        self.record_cards = record_cards
+        self.total_cards = number_of_decks * 52
+        self.percent_needed_reshuffle = .40
+
+        self.names = np.array([player.name for player in players], dtype=object)
+        self.tables = []
+        self.counted = []
+        self.bet_ramps = []
+        for player in players:
+            table = ActionTable.from_strategy(player.strategy)
+            self.tables.append(np.frombuffer(bytes(table.actions), dtype=np.uint8).reshape(table.shape))
+            self.counted.append(table.counted)
+            self.bet_ramps.append((player.strategy.BASE_BET_FRACTION, player.strategy.BET_RAMP))
+
+        self.balance = np.tile(np.array([player.balance for player in players], dtype=np.float64), (n_tables, 1))
+
+        self.shoe = self.rng.permuted(np.tile(np.arange(52, dtype=np.int8), (n_tables, number_of_decks)), axis=1)
+        self.cursor = np.zeros(n_tables, dtype=np.int64)
+        self.running_count = np.zeros(n_tables, dtype=np.int64)
+
+        shape = (n_tables, self.n_seats, max_hands)
+        self.hard = np.zeros(shape, dtype=np.int16)
+        self.aces = np.zeros(shape, dtype=np.int16)
+        self.ncards = np.zeros(shape, dtype=np.int16)
+        self.first_rank = np.zeros(shape, dtype=np.int16)
+        self.is_pair = np.zeros(shape, dtype=bool)
+        self.from_split = np.zeros(shape, dtype=bool)
+        self.bet = np.zeros(shape, dtype=np.float64)
+        self.active = np.zeros(shape, dtype=bool)
+        self.doubled = np.zeros(shape, dtype=bool)
+        self.nhands = np.ones((n_tables, self.n_seats), dtype=np.int64)
+        self.cards = np.zeros(shape + (MAX_CARDS,), dtype=np.int8) if record_cards else None
+
+        self.dealer_hard = np.zeros(n_tables, dtype=np.int16)
+        self.dealer_aces = np.zeros(n_tables, dtype=np.int16)
+        self.dealer_ncards = np.zeros(n_tables, dtype=np.int16)
+        self.dealer_up = np.zeros(n_tables, dtype=np.int16)
+        self.dealer_cards = np.zeros((n_tables, MAX_CARDS), dtype=np.int8) if record_cards else None
+
+        self.stats = []
+
+    def get_true_count(self, rows=slice(None)):
+        remaining_decks = (self.total_cards - self.cursor[rows]) / 52
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(remaining_decks > 0, self.running_count[rows] / remaining_decks, 0.0)
+
+    def reshuffle(self, rows):
+        self.shoe[rows] = self.rng.permuted(self.shoe[rows], axis=1)
+        self.cursor[rows] = 0
+        self.running_count[rows] = 0
+
+    def _draw(self, rows):
+        cards = self.shoe[rows, self.cursor[rows]]
+        self.cursor[rows] += 1
+        self.running_count[rows] += _TAGS[cards % 13]
+        return cards
+
+    def _add_card(self, seat, rows, hand_index, cards):
+        ranks = cards % 13
+        n = self.ncards[rows, seat, hand_index]
+        self.hard[rows, seat, hand_index] += _HARD_VALUES[ranks]
+        self.aces[rows, seat, hand_index] += ranks == ACE
+        first = np.where(n == 0, ranks, self.first_rank[rows, seat, hand_index])
+        self.first_rank[rows, seat, hand_index] = first
+        # Split hands aren't split again (see blackjack.Hand.from_split)
+        self.is_pair[rows, seat, hand_index] = (n == 1) & (first == ranks) & ~self.from_split[rows, seat, hand_index]
+        if self.record_cards:
+            self.cards[rows, seat, hand_index, n] = cards
+        self.ncards[rows, seat, hand_index] = n + 1
+
+    def _add_dealer_card(self, rows, cards):
+        ranks = cards % 13
+        if self.record_cards:
+            self.dealer_cards[rows, self.dealer_ncards[rows]] = cards
+        self.dealer_hard[rows] += _HARD_VALUES[ranks]
+        self.dealer_aces[rows] += ranks == ACE
+        self.dealer_ncards[rows] += 1
+
+    def _dealer_score(self):
+        soft = (self.dealer_aces > 0) & (self.dealer_hard <= 11)
+        return np.where(soft, self.dealer_hard + 10, self.dealer_hard)
+
+    def _reset_hands(self):
+        for array in (self.hard, self.aces, self.ncards, self.first_rank, self.bet):
+            array.fill(0)
+        self.is_pair.fill(False)
+        self.from_split.fill(False)
+        self.doubled.fill(False)
+        self.active.fill(False)
+        self.active[:, :, 0] = True
+        self.nhands.fill(1)
+        self.dealer_hard.fill(0)
+        self.dealer_aces.fill(0)
+        self.dealer_ncards.fill(0)
+
+    def place_bets(self):
+        true_count = self.bet_true_count = self.get_true_count()
+        for seat, (base_fraction, ramp) in enumerate(self.bet_ramps):
+            fraction = np.full(self.n_tables, base_fraction)
+            # The first matching step wins, so apply the steps lowest priority first
+            for min_count, step_fraction in reversed(ramp):
+                fraction = np.where(true_count >= min_count, step_fraction, fraction)
+            balance = self.balance[:, seat]
+            bet = np.round(balance * fraction, 2)
+            bet = np.where(bet <= balance, bet, 0.0)
+            self.bet[:, seat, 0] = bet
+            self.balance[:, seat] -= bet
+
+    def deal_cards(self):
+        rows = np.arange(self.n_tables)
+        up_card = self._draw(rows)
+        self.dealer_up[:] = _VALUES[up_card % 13]
+        self._add_dealer_card(rows, up_card)
+        for seat in range(self.n_seats):
+            self._add_card(seat, rows, 0, self._draw(rows))
+            self._add_card(seat, rows, 0, self._draw(rows))
+        self._add_dealer_card(rows, self._draw(rows))
+
+    def _split(self, seat, rows, hand_index):
+        """Move the second card of each hand into a new hand inserted right after it."""
+        new_index = hand_index + 1
+        for array in (self.hard, self.aces, self.ncards, self.first_rank, self.is_pair, self.from_split,
+                      self.bet, self.active, self.doubled) + ((self.cards,) if self.record_cards else ()):
+            seat_view = array[:, seat]
+            for k in range(self.max_hands - 1, 1, -1):
+                shift = rows[k > new_index]
+                seat_view[shift, k] = seat_view[shift, k - 1]
+
+        rank = self.first_rank[rows, seat, hand_index]
+        moved = self.cards[rows, seat, hand_index, 1] if self.record_cards else rank
+        self.hard[rows, seat, hand_index] -= _HARD_VALUES[rank]
+        self.aces[rows, seat, hand_index] -= rank == ACE
+        self.ncards[rows, seat, hand_index] = 1
+        self.is_pair[rows, seat, hand_index] = False
+
+        bet = self.bet[rows, seat, hand_index]
+        for array in (self.hard, self.aces, self.ncards, self.first_rank):
+            array[rows, seat, new_index] = 0
+        self.is_pair[rows, seat, new_index] = False
+        self.doubled[rows, seat, new_index] = False
+        self.active[rows, seat, new_index] = True
+        self.from_split[rows, seat, hand_index] = True
+        self.from_split[rows, seat, new_index] = True
+        self.bet[rows, seat, new_index] = bet
+        self._add_card(seat, rows, new_index, moved)
+        self.nhands[rows, seat] += 1
+        self.balance[rows, seat] -= bet
+
+        self._add_card(seat, rows, hand_index, self._draw(rows))
+        self._add_card(seat, rows, new_index, self._draw(rows))
+
+    def play_seat(self, seat):
+        table = self.tables[seat]
+        counted = self.counted[seat]
+        current = np.zeros(self.n_tables, dtype=np.int64)
+        nhands = self.nhands[:, seat]
+        while True:
+            rows = np.flatnonzero(current < nhands)
+            if rows.size == 0:
+                break
+            hand_index = current[rows]
+            hard = self.hard[rows, seat, hand_index]
+            playing = self.active[rows, seat, hand_index] & (hard <= 21)
+            current[rows[~playing]] += 1
+
+            rows = rows[playing]
+            if rows.size == 0:
+                continue
+            hand_index = hand_index[playing]
+            hard = hard[playing]
+
+            soft = (self.aces[rows, seat, hand_index] > 0) & (hard <= 11)
+            pair = self.is_pair[rows, seat, hand_index]
+            category = np.where(pair, PAIR, np.where(soft, SOFT, HARD))
+            total = np.where(pair, _VALUES[self.first_rank[rows, seat, hand_index]], np.where(soft, hard + 10, hard))
+            if counted:
+                true_count = self.get_true_count(rows)
+                bucket = np.clip(np.floor(true_count), MIN_COUNT_BUCKET, MAX_COUNT_BUCKET).astype(np.int64) - MIN_COUNT_BUCKET
+            else:
+                bucket = 0
+            action = table[bucket, category, total, self.dealer_up[rows] - 2]
+
+            # A split that can't be made is played as a hit
+            split = action == SPLIT
+            if split.any():
+                can_split = (pair & (self.bet[rows, seat, hand_index] <= self.balance[rows, seat])
+                             & (nhands[rows] < self.max_hands))
+                action = np.where(split & ~can_split, HIT, action)
+                split = split & can_split
+                if split.any():
+                    self._split(seat, rows[split], hand_index[split])
+
+            # Only a two-card hand the balance covers can double; any other double is a hit
+            double = action == DOUBLE
+            if double.any():
+                can_double = ((self.ncards[rows, seat, hand_index] == 2)
+                              & (self.bet[rows, seat, hand_index] <= self.balance[rows, seat]))
+                action = np.where(double & ~can_double, HIT, action)
+                double = double & can_double
+            if double.any():
+                double_rows, double_index = rows[double], hand_index[double]
+                self.balance[double_rows, seat] -= self.bet[double_rows, seat, double_index]
+                self.bet[double_rows, seat, double_index] *= 2
+                self.active[double_rows, seat, double_index] = False
+                self.doubled[double_rows, seat, double_index] = True
+                self._add_card(seat, double_rows, double_index, self._draw(double_rows))
+
+            hit = action == HIT
+            if hit.any():
+                self._add_card(seat, rows[hit], hand_index[hit], self._draw(rows[hit]))
+
+            stand = action == STAND
+            self.active[rows[stand], seat, hand_index[stand]] = False
+
+    def play_dealer(self):
+        while True:
+            rows = np.flatnonzero(self._dealer_score() < 17)
+            if rows.size == 0:
+                break
+            self._add_dealer_card(rows, self._draw(rows))
+
+    def determine_winners(self):
+        """Pay out every hand; returns per-hand outcome arrays shaped (tables, seats, hands) (blackjack: paid 3:2)."""
+        dealer_score = self._dealer_score()
+        dealer_busted = self.dealer_hard > 21
+        dealer_blackjack = (self.dealer_ncards == 2) & (self.dealer_aces == 1) & (self.dealer_hard == 11)
+
+        soft = (self.aces > 0) & (self.hard <= 11)
+        score = np.where(soft, self.hard + 10, self.hard)
+        busted = self.hard > 21
+        blackjack = (self.ncards == 2) & (self.aces == 1) & (self.hard == 11)
+        valid = np.arange(self.max_hands) < self.nhands[:, :, None]
+
+        d_score = dealer_score[:, None, None]
+        standing = valid & ~busted
+        win_blackjack = standing & blackjack & ~dealer_blackjack[:, None, None]
+        standing &= ~win_blackjack
+        win_dealer_bust = standing & dealer_busted[:, None, None]
+        standing &= ~win_dealer_bust
+        win = win_dealer_bust | win_blackjack | (standing & (score > d_score))
+        push = standing & (score == d_score)
+        loss = valid & ~win & ~push
+
+        payout = np.where(win_blackjack, self.bet * 2.5,
+                          np.where(win, self.bet * 2, np.where(push, self.bet, 0.0)))
+        self.balance += (payout * valid).sum(axis=2)
+        return valid, score, win, loss, push, busted, win_blackjack, dealer_score
+
+    def play_round(self, round_num):
+        """Play one round at every table"""
+        reshuffle = (self.total_cards - self.cursor) < self.total_cards * self.percent_needed_reshuffle
+        if reshuffle.any():
+            self.reshuffle(reshuffle)
+
+        self._reset_hands()
+        self.place_bets()
+        self.deal_cards()
+        for seat in range(self.n_seats):
+            self.play_seat(seat)
+        self.play_dealer()
+        valid, score, win, loss, push, busted, blackjack, dealer_score = self.determine_winners()
+        self._record(round_num, valid, score, win, loss, push, busted, blackjack, dealer_score)
+
+    def _record(self, round_num, valid, score, win, loss, push, busted, blackjack, dealer_score):
+        table, seat, hand = np.nonzero(valid)
+        index = (table, seat, hand)
+        true_count = np.round(self.get_true_count(), 3)
+        columns = {
+            "round": np.full(table.size, round_num),
+            "name": self.names[seat],
+            "balance": self.balance[table, seat],
+            "score": score[index],
+            "betAmount": self.bet[index],
+
+            "win": win[index].astype(np.int8),
+            "loss": loss[index].astype(np.int8),
+            "tie": push[index].astype(np.int8),
+            "double": self.doubled[index].astype(np.int8),
+            "blackjack": blackjack[index].astype(np.int8),
+            "bust": busted[index].astype(np.int8),
+
+            "dealer_bust": (dealer_score[table] > 21).astype(np.int8),
+            "dealer_score": dealer_score[table],
+
+            "decks": np.full(table.size, self.total_cards / 52),
+            "running_count": self.running_count[table],
+            "true_count": true_count[table],
+            "bet_true_count": np.round(self.bet_true_count, 3)[table],
+            "game_num": table,
+        }
+        if self.record_cards:
+            columns["hand"] = [
+                [card_name(card) for card in self.cards[t, s, h, :self.ncards[t, s, h]]]
+                for t, s, h in zip(table, seat, hand)
+            ]
+            columns["dealer_hand"] = [
+                [card_name(card) for card in self.dealer_cards[t, :self.dealer_ncards[t]]]
+                for t in table
+            ]
+        self.stats.append(columns)
+
+    def get_stats(self):
+        """Per-hand columns for every round played so far, concatenated."""
+        if not self.stats:
+            return {}
+        stats = {}
+        for key in self.stats[0]:
+            if key in ("hand", "dealer_hand"):
+                stats[key] = [cards for columns in self.stats for cards in columns[key]]
+            else:
+                stats[key] = np.concatenate([columns[key] for columns in self.stats])
+        return stats
+
+
+COMPARED_COLUMNS = ("win", "loss", "tie", "double", "blackjack", "bust", "dealer_bust")
+
+
+def _pooled_rate(hits, hands):
+    """
+    Rate of a flag pooled over tables, and its standard error from the spread
+    of the per-table counts (a ratio estimator over independent tables).
+    """
+    hits = np.asarray(hits, dtype=np.float64)
+    hands = np.asarray(hands, dtype=np.float64)
+    total = hands.sum()
+    rate = hits.sum() / total
+    tables = len(hands)
+    if tables < 2:
+        return rate, float("inf")
+    residuals = hits - rate * hands
+    return rate, math.sqrt(tables / (tables - 1) * (residuals ** 2).sum()) / total
+
+
+def cross_check(strategy, number_of_decks=6, rounds=20000, n_tables=200, seed=0):
+    """
+    Play the same strategy on the scalar Game and on BatchGame and compare the
+    per-hand outcome rates. Each engine plays n_tables independent tables of
+    rounds // n_tables rounds. Hands at one table share the dealer's hand and
+    the shoe, so standard errors come from the spread of the per-table rates,
+    not from a binomial over hands. Returns {column: (game_rate, batch_rate,
+    z)}; with engines that agree, z is roughly standard normal.
+    """
+    from runner import derive_seed
+    table_rounds = max(1, rounds // n_tables)
+    game_counts = {column: [] for column in COMPARED_COLUMNS}
+    game_hands = []
+    for table in range(n_tables):
+        game = Game(number_of_decks, [Player(name="Scalar", strategy=strategy)], seed=derive_seed(seed, table))
+        game.play_rounds(table_rounds)
+        game_stats = game.get_stats()
+        game_hands.append(len(game_stats))
+        for column in COMPARED_COLUMNS:
+            game_counts[column].append(sum(row[column] for row in game_stats))
+
+    batch = BatchGame(number_of_decks, [Player(name="Batch", strategy=strategy)], n_tables, seed=seed)
+    for round_num in range(table_rounds):
+        batch.play_round(round_num)
+    batch_stats = batch.get_stats()
+    batch_hands = np.bincount(batch_stats["game_num"], minlength=n_tables)
+
+    comparison = {}
+    for column in COMPARED_COLUMNS:
+        game_rate, game_error = _pooled_rate(game_counts[column], game_hands)
+        batch_rate, batch_error = _pooled_rate(
+            np.bincount(batch_stats["game_num"], weights=batch_stats[column], minlength=n_tables), batch_hands)
+        std_error = math.sqrt(game_error ** 2 + batch_error ** 2)
+        z = (batch_rate - game_rate) / std_error if std_error > 0 else 0.0
+        comparison[column] = (float(game_rate), float(batch_rate), z)
+    return comparison
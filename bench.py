@@ -0,0 +1,269 @@
+"""
+Benchmarks
+----------
+Reproducible throughput benchmarks for Game.play_rounds.
+
+Every case of the matrix (strategy x seats x decks) plays a fixed number of
+seeded rounds (enough for about HANDS hands, so short cases aren't all noise):
+- plain runs for rounds/sec and hands/sec: the best of REPEATS passes over
+  the whole matrix, so a slow spell of the machine costs one pass of several
+  cases rather than every repeat of one
+- a run with instruments.Instruments attached, for per-phase time (bet, deal,
+  player decisions, dealer, settlement, stats recording) and event counts
+- a shorter run under tracemalloc for peak memory
+The "notebook" case replays the simulations.ipynb workload end to end
+(100 games x 500 rounds x 6 seats, then DataFrame.to_csv), also best of
+REPEATS. Startup is timed too: a fresh interpreter importing the engine, and
+a one-round `python -m blackjack` run.
+
+Every run also times a fixed pure-Python workload that doesn't touch the
+engine (calibration_seconds), and timings are compared to the baseline's
+scaled by the two runs' calibrations, so a baseline from another (or a
+busier) machine still compares. Results are written as JSON; any case whose
+scaled rounds/sec drops more than the threshold below the baseline (or any
+startup time that grows more than it) is a regression and makes the run exit
+with status 1.
+
+    python bench.py                      # full matrix, compare to bench_baseline.json
+    python bench.py --quick              # fewer rounds, smaller notebook workload
+    python bench.py --update-baseline    # store this run as the new baseline
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from blackjack import Game, Player
+from instruments import Instruments
+import strategies as strats
+
+STRATEGIES = (strats.BaseStrategy, strats.HiLoStrategy, strats.BasicStrategyCharts)
+SEATS = (1, 6)
+DECKS = (4, 6, 8)
+SEED = 1234
+REPEATS = 5
+CALIBRATION_LOOPS = 200000
+HANDS = 30000
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def make_game(strategy, seats, decks, seed=SEED):
+    players = [Player(strategy=strategy(), name=f"{strategy.__name__} {seat + 1}") for seat in range(seats)]
+    return Game(decks, players, seed=seed)
+
+
+def play(game, rounds):
+    game.play_rounds(rounds)
+
+
+def calibrate():
+    """Seconds for a fixed pure-Python workload (ints, a dict, a list), as a measure of the machine's speed."""
+    start = time.perf_counter()
+    seen = {}
+    values = []
+    total = 0
+    for i in range(CALIBRATION_LOOPS):
+        total = (total * 31 + i) % 1000003
+        seen[total & 1023] = i
+        values.append(total)
+        if len(values) > 64:
+            values.clear()
+    return time.perf_counter() - start
+
+
+def time_case(strategy, seats, decks, rounds):
+    """Seconds to play the case once, and the hands played."""
+    game = make_game(strategy, seats, decks)
+    start = time.perf_counter()
+    play(game, rounds)
+    return time.perf_counter() - start, len(game.get_stats())
+
+
+def run_case(strategy, seats, decks, rounds, memory_rounds, elapsed, hands):
+    """The case's record, from its best time; plays it again instrumented and under tracemalloc."""
+    game = make_game(strategy, seats, decks)
+    instruments = Instruments()
+    instruments.attach(game)
+    play(game, rounds)
+    report = instruments.report()
+
+    game = make_game(strategy, seats, decks)
+    tracemalloc.start()
+    play(game, memory_rounds)
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "case": f"{strategy.__name__}/seats={seats}/decks={decks}",
+        "rounds": rounds,
+        "seconds": elapsed,
+        "rounds_per_sec": rounds / elapsed,
+        "hands_per_sec": hands / elapsed,
+        "peak_memory_bytes": peak_memory,
+        "peak_memory_rounds": memory_rounds,
+        "phase_seconds": report["phase_seconds"],
+        "phase_share": report["phase_share"],
+        "counters": report["counters"],
+    }
+
+
+def run_notebook_workload(games, rounds, seats=6, decks=6):
+    """The simulations.ipynb loop: fresh balances each game, all stats to one CSV (one timing)."""
+    import pandas as pd
+
+    start = time.perf_counter()
+    results = []
+    for game_num in range(games):
+        game = make_game(strats.HiLoStrategy, seats, decks, seed=SEED + game_num)
+        play(game, rounds)
+        stats = game.get_stats()
+        for row in stats:
+            row["game_num"] = game_num
+        results.extend(stats)
+    with tempfile.TemporaryDirectory() as tmp:
+        pd.DataFrame(results).to_csv(os.path.join(tmp, "results.csv"), index=False)
+    elapsed = time.perf_counter() - start
+    total_rounds = games * rounds
+    return {
+        "case": f"notebook/games={games}/rounds={rounds}/seats={seats}/decks={decks}",
+        "rounds": total_rounds,
+        "seconds": elapsed,
+        "rounds_per_sec": total_rounds / elapsed,
+        "hands_per_sec": len(results) / elapsed,
+    }
+
+
+def measure_startup():
+    """Best wall time of a fresh interpreter importing the engine, and of a one-round CLI run."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    commands = {
+        "import": [sys.executable, "-c", "import runner, strategies"],
+        "cli": [sys.executable, "-m", "blackjack", "--rounds", "1", "--format", "json", "--output", os.devnull],
+    }
+    startup = {}
+    for name, command in commands.items():
+        best = float("inf")
+        for _ in range(REPEATS):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=here, check=True)
+            best = min(best, time.perf_counter() - start)
+        startup[f"{name}_seconds"] = best
+    return startup
+
+
+def run(quick=False):
+    hands = HANDS // 5 if quick else HANDS
+    memory_rounds = 200 if quick else 500
+    matrix = [(strategy, seats, decks) for strategy in STRATEGIES for seats in SEATS for decks in DECKS]
+    calibration = float("inf")
+    best = {}
+    notebook = None
+    for _ in range(REPEATS):
+        for strategy, seats, decks in matrix:
+            # Calibrated next to every case, so its best is taken over as many moments as the cases' bests
+            calibration = min(calibration, calibrate())
+            timing = time_case(strategy, seats, decks, hands // seats)
+            best[strategy, seats, decks] = min(best.get((strategy, seats, decks), timing), timing)
+        timing = run_notebook_workload(games=10 if quick else 100, rounds=500)
+        if notebook is None or timing["seconds"] < notebook["seconds"]:
+            notebook = timing
+    cases = [run_case(strategy, seats, decks, hands // seats, memory_rounds, *best[strategy, seats, decks])
+             for strategy, seats, decks in matrix]
+    cases.append(notebook)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "quick": quick,
+        "calibration_seconds": calibration,
+        "cases": cases,
+        "startup": measure_startup(),
+    }
+
+
+def speed_ratio(results, baseline):
+    """How much slower this run's machine is than the baseline's (1.0 if either run wasn't calibrated)."""
+    if "calibration_seconds" not in results or "calibration_seconds" not in baseline:
+        return 1.0
+    return results["calibration_seconds"] / baseline["calibration_seconds"]
+
+
+def compare(results, baseline, threshold):
+    """
+    Cases whose rounds/sec fell more than `threshold` (a fraction) below the
+    baseline's, scaled to this run's machine speed (the scaled rate is reported).
+    """
+    baseline_cases = {case["case"]: case for case in baseline["cases"]}
+    ratio = speed_ratio(results, baseline)
+    regressions = []
+    for case in results["cases"]:
+        reference = baseline_cases.get(case["case"])
+        if reference is None:
+            continue
+        expected = reference["rounds_per_sec"] / ratio
+        change = case["rounds_per_sec"] / expected - 1
+        if change < -threshold:
+            regressions.append((case["case"], expected, case["rounds_per_sec"], change))
+    return regressions
+
+
+def compare_startup(results, baseline, threshold):
+    """Startup times that grew more than `threshold` (a fraction) over the baseline's, scaled like compare."""
+    ratio = speed_ratio(results, baseline)
+    regressions = []
+    for name, seconds in results.get("startup", {}).items():
+        reference = baseline.get("startup", {}).get(name)
+        if reference is None:
+            continue
+        expected = reference * ratio
+        if seconds / expected - 1 > threshold:
+            regressions.append((name, expected, seconds, seconds / expected - 1))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="fewer rounds and a smaller notebook workload")
+    parser.add_argument("--output", default="bench_results.json", help="where to write this run's results")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown as a fraction (default 0.25)")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run to the baseline file")
+    args = parser.parse_args(argv)
+
+    results = run(quick=args.quick)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    for case in results["cases"]:
+        print(f"{case['case']:<55} {case['rounds_per_sec']:>10.0f} rounds/s {case['hands_per_sec']:>10.0f} hands/s")
+    for name, seconds in results["startup"].items():
+        print(f"startup/{name:<47} {seconds * 1000:>10.0f} ms")
+
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("quick") != results["quick"]:
+        print("Warning: baseline and this run use different --quick settings")
+    regressions = compare(results, baseline, args.threshold)
+    for name, before, after, change in regressions:
+        print(f"REGRESSION {name}: {before:.0f} -> {after:.0f} rounds/s ({change:+.0%})")
+    startup_regressions = compare_startup(results, baseline, args.threshold)
+    for name, before, after, change in startup_regressions:
+        print(f"REGRESSION startup/{name}: {before * 1000:.0f} -> {after * 1000:.0f} ms ({change:+.0%})")
+    return 1 if regressions or startup_regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,56 +1,131 @@
+import copy
 import random
-import pandas as pd
-import sys
+from counting import HI_LO
+from recorders import StatsRecorder
+
+
+# Bump whenever a change alters what a seeded game plays out or records (cached results key on it)
+ENGINE_VERSION = 4
+
+RANKS = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'Jack', 'Queen', 'King', 'Ace']
+SUITS = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
+
+# Cards are ints: suit * 13 + rank index, so card % 13 is always the rank index.
+# Rank-only codes (0-12) are valid cards too; they just display as the first suit.
+ACE = RANKS.index('Ace')
+EIGHT = RANKS.index('8')
+RANK_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11)
+HI_LO_TAGS = HI_LO.tags
+
+# Maps each card byte to its rank index, for bytes.translate
+_CARD_RANKS = bytes(card % 13 for card in range(256))
+
+
+def make_card(rank, suit=0):
+    """Encode a rank index (0-12) and suit index (0-3) as a card int."""
+    return suit * 13 + rank
+
+
+def card_rank(card):
+    return card % 13
+
+
+def card_value(card):
+    """Blackjack value of a card, counting an ace as 11."""
+    return RANK_VALUES[card % 13]
+
+
+def card_name(card):
+    """Display name of a card, e.g. "Hearts_Ace"."""
+    return f"{SUITS[card // 13]}_{RANKS[card % 13]}"
+
+
+def parse_card(name):
+    """Inverse of card_name."""
+    suit, rank = name.split("_")
+    return make_card(RANKS.index(rank), SUITS.index(suit))
 
 
 class Hand:
+    __slots__ = ("cards", "bet", "is_active", "doubled", "from_split", "hard_total", "aces", "is_pair", "net",
+                 "result", "paid_blackjack")
+
     def __init__(self):
         self.cards = []
+        self.reset()
+
+    def reset(self):
+        """Empty the hand in place, so the same object can play the next round"""
+        self.cards.clear()
         self.bet = 0
         self.is_active = True
         self.doubled = False
+        # Hands made by a split can't be split again: a pair dealt to one plays as its total
+        self.from_split = False
+        # What the hand won (+) or lost (-) and its result ("win", "lose", ...) once settled, and
+        # whether it was settled as a blackjack (the dealer not having one too)
+        self.net = 0
+        self.result = None
+        self.paid_blackjack = False
+
+        # Running totals kept up to date by add_card/pop_card
+        self.hard_total = 0  # aces counted as 1
+        self.aces = 0
+        self.is_pair = False
 
     def add_card(self, card):
-        self.cards.append(card)
+        cards = self.cards
+        rank = card % 13
+        cards.append(card)
+        if rank == ACE:
+            self.hard_total += 1
+            self.aces += 1
+        else:
+            self.hard_total += RANK_VALUES[rank]
+        self.is_pair = len(cards) == 2 and cards[0] % 13 == rank and not self.from_split
+
+    def pop_card(self):
+        """Remove and return the last card (used when splitting)."""
+        cards = self.cards
+        card = cards.pop()
+        rank = card % 13
+        if rank == ACE:
+            self.hard_total -= 1
+            self.aces -= 1
+        else:
+            self.hard_total -= RANK_VALUES[rank]
+        self.is_pair = len(cards) == 2 and cards[0] % 13 == cards[1] % 13 and not self.from_split
+        return card
 
     def can_split(self) -> bool:
-        return len(self.cards) == 2 and (self.cards[0].split("_")[1] == self.cards[1].split("_")[1])
+        return self.is_pair
 
     def can_double(self) -> bool:
         return len(self.cards) == 2
 
+    def is_soft(self) -> bool:
+        return self.aces > 0 and self.hard_total <= 11
+
     def is_blackjack(self) -> bool:
-        return self.get_score() == 21 and len(self.cards) == 2
+        return self.hard_total == 11 and self.aces == 1 and len(self.cards) == 2
 
     def is_busted(self) -> bool:
-        return self.get_score() > 21 
-    
+        return self.hard_total > 21
+
     def get_score(self):
-        score = 0
-        aces = 0
-        
-        for card in self.cards:
-            rank = card.split('_')[1]
-            if rank in ['Jack', 'Queen', 'King']:
-                score += 10
-            elif rank == 'Ace':
-                score += 11
-                aces += 1
-            else:
-                score += int(rank)
-        
-        # Adjust for aces if needed
-        while score > 21 and aces > 0:
-            score -= 10
-            aces -= 1
-            
-        return score
+        # At most one ace can count as 11 without busting
+        if self.aces and self.hard_total <= 11:
+            return self.hard_total + 10
+        return self.hard_total
+
+    def card_names(self):
+        return [card_name(card) for card in self.cards]
 
     def get_bet(self):
         return self.bet
 
     def __str__(self):
-        return f"Cards: {self.cards}, Score: {self.get_score()}, Bet: {self.bet}, Active?: {self.is_active}"
+        return f"Cards: {self.card_names()}, Score: {self.get_score()}, Bet: {self.bet}, Active?: {self.is_active}"
 
 class Player:
     def __init__(self,  name, strategy=None, balance=1000):
@@ -62,12 +137,29 @@ class Player:
         self.stats = {}
         self.strategy = strategy
         self.hands = [Hand()]
+        # Hands freed by reset_hands, reused by split instead of allocating new ones
+        self._spare_hands = []
+        # DecisionCache of the strategy's decisions, set by the Game when it memoizes them
+        # (the strategy itself is left alone, so copies and other games don't share it)
+        self.decision_cache = None
 
         self.win_streak = 0
         self.loss_streak = 0
         
     def reset_hands(self):
-        self.hands = [Hand()]
+        """Back to one empty hand; the Hand objects are reset in place and reused"""
+        hands = self.hands
+        if len(hands) > 1:
+            self._spare_hands.extend(hands[1:])
+            del hands[1:]
+        hands[0].reset()
+
+    def _new_hand(self):
+        if self._spare_hands:
+            hand = self._spare_hands.pop()
+            hand.reset()
+            return hand
+        return Hand()
 
     def can_split_hand(self, hand_index=0) -> bool:
         if hand_index >= len(self.hands):
@@ -90,9 +182,10 @@ class Player:
             return False
 
         # Create new hand with one of the cards
-        new_hand = Hand()
-        new_hand.add_card(hand.cards.pop())
+        new_hand = self._new_hand()
+        new_hand.add_card(hand.pop_card())
         new_hand.bet = hand.bet
+        hand.from_split = new_hand.from_split = True
         
         # Insert new hand after current hand
         self.hands.insert(hand_index + 1, new_hand)
@@ -137,49 +230,196 @@ class Player:
         """Check if the player has any active hands."""
         return any(hand.is_active for hand in self.hands)
 
+    def copy(self):
+        """A new player with this one's name, balance and streaks, and a copy of its strategy"""
+        player = Player(self.name, copy.copy(self.strategy), self.balance)
+        player.stats = dict(self.stats)
+        player.win_streak = self.win_streak
+        player.loss_streak = self.loss_streak
+        return player
+
     def __str__(self):
         return f"{self.name} - Balance: ${self.balance}"
 
+class Shoe:
+    """
+    The cards left to deal, as a preallocated bytearray of card ints and a read
+    cursor. Reshuffling shuffles the same buffer in place with the shoe's own
+    generator. The cut card sits after `penetration` of the shoe, and `burn`
+    cards are discarded unseen after every shuffle.
+    """
+    def __init__(self, number_of_decks, rng=None, penetration=0.60, burn=0):
+        self.number_of_decks = number_of_decks
+        self.size = number_of_decks * 52
+        self.cards = bytearray(range(52)) * number_of_decks
+        self.rng = rng if rng is not None else random.Random()
+        self.penetration = penetration
+        self.burn = burn
+        self.cursor = 0
+        self.shuffle()
+
+    def shuffle(self):
+        self.rng.shuffle(self.cards)
+        self.cursor = self.burn
+
+    def deal(self):
+        card = self.cards[self.cursor]
+        self.cursor += 1
+        return card
+
+    def remaining(self):
+        return self.size - self.cursor
+
+    def needs_shuffle(self):
+        """True once the cut card has come out."""
+        return self.cursor > self.size * self.penetration
+
+    def remaining_cards(self):
+        """Read-only view of the undealt cards, in dealing order."""
+        return memoryview(self.cards)[self.cursor:].toreadonly()
+
+    def rank_counts(self):
+        """Number of undealt cards of each rank index."""
+        ranks = bytes(self.cards[self.cursor:]).translate(_CARD_RANKS)
+        return [ranks.count(rank) for rank in range(13)]
+
+    def snapshot(self):
+        """The shoe's order and position (its generator is saved by the Game that owns it)."""
+        return {"cards": bytes(self.cards), "cursor": self.cursor}
+
+    def restore(self, state):
+        self.cards[:] = state["cards"]
+        self.cursor = state["cursor"]
+
+
+class DecisionCache:
+    """
+    Memoized play_turn of a strategy whose class declares PURE_DECISIONS =
+    True in its own body (see strategies.BaseStrategy): its decisions depend
+    only on the hand's hard total, whether it's soft, the
+    value of the pair (if it is one), whether it still holds just its first
+    two cards, the value of the dealer's upcard and, unless its
+    DECISION_COUNT_STEP is None, the true count floored to a multiple of that
+    step. At most maxsize decisions are kept; states seen after that are
+    decided without being cached.
+    """
+    MAXSIZE = 1 << 16
+
+    def __init__(self, play_turn, count_step=None, maxsize=MAXSIZE):
+        self._play_turn = play_turn
+        self.count_step = count_step
+        self.maxsize = maxsize
+        self.decisions = {}
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, hand, dealer_card, true_count=0):
+        """
+        Int key of a decision's state: upcard value, then hard total and aces,
+        pair and first-two-cards flags (aces rather than softness: a finer
+        split than the declared state, but cheaper to build), then the count
+        step from bit 15 up.
+        """
+        key = RANK_VALUES[dealer_card % 13] << 11 | (hand.hard_total * 22 + hand.aces) << 2 | hand.is_pair << 1 | (len(hand.cards) == 2)
+        if self.count_step is not None:
+            key += int(true_count // self.count_step) << 15
+        return key
+
+    def decide(self, key, hand, dealer_card, true_count):
+        """Decide a state that isn't cached (a miss) and cache it if there's room."""
+        self.misses += 1
+        choice = self._play_turn(hand=hand, dealer_card=dealer_card, true_count=true_count)
+        if len(self.decisions) < self.maxsize:
+            self.decisions[key] = choice
+        return choice
+
+    def play_turn(self, hand, dealer_card, true_count=0):
+        key = self.key(hand, dealer_card, true_count)
+        choice = self.decisions.get(key)
+        if choice is None:
+            return self.decide(key, hand, dealer_card, true_count)
+        self.hits += 1
+        return choice
+
+    def info(self):
+        calls = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.decisions), "maxsize": self.maxsize,
+                "hit_rate": self.hits / calls if calls else 0.0}
+
+
 class Game:
-    def __init__(self, number_of_decks, players: list):
-        self.deck = self.generate_deck(number_of_decks)
+    def __init__(self, number_of_decks, players: list, seed=None, recorder=None, count_systems=None,
+                 penetration=0.60, burn_cards=0, instruments=None, shoe=None, analytic_dealer=False,
+                 cache_decisions=True):
+        # Each game shuffles from its own generator so seeded runs reproduce exactly
+        self.rng = random.Random(seed)
+        # A prebuilt shoe (e.g. shoebank.BankedShoe) replaces the game's own
+        if shoe is None:
+            shoe = Shoe(number_of_decks, self.rng, penetration, burn_cards)
+        elif shoe.number_of_decks != number_of_decks:
+            raise ValueError(f"The shoe holds {shoe.number_of_decks} decks, not {number_of_decks}")
+        self.shoe = shoe
         self.players = players
-        self.dealer_card = ""
+        # Strategies that need to see the game (e.g. the shoe composition) get attached to it,
+        # and players whose strategy class declares its decisions pure get them memoized (see
+        # DecisionCache); a subclass may play differently, so it has to declare that itself
+        for player in players:
+            strategy = player.strategy
+            attach = getattr(strategy, "attach", None)
+            if attach is not None:
+                attach(self)
+            player.decision_cache = None
+            if cache_decisions and vars(type(strategy)).get("PURE_DECISIONS", False):
+                player.decision_cache = DecisionCache(strategy.play_turn, strategy.DECISION_COUNT_STEP)
+        self.dealer_card = None
         self.dealer = Player(name="Dealer_NPC", balance=1000000)
-        self.running_count = 0
         self.total_cards = number_of_decks * 52
         self.cards_dealt = 0
+
+        # The first count system drives running_count and the true count strategies see;
+        # the others are read off the per-rank histogram of cards dealt (see counting.py)
+        self.count_systems = tuple(count_systems) if count_systems else (HI_LO,)
+        self.count_system = self.count_systems[0]
+        self._count_tags = self.count_system.tags
+        self.seen = [0] * 13
+        self.running_count = self.count_system.initial_count(number_of_decks)
+        self._true_count = None
+        # True count the bets of the current round were placed at
+        self.bet_true_count = 0
+        # Number of the round after the last one played (what a checkpoint resumes from)
+        self.next_round = 0
         
+        # analytic_dealer (True or a dealer.DealerTable) settles hands at their expected
+        # value from precomputed dealer outcome tables instead of playing the dealer out
+        self.dealer_table = None
+        if analytic_dealer is True:
+            from dealer import dealer_table
+            self.dealer_table = dealer_table(number_of_decks)
+        elif analytic_dealer:
+            self.dealer_table = analytic_dealer
 
-        self.stats = []
+        # Receives one row per hand; see recorders.py
+        self.recorder = recorder if recorder is not None else StatsRecorder()
+
+        # Optional timers/counters/progress hooks; see instruments.py
+        self.instruments = None
+        if instruments is not None:
+            instruments.attach(self)
 
-        self.percent_needed_reshuffle = .40
-    
-    def generate_deck(self, number_of_decks):
-        """Create a shuffled deck with the specified number of decks."""
-        ranks = ['2', '3', '4', '5', '6', '7', '8', '9', '10', 'Jack', 'Queen', 'King', 'Ace']
-        suits = ['Hearts', 'Diamonds', 'Clubs', 'Spades']
-        deck = []
-        for _ in range(number_of_decks):
-            for suit in suits:
-                for rank in ranks:
-                    deck.append(f"{suit}_{rank}")
-        random.shuffle(deck)
-        return deck
 
     def deal_cards(self):
         """Deal initial cards to all players and dealer"""
    
         # Deal dealer's up card
-        up_card = self.deck.pop()
+        up_card = self.shoe.deal()
         self.dealer_card = up_card
         self.update_count(up_card)
         self.dealer.hands[0].add_card(up_card)
         
         # Deal two cards to each player
         for player in self.players:
-            card1 = self.deck.pop()
-            card2 = self.deck.pop()
+            card1 = self.shoe.deal()
+            card2 = self.shoe.deal()
 
             self.update_count(card1)
             self.update_count(card2)
@@ -187,244 +427,410 @@ class Game:
             player.hands[0].add_card(card1)
             player.hands[0].add_card(card2)
         
-        # Deal dealer's hole card
-        hole_card = self.deck.pop()
+        # Deal dealer's hole card (never needed when the dealer is settled analytically)
+        if self.dealer_table is not None:
+            return
+        hole_card = self.shoe.deal()
         self.update_count(hole_card)
         self.dealer.hands[0].add_card(hole_card)
     
     def place_bets(self):
+        # No cards come out while bets go down, so every player bets off the same count
+        true_count = self.bet_true_count = self.get_true_count()
         for player in self.players:
             player.place_bet(
                 bet=player.strategy.place_bet(
                     player=player, 
-                    true_count=self.get_true_count()
+                    true_count=true_count
                 ),
                 hand_index=0
             )
     
     def update_count(self, card):
-        rank = card.split('_')[1]
-        if rank in ['2', '3', '4', '5', '6']:
-            self.running_count += 1
-        elif rank in ['10', 'Jack', 'Queen', 'King', 'Ace']:
-            self.running_count -= 1
+        rank = card % 13
+        self.running_count += self._count_tags[rank]
+        self.seen[rank] += 1
         self.cards_dealt += 1
+        self._true_count = None
 
     def get_true_count(self):
-        """Calculate true count based on running count and remaining decks"""
-        remaining_decks = (self.total_cards - self.cards_dealt) / 52
-        if remaining_decks <= 0:
-            return 0
-        return self.running_count / remaining_decks
+        """Calculate true count based on running count and remaining decks (cached until the next card)"""
+        true_count = self._true_count
+        if true_count is None:
+            remaining_decks = self.shoe.remaining() / 52
+            true_count = self._true_count = self.count_system.true_count(self.running_count, remaining_decks)
+        return true_count
+
+    def running_counts(self):
+        """Running count of every count system, by name."""
+        decks = self.total_cards // 52
+        return {system.name: system.running_count(self.seen, decks) for system in self.count_systems}
+
+    def true_counts(self):
+        """True count of every count system, by name."""
+        remaining_decks = self.shoe.remaining() / 52
+        running_counts = self.running_counts()
+        return {
+            system.name: system.true_count(running_counts[system.name], remaining_decks)
+            for system in self.count_systems
+        }
 
     def true_count(self):  
         return self.get_true_count()
 
-    def determine_winners(self):
-        """Determine winners and pay out"""
-        dealer_score = self.dealer.hands[0].get_score()
-        dealer_busted = self.dealer.hands[0].is_busted()
-        dealer_blackjack = self.dealer.hands[0].is_blackjack()
-            
-        results = {}
-            
+    def unseen_composition(self):
+        """
+        Counts of card values 2-10 and ace a player hasn't seen this shoe: the
+        undealt cards, any burned ones and the dealer's hole card.
+        """
+        decks = self.total_cards // 52
+        counts = [0] * 10
+        for rank, seen in enumerate(self.seen):
+            counts[RANK_VALUES[rank] - 2] += 4 * decks - seen
+        # The hole card is counted as dealt (see deal_cards), but it's face down
+        dealer_cards = self.dealer.hands[0].cards
+        if len(dealer_cards) > 1:
+            counts[RANK_VALUES[dealer_cards[1] % 13] - 2] += 1
+        return tuple(counts)
+
+    def settle(self):
+        """Pay out every hand against the dealer's, setting hand.result and hand.net; returns the dealer's score"""
+        dealer_hand = self.dealer.hands[0]
+        dealer_score = dealer_hand.get_score()
+        dealer_busted = dealer_score > 21
+        dealer_blackjack = dealer_hand.is_blackjack()
+
         for player in self.players:
-            player_results = []
-                
-            for i, hand in enumerate(player.hands):
-                
+            for hand in player.hands:
+                bet = hand.bet
                 hand_score = hand.get_score()
-                hand_busted = hand.is_busted()
-                hand_blackjack = hand.is_blackjack()
-                
-                
-                if hand_busted:
-                    result = "lose"
+
+                if hand_score > 21:
+                    hand.result = "lose"
+                    hand.net = -bet
                     player.loss_streak += 1
                     player.win_streak = 0
-                   
-                elif dealer_busted and not hand_busted:
-                    result = "win"
-                    player.add_balance(hand.bet * 2)
+                elif hand.is_blackjack() and not dealer_blackjack:
+                    # Blackjack pays 3:2 whatever the dealer ends up with
+                    hand.result = "win"
+                    hand.paid_blackjack = True
+                    hand.net = bet * 1.5
                     player.loss_streak = 0
                     player.win_streak += 1
-                elif hand_blackjack and not dealer_blackjack:
-                    result = "win"
+                    player.add_balance(bet * 2.5)
+                elif dealer_busted or hand_score > dealer_score:
+                    hand.result = "win"
+                    hand.net = bet
                     player.loss_streak = 0
                     player.win_streak += 1
-                    player.add_balance(int(hand.bet * 2.5))
-                elif hand_score > dealer_score:
-                    result = "win"
-                    player.loss_streak = 0
-                    player.win_streak += 1
-                    player.add_balance(hand.bet * 2)
+                    player.add_balance(bet * 2)
                 elif hand_score == dealer_score:
-                    result = "push"  # Changed from "tie" to standard "push"
-                    player.add_balance(hand.bet)
+                    hand.result = "push"
+                    hand.net = 0
+                    player.add_balance(bet)
                 else:
-                    result = "lose"
+                    hand.result = "lose"
+                    hand.net = -bet
                     player.loss_streak += 1
                     player.win_streak = 0
-                    player.add_balance(0)
-                
-
-                player_results.append({
-                    'hand': i,
-                    'score': hand_score,
-                    'bet': hand.bet,
-                    'result': result,
-                })                
-                
-            results[player.name] = player_results
-            
-        return results, dealer_score
+
+        return dealer_score
+
+    def settle_expected(self):
+        """
+        Analytic dealer mode: pay every hand its expected value against the
+        dealer's upcard (at the current true count, if the table is by count).
+        Busted hands still lose; every other hand's result is "expected".
+        Returns the dealer's (upcard-only) score.
+        """
+        table = self.dealer_table
+        upcard = RANK_VALUES[self.dealer_card % 13]
+        true_count = self.get_true_count()
+
+        for player in self.players:
+            for hand in player.hands:
+                if hand.is_busted():
+                    hand.result = "lose"
+                    hand.net = -hand.bet
+                    player.loss_streak += 1
+                    player.win_streak = 0
+                else:
+                    hand.result = "expected"
+                    if hand.is_blackjack():
+                        hand.paid_blackjack = True
+                        hand.net = hand.bet * table.blackjack_ev(upcard, true_count)
+                    else:
+                        hand.net = hand.bet * table.stand_ev(hand.get_score(), upcard, true_count)
+                    player.add_balance(hand.bet + hand.net)
+
+        return self.dealer.hands[0].get_score()
+
+    def round_results(self):
+        """Settled hands of the round, by player name: [{'hand', 'score', 'bet', 'result'}, ...]"""
+        return {
+            player.name: [
+                {'hand': i, 'score': hand.get_score(), 'bet': hand.bet, 'result': hand.result}
+                for i, hand in enumerate(player.hands)
+            ]
+            for player in self.players
+        }
+
+    def determine_winners(self):
+        """Determine winners and pay out"""
+        dealer_score = self.settle()
+        return self.round_results(), dealer_score
 
     def needs_new_deck(self, percent):
-        """Check if we need to reshuffle (less than 25% of cards remaining)"""
-        return len(self.deck) < self.total_cards * percent
+        """Check if less than `percent` of the shoe is left to deal"""
+        return self.shoe.remaining() < self.total_cards * percent
 
     def reshuffle(self):
         """Reshuffle the deck and reset count"""
-        self.deck = self.generate_deck(self.total_cards // 52)
-        print("reshuffling!", file=sys.stdout)
-        self.running_count = 0
+        self.shoe.shuffle()
+        self.running_count = self.count_system.initial_count(self.total_cards // 52)
+        self.seen = [0] * 13
         self.cards_dealt = 0
+        self._true_count = None
 
     def play_round(self, round_num):
         """Play a complete round of blackjack"""
-        if self.needs_new_deck(self.percent_needed_reshuffle):
-            self.reshuffle()
-
-        # print("cards in deck: ", len(self.deck), file=sys.stdout)
-
-        #clear any exisiting hands
-        for player in self.players:
-            # print(f"{player.balance}")
-            player.reset_hands()
-        self.dealer.reset_hands()
-
-        # Place bets first
-        self.place_bets()
-        
-        # Deal cards
-        self.deal_cards()
-
-       
-        # Players play their hands
+        self.play_rounds(1, round_num)
+
+    def play_rounds(self, n, start_round=0):
+        """
+        Play n rounds numbered from start_round, with the per-round lookups
+        done once. Returns the next round number, so runs can be continued.
+        This is the only place a round is played: play_round goes through it,
+        and attached instruments.Instruments time the phase methods by
+        wrapping them on the game and hear about every round after it's
+        played (that's also how to get progress reports).
+        """
+        end_round = start_round + n
+        shoe = self.shoe
+        needs_shuffle = shoe.needs_shuffle
+        players = self.players
+        dealer = self.dealer
+        instruments = self.instruments
+        place_bets = self.place_bets
+        deal_cards = self.deal_cards
+        play_hands = self.play_hands
+        play_dealer = self.play_dealer if self.dealer_table is None else None
+        settle = self.settle if self.dealer_table is None else self.settle_expected
+        record_round = self.record_round
+
+        for round_num in range(start_round, end_round):
+            self.next_round = round_num + 1
+            reshuffled = needs_shuffle()
+            if reshuffled:
+                self.reshuffle()
+            cursor = shoe.cursor
+            for player in players:
+                player.reset_hands()
+            dealer.reset_hands()
+
+            place_bets()
+            deal_cards()
+            play_hands()
+            if play_dealer is not None:
+                play_dealer()
+            record_round(round_num, settle())
+
+            if instruments is not None:
+                instruments.round_played(self, reshuffled, shoe.cursor - cursor)
+        return end_round
+
+    def play_hands(self):
+        """Let every player play out each of their hands"""
+        shoe = self.shoe
+        update_count = self.update_count
+        get_true_count = self.get_true_count
+        dealer_card = self.dealer_card
+        # Memoized decisions are looked up here (DecisionCache.key inlined) rather than through
+        # the cache's play_turn, except when instruments are counting decisions
+        instruments = self.instruments
+        dealer_key = RANK_VALUES[dealer_card % 13] << 11
         for player in self.players:
+            if instruments is None:
+                play_turn = player.strategy.play_turn
+                cache = player.decision_cache
+            else:
+                play_turn = instruments.play_turn(player)
+                cache = None
+            decisions = None
+            if cache is not None:
+                decisions = cache.decisions
+                count_step = cache.count_step
+            hands = player.hands
             hand_index = 0
-            while hand_index < len(player.hands):
-                hand = player.hands[hand_index]
+            while hand_index < len(hands):
+                hand = hands[hand_index]
                
                 while hand.is_active and not hand.is_busted():
-                    # print(len(self.deck))
-                    choice = player.strategy.play_turn(
-                        hand=hand,
-                        dealer_card=self.dealer_card,
-                        true_count=self.get_true_count()
-                        )
+                    if decisions is not None:
+                        key = dealer_key | (hand.hard_total * 22 + hand.aces) << 2 | hand.is_pair << 1 | (len(hand.cards) == 2)
+                        if count_step is not None:
+                            key += int(get_true_count() // count_step) << 15
+                        choice = decisions.get(key)
+                        if choice is None:
+                            choice = cache.decide(key, hand, dealer_card, get_true_count())
+                        else:
+                            cache.hits += 1
+                    else:
+                        choice = play_turn(
+                            hand=hand,
+                            dealer_card=dealer_card,
+                            true_count=get_true_count()
+                            )
                     
+                    if choice == "double" and (len(hand.cards) != 2 or hand.bet > player.balance):
+                        # Only a two-card hand the balance covers can double; any other double is a hit
+                        choice = "hit"
                     if choice == "double":
-                        # print("DOUBLING cards in deck: ", len(self.deck), file=sys.stdout)
-                        card = self.deck.pop()
+                        card = shoe.deal()
                         player.balance -= hand.bet
                         hand.bet *= 2
                         hand.is_active = False
+                        hand.doubled = True
                         hand.add_card(card)
-                        self.update_count(card)
+                        update_count(card)
                         break
                     elif choice == "split":
                         if player.split(hand_index):
-                            # print("splitting--------------------------------", file=sys.stdout)
                             # Give one card to each split hand
-                            card1 = self.deck.pop()
+                            card1 = shoe.deal()
                             player.hit(card1, hand_index)
-                            self.update_count(card1)
+                            update_count(card1)
                             
-                            card2 = self.deck.pop()
+                            card2 = shoe.deal()
                             player.hit(card2, hand_index + 1)
-                            self.update_count(card2)
-                        # else:
-                        #     # Can't split, treat as hit
-                        #     print("HITTING cards in deck: ", len(self.deck), file=sys.stdout)
-                        #     card = self.deck.pop()
-                        #     player.hit(card, hand_index)
-                        #     self.update_count(card)
+                            update_count(card2)
+                        else:
+                            # A split that can't be made (not a pair, or the balance won't cover it) is
+                            # played as a hit, as in batch.BatchGame; asking again would never end
+                            card = shoe.deal()
+                            player.hit(card, hand_index)
+                            update_count(card)
                     elif choice == "hit":
-                        # print("HITTING cards in deck: ", len(self.deck), file=sys.stdout)
-                        card = self.deck.pop()
+                        card = shoe.deal()
                         player.hit(card, hand_index)
-                        self.update_count(card)
+                        update_count(card)
                     else:  # stand
                         player.stand(hand_index)
                         
                     
                 hand_index += 1
 
-        # Dealer plays
+    def play_dealer(self):
+        """Dealer draws to 17 (stands on soft 17)"""
         dealer_hand = self.dealer.hands[0]
         while dealer_hand.get_score() < 17:
-            card = self.deck.pop()
+            card = self.shoe.deal()
             self.update_count(card)
             self.dealer.hit(card, 0)
-                
-        # Determine winners and pay out
-        results, dealer_score = self.determine_winners()
-        
+
+    def record_round(self, round_num, dealer_score):
+        """Send one row per settled hand to the recorder"""
+        record = self.recorder.record
         for player in self.players:
-            for i, hand in enumerate(player.hands):
-                # print((results[player.name][i]["result"]))
-                # print(f"{player.name} - Balance: ${player.balance}")
-                self.stats.append(
-                    {"round": round_num,
-                    "name": player.name,
-                    "balance": player.balance,
-                    "hand": hand.cards,
-                    "score": hand.get_score(),
-                    "betAmount": hand.bet,
-
-                    "win": 1 if results[player.name][i]["result"]=="win" else 0,
-                    "loss": 1 if results[player.name][i]["result"]=="lose" else 0,
-                    "tie": 1 if results[player.name][i]["result"]=="push" else 0,
-                    "double":1 if hand.doubled else 0,
-                    "blackjack":1 if ((hand.get_score() == 21 and len(hand.cards)==2) and (dealer_score!=21)) else 0,
-                    "bust":1 if (hand.get_score() > 21) else 0,
-
-                    "dealer_bust": 1 if dealer_score >21 else 0,
-                    "dealer_score":dealer_score,
-                    "dealer_hand": dealer_hand.cards,
-
-                    "decks": self.total_cards/52,
-                    "running_count":self.running_count,
-                    "true_count": round(self.get_true_count(),3)
-                    }
-                )
+            for hand in player.hands:
+                record(self, round_num, player, hand, hand.result, dealer_score)
 
     def get_stats(self):
-        return self.stats
+        return self.recorder.get_stats()
+
+    def decision_stats(self):
+        """Hit/miss statistics of each player's DecisionCache, by player name."""
+        return {player.name: player.decision_cache.info() for player in self.players
+                if player.decision_cache is not None}
+
+    def snapshot(self, recorder=True):
+        """
+        Everything needed to carry on from between two rounds, as plain
+        picklable values: the generator state, the shoe, the counts, every
+        player's balance and streaks, the next round number and (if the
+        recorder supports it and recorder=True) the recorder's position.
+        Strategies aren't included; they're expected to keep no state of
+        their own between rounds.
+        """
+        recorder_snapshot = getattr(self.recorder, "snapshot", None)
+        return {
+            "engine": ENGINE_VERSION,
+            "decks": self.total_cards // 52,
+            "round": self.next_round,
+            "rng": self.rng.getstate(),
+            "shoe": self.shoe.snapshot(),
+            "running_count": self.running_count,
+            "seen": list(self.seen),
+            "cards_dealt": self.cards_dealt,
+            "bet_true_count": self.bet_true_count,
+            "players": [
+                {"name": player.name, "balance": player.balance,
+                 "win_streak": player.win_streak, "loss_streak": player.loss_streak}
+                for player in self.players
+            ],
+            "recorder": recorder_snapshot() if recorder and recorder_snapshot is not None else None,
+        }
+
+    def restore(self, snapshot):
+        """Put the game back in a snapshot's state; the game must have the same decks and players (by name, in order)."""
+        if snapshot["engine"] != ENGINE_VERSION:
+            raise ValueError(f"Snapshot is from engine version {snapshot['engine']}, this is {ENGINE_VERSION}")
+        if snapshot["decks"] != self.total_cards // 52:
+            raise ValueError(f"Snapshot is of a {snapshot['decks']}-deck game, not {self.total_cards // 52}")
+        names = [state["name"] for state in snapshot["players"]]
+        if names != [player.name for player in self.players]:
+            raise ValueError(f"Snapshot players {names} don't match this game's")
+
+        self.rng.setstate(snapshot["rng"])
+        self.shoe.restore(snapshot["shoe"])
+        self.running_count = snapshot["running_count"]
+        self.seen = list(snapshot["seen"])
+        self.cards_dealt = snapshot["cards_dealt"]
+        self.bet_true_count = snapshot["bet_true_count"]
+        self._true_count = None
+        self.next_round = snapshot["round"]
+        for player, state in zip(self.players, snapshot["players"]):
+            player.balance = state["balance"]
+            player.win_streak = state["win_streak"]
+            player.loss_streak = state["loss_streak"]
+            player.reset_hands()
+        self.dealer.reset_hands()
+        if snapshot["recorder"] is not None:
+            self.recorder.restore(snapshot["recorder"])
+
+    def fork(self, recorder=None, seed=None, shuffle_unseen=False):
+        """
+        An independent copy of the game as it stands between rounds, with
+        copies of the players (and their strategies) and a new recorder
+        (default: a fresh StatsRecorder). The fork deals the same cards the
+        game would, unless it's given its own seed (which only changes later
+        shuffles) or shuffle_unseen=True, which also shuffles the cards left
+        in the shoe, keeping the count the same.
+        """
+        shoe = copy.copy(self.shoe)
+        shoe.cards = bytearray(self.shoe.cards)
+        fork = Game(self.total_cards // 52, [player.copy() for player in self.players], seed=seed,
+                    recorder=recorder, count_systems=self.count_systems, shoe=shoe,
+                    analytic_dealer=self.dealer_table if self.dealer_table is not None else False)
+        if seed is None:
+            fork.rng.setstate(self.rng.getstate())
+        if self.shoe.rng is self.rng:
+            shoe.rng = fork.rng
+        fork.running_count = self.running_count
+        fork.seen = list(self.seen)
+        fork.cards_dealt = self.cards_dealt
+        fork.bet_true_count = self.bet_true_count
+        fork.next_round = self.next_round
+        if shuffle_unseen:
+            unseen = shoe.cards[shoe.cursor:]
+            fork.rng.shuffle(unseen)
+            shoe.cards[shoe.cursor:] = unseen
+        return fork
 
 
 
 if __name__ == "__main__":
-    # Import your strategies here
-    from strategies import BasicStrategyCharts  
-    
-    # Create players with your strategies
-    players = [
-        Player(strategy=BasicStrategyCharts(), name="Alice", balance=1000),
-        Player(strategy=BasicStrategyCharts(), name="Bob", balance=1000),
-    ]
-    
-    # Create game with 6 decks
-    game = Game(6, players)
-    results = []
-    # Play 5 rounds
-    for round_num in range(1, 100):
-        print(f"\n--- Round {round_num} ---")
-        game.play_round(round_num)
-        # print(game.get_stats())
-        
-    result = game.get_stats()
-   
-    df = pd.DataFrame(data=result)
-    print(df)
\ No newline at end of file
+    # python -m blackjack: run a simulation from the command line (see cli.py)
+    import sys
+    from cli import main
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Basic Strategy Charts
+---------------------
+Generates the EV-optimal basic strategy chart for any number of decks by
+exhaustive calculation with ev.py, instead of transcribing one from a
+website.
+
+A chart is total-dependent, like the printed ones: for every hard total,
+soft total and pair against every dealer upcard, each action's exact EV is
+averaged over the two-card hands that make the total, weighted by how likely
+each is from a full shoe, and the best action goes in the cell. Rules are
+the ones blackjack.Game plays (see ev.py): the dealer stands on soft 17 and
+doesn't peek, doubling is allowed on any two cards (after splits too) and on
+no others, and there are no resplits. A DOUBLE cell on a hand of more than
+two cards plays as a hit.
+
+Charts are cached as chart CSVs (see tables.py) under cache_dir, per deck
+count and ENGINE_VERSION, and load as a TableStrategy:
+
+    strategy = basic_strategy(8)                   # TableStrategy for 8 decks
+    players = [Player("A", GeneratedBasicStrategy())]  # picks the game's deck count itself
+"""
+import os
+
+import ev
+from blackjack import ENGINE_VERSION
+from strategies import TableStrategy, BasicStrategyCharts
+from tables import ActionTable, HARD, SOFT, PAIR, STAND, HIT, DOUBLE, SPLIT, N_TOTALS, UPCARDS, write_chart
+
+DEFAULT_CACHE_DIR = "tables_cache"
+
+
+def _two_card_hands(category, total):
+    """(first value, second value) pairs of card values 2-11 that make a chart row."""
+    if category == PAIR:
+        return [(total, total)] if 2 <= total <= 11 else []
+    hands = []
+    for first in ev.VALUES:
+        for second in ev.VALUES:
+            if second < first:
+                continue
+            aces = (first == 11) + (second == 11)
+            if category == SOFT:
+                # A+10 is a blackjack, settled before anything is played, not a soft 21
+                if aces and first + second - 10 * (aces - 1) == total and {first, second} != {10, 11}:
+                    hands.append((first, second))
+            elif not aces and first + second == total and first != second:
+                hands.append((first, second))
+    # Hard 4 and 20 and soft 12 only come as pairs; chart them as unsplit pairs
+    if not hands and category == HARD and total in (4, 20):
+        hands = [(total // 2, total // 2)]
+    if not hands and category == SOFT and total == 12:
+        hands = [(11, 11)]
+    return hands
+
+
+def _hand_weight(comp, first, second):
+    n = sum(comp)
+    if first == second:
+        return comp[first - 2] * (comp[first - 2] - 1) / (n * (n - 1))
+    return 2 * comp[first - 2] * comp[second - 2] / (n * (n - 1))
+
+
+def best_action(category, total, upcard, number_of_decks):
+    """Chart action (tables.STAND/HIT/DOUBLE/SPLIT) for one cell, or None if no two-card hand makes it."""
+    base = ev.remove(ev.full_shoe(number_of_decks), upcard)
+    evs = {STAND: 0.0, HIT: 0.0, DOUBLE: 0.0}
+    if category == PAIR:
+        evs[SPLIT] = 0.0
+    total_weight = 0.0
+    for first, second in _two_card_hands(category, total):
+        weight = _hand_weight(base, first, second)
+        if not weight:
+            continue
+        comp = ev.remove(ev.remove(base, first), second)
+        hard = (first if first != 11 else 1) + (second if second != 11 else 1)
+        soft = first == 11 or second == 11
+        score = ev._score(hard, soft)
+        evs[STAND] += weight * ev.stand_ev(score, upcard, comp)
+        evs[HIT] += weight * ev.hit_ev(hard, soft, upcard, comp)
+        evs[DOUBLE] += weight * ev.double_ev(hard, soft, upcard, comp)
+        if category == PAIR:
+            evs[SPLIT] += weight * ev.split_ev(first, upcard, comp)
+        total_weight += weight
+    if not total_weight:
+        return None
+    return max(evs, key=evs.get)
+
+
+def generate_chart(number_of_decks):
+    """Uncounted ActionTable of the EV-optimal basic strategy for a number of decks."""
+    table = ActionTable(bytearray(3 * N_TOTALS * len(UPCARDS)), counted=False)
+    for category in (HARD, SOFT, PAIR):
+        for total in range(N_TOTALS):
+            for upcard in UPCARDS:
+                action = best_action(category, total, upcard, number_of_decks)
+                if action is None:
+                    # Cells no two-card hand reaches (e.g. hard 21): hit below 17, stand otherwise
+                    action = HIT if category != PAIR and total < 17 else STAND
+                table.actions[table.index(0, category, total, upcard)] = action
+    return table
+
+
+def chart_path(cache_dir, number_of_decks):
+    return os.path.join(cache_dir, f"basic_{number_of_decks}d_v{ENGINE_VERSION}.csv")
+
+
+def basic_strategy(number_of_decks, cache_dir=DEFAULT_CACHE_DIR, **kwargs):
+    """
+    TableStrategy playing the generated chart for the deck count, generating
+    and caching it first if needed. kwargs go to TableStrategy.from_chart
+    (base_bet_fraction, bet_ramp).
+    """
+    path = chart_path(cache_dir, number_of_decks)
+    if not os.path.exists(path):
+        table = generate_chart(number_of_decks)
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        write_chart(table, tmp_path)
+        os.replace(tmp_path, path)
+    return TableStrategy.from_chart(path, counted=False, **kwargs)
+
+
+class GeneratedBasicStrategy(TableStrategy):
+    """
+    Generated Basic Strategy
+    ------------------------
+    Plays the generated chart for the deck count of the game it's attached to,
+    so one strategy class is right for every cell of a sweep. Bets like
+    BasicStrategyCharts.
+    """
+    BET_RAMP = BasicStrategyCharts.BET_RAMP
+    cache_dir = DEFAULT_CACHE_DIR
+
+    def __init__(self, number_of_decks=None):
+        self.table = None
+        self.number_of_decks = number_of_decks
+        if number_of_decks is not None:
+            self.table = basic_strategy(number_of_decks, self.cache_dir).table
+
+    def attach(self, game):
+        # A copy (e.g. in a forked game) already has the chart for its deck count
+        if self.table is None or self.number_of_decks != game.shoe.number_of_decks:
+            self.number_of_decks = game.shoe.number_of_decks
+            self.table = basic_strategy(self.number_of_decks, self.cache_dir).table
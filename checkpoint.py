@@ -0,0 +1,50 @@
+"""
+Checkpoints
+-----------
+Saving a game between rounds and carrying on from there, so a long run can
+be interrupted and resumed, and a game can be forked at a point of interest
+to try variations from the same state.
+
+A checkpoint is a pickled Game.snapshot(): the generator state, the shoe,
+the counts, the players' balances and streaks, the next round number and
+the recorder's position (for recorders with snapshot/restore). Restoring it
+into a game with the same decks and players continues exactly as the
+original would have; the strategies and table rules come from the game
+it's restored into.
+
+    recorder = StoreRecorder("long.bjr", resume=True)
+    game = Game(6, players, seed=42, recorder=recorder)
+    play_checkpointed(game, 1_000_000, "long.ckpt", every=10_000)   # rerun to resume
+
+    branch = game.fork(shuffle_unseen=True)   # same table, cards left in the shoe reshuffled
+    branch.play_rounds(100, branch.next_round)
+"""
+import os
+import pickle
+
+
+def save_checkpoint(game, path):
+    """Pickle the game's snapshot to path (replacing it atomically, so a crash leaves the old one)."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(game.snapshot(), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def play_checkpointed(game, rounds, path, every=1000):
+    """
+    Play the game to `rounds` rounds, saving a checkpoint at path every
+    `every` rounds. If path already holds a checkpoint, the game is restored
+    from it first and only the remaining rounds are played. Returns the game.
+    """
+    if os.path.exists(path):
+        game.restore(load_checkpoint(path))
+    while game.next_round < rounds:
+        game.play_rounds(min(every, rounds - game.next_round), game.next_round)
+        save_checkpoint(game, path)
+    return game
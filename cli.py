@@ -0,0 +1,190 @@
+"""
+Command Line
+------------
+python -m blackjack runs a simulation session from flags or a JSON config,
+without a notebook:
+
+    python -m blackjack --strategy HiLoStrategy --seats 6 --decks 6 --rounds 500 --games 100 \\
+        --seed 42 --format csv --output HiLo_100G500R6D6P.csv
+    python -m blackjack --config session.json --workers 4
+
+A config file holds the same settings under the long option names (dashes
+as underscores), for example
+
+    {"strategy": ["HiLo_bettingOnly", "HiLo_decisionOnly"], "seats": 6, "decks": 6,
+     "rounds": 500, "games": 100, "seed": 42, "format": "store", "output": "mixed.bjr"}
+
+and options given on the command line override it. Strategies are
+strategies.py class names or "module.Class"; the seats take them in turn.
+
+Formats:
+- summary (default): per-strategy totals (recorders.AggregateRecorder),
+  printed as a table or written as CSV to --output
+- json: the same rows as JSON
+- csv: one row per hand (Game.stats columns plus game_num), like the notebooks
+- store: a resultstore result set at --output
+
+With --listen the games are handed out to distributed.py workers (on this or
+other machines) instead; the results are the same. Listening on an address
+other machines can reach needs --authkey; a loopback address or socket path
+gets a random one, printed to stderr for the workers.
+
+Nothing here or in the engine imports pandas or NumPy (the store format only
+needs them to read), so startup and process-pool workers stay cheap;
+--timing prints the CPU time spent starting up and the simulation time to
+stderr.
+"""
+import argparse
+import json
+import sys
+import time
+from contextlib import nullcontext
+
+FORMATS = ("summary", "json", "csv", "store")
+
+DEFAULTS = {
+    "strategy": ["BasicStrategyCharts"],
+    "seats": None,
+    "decks": 6,
+    "rounds": 500,
+    "games": 1,
+    "seed": 0,
+    "balance": 1000,
+    "penetration": 0.60,
+    "workers": 1,
+    "format": "summary",
+    "output": None,
+    "timing": False,
+    "listen": None,
+    "authkey": None,
+}
+
+SUMMARY_COLUMNS = ("key", "hands", "wagered", "ev", "ev_sem", "ev_units", "win_rate", "loss_rate", "push_rate")
+
+
+def parser():
+    parser = argparse.ArgumentParser(prog="python -m blackjack", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     argument_default=argparse.SUPPRESS)
+    parser.add_argument("--config", help="JSON file of settings; command-line options override it")
+    parser.add_argument("--strategy", action="append", help="strategy class name (repeat for several)")
+    parser.add_argument("--seats", type=int, help="number of seats (default: one per strategy)")
+    parser.add_argument("--decks", type=int, help="decks in the shoe (default 6)")
+    parser.add_argument("--rounds", type=int, help="rounds per game (default 500)")
+    parser.add_argument("--games", type=int, help="games in the session (default 1)")
+    parser.add_argument("--seed", type=int, help="session seed (default 0)")
+    parser.add_argument("--balance", type=float, help="starting balance per seat (default 1000)")
+    parser.add_argument("--penetration", type=float, help="share of the shoe dealt before reshuffling (default 0.6)")
+    parser.add_argument("--workers", type=int, help="worker processes (default 1: play in this process)")
+    parser.add_argument("--format", choices=FORMATS, help="output format (default summary)")
+    parser.add_argument("--output", help="output path (default: stdout; required for store)")
+    parser.add_argument("--timing", action="store_true", help="print startup and simulation time to stderr")
+    parser.add_argument("--listen", help="host:port (or socket path) to hand games out from to "
+                                         "`python distributed.py worker` processes instead of playing here")
+    parser.add_argument("--authkey", help="shared key workers must present (required unless --listen is a loopback "
+                                          "address or socket path, which get a random one, printed to stderr)")
+    return parser
+
+
+def load_config(argv=None):
+    """Settings from the defaults, then the config file, then the command line."""
+    args = vars(parser().parse_args(argv))
+    config = dict(DEFAULTS)
+    path = args.pop("config", None)
+    if path is not None:
+        with open(path) as f:
+            declared = json.load(f)
+        unknown = set(declared) - set(DEFAULTS)
+        if unknown:
+            raise SystemExit(f"Unknown settings in {path}: {', '.join(sorted(unknown))}")
+        config.update(declared)
+    config.update(args)
+    if isinstance(config["strategy"], str):
+        config["strategy"] = [config["strategy"]]
+    if config["format"] not in FORMATS:
+        raise SystemExit(f"Unknown format: {config['format']}")
+    if config["format"] == "store" and not config["output"]:
+        raise SystemExit("--format store needs --output")
+    if config["listen"] and config["format"] == "csv":
+        raise SystemExit("--format csv can't be played by workers; use store")
+    return config
+
+
+def make_spec(config):
+    from runner import SessionSpec
+    from sweep import resolve_strategy
+
+    strategies = [resolve_strategy(name) for name in config["strategy"]]
+    seats = config["seats"] or len(strategies)
+    return SessionSpec([strategies[seat % len(strategies)] for seat in range(seats)],
+                       number_of_decks=config["decks"], rounds=config["rounds"], games=config["games"],
+                       seed=config["seed"], balance=config["balance"], penetration=config["penetration"])
+
+
+def _output(path):
+    """The file at path to write to, or stdout (left open) if there's no path."""
+    return open(path, "w", newline="") if path else nullcontext(sys.stdout)
+
+
+def write_csv(rows, path):
+    import csv
+    with _output(path) as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]) if rows else [])
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def write_summary(rows, path, format):
+    rows = [row for row in rows if row["group"] == "strategy"]
+    if format == "json":
+        with _output(path) as f:
+            json.dump(rows, f, indent=2)
+            f.write("\n")
+    elif path:
+        write_csv(rows, path)
+    else:
+        print(f"{'strategy':<24}" + "".join(f"{column:>12}" for column in SUMMARY_COLUMNS[1:]))
+        for row in rows:
+            print(f"{row['key']:<24}" + "".join(
+                f"{row[column]:>12.4f}" if isinstance(row[column], float) else f"{row[column]:>12}"
+                for column in SUMMARY_COLUMNS[1:]))
+
+
+def main(argv=None):
+    config = load_config(argv)
+    spec = make_spec(config)
+    # CPU time since the interpreter started: its own startup plus every import so far
+    startup = time.process_time()
+
+    started = time.perf_counter()
+    if config["listen"]:
+        from distributed import Coordinator, parse_address
+        # One game per unit, as in the local runs, so the merged totals come out identical
+        try:
+            coordinator = Coordinator(parse_address(config["listen"]), authkey=config["authkey"], unit_games=1)
+        except ValueError:
+            raise SystemExit(f"--listen {config['listen']} is reachable from other machines; it needs --authkey")
+        if not config["authkey"]:
+            print(f"Workers' authkey: {coordinator.authkey.decode()}", file=sys.stderr)
+        with coordinator:
+            if config["format"] == "store":
+                coordinator.run(spec, "store", config["output"])
+            else:
+                write_summary(coordinator.run(spec).get_stats(), config["output"], config["format"])
+    elif config["format"] == "store":
+        from runner import store_session
+        store_session(spec, config["output"], max_workers=config["workers"])
+    elif config["format"] == "csv":
+        from runner import run_session
+        write_csv(run_session(spec, max_workers=config["workers"]), config["output"])
+    else:
+        from runner import run_aggregate
+        write_summary(run_aggregate(spec, max_workers=config["workers"]).get_stats(), config["output"],
+                      config["format"])
+    elapsed = time.perf_counter() - started
+
+    if config["timing"]:
+        rounds = spec.rounds * spec.games
+        print(f"startup {startup * 1000:.0f} ms CPU, simulation {elapsed:.2f} s "
+              f"({rounds / elapsed if elapsed else 0:.0f} rounds/s)", file=sys.stderr)
+    return 0
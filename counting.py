@@ -0,0 +1,87 @@
+"""
+Count Systems
+-------------
+Card-counting systems as data: one tag per rank index (the order of
+blackjack.RANKS), plus whether the system is balanced and where its running
+count starts.
+
+Game keeps a histogram of the ranks dealt since the shuffle, so any number of
+systems can be read off the same shoe; the first system in its list drives
+the running/true count the strategies see.
+
+Reference: https://www.qfit.com/card-counting-systems.htm
+"""
+import math
+
+# True counts are bucketed by floor(tc), clipped to this range
+MIN_COUNT_BUCKET = -6
+MAX_COUNT_BUCKET = 6
+N_COUNT_BUCKETS = MAX_COUNT_BUCKET - MIN_COUNT_BUCKET + 1
+
+# Card value of each rank index: 2-9, 10, Jack, Queen, King, Ace
+_RANK_VALUES = (2, 3, 4, 5, 6, 7, 8, 9, 10, 10, 10, 10, 11)
+
+
+def true_count_bucket(true_count):
+    """floor(true_count), clipped to [MIN_COUNT_BUCKET, MAX_COUNT_BUCKET]."""
+    bucket = math.floor(true_count)
+    if bucket < MIN_COUNT_BUCKET:
+        return MIN_COUNT_BUCKET
+    if bucket > MAX_COUNT_BUCKET:
+        return MAX_COUNT_BUCKET
+    return bucket
+
+
+def count_bucket(true_count):
+    """Bucket index (0-based) for a true count."""
+    return true_count_bucket(true_count) - MIN_COUNT_BUCKET
+
+
+class CountSystem:
+    """
+    tags: 13 per-rank tags. Unbalanced systems (balanced=False) start each
+    shoe at initial_offset + initial_per_deck * decks and bet off the running
+    count, so their "true count" is the running count.
+    """
+    def __init__(self, name, tags, balanced=True, initial_offset=0, initial_per_deck=0):
+        tags = tuple(tags)
+        if len(tags) != 13:
+            raise ValueError("A count system needs one tag per rank (13)")
+        self.name = name
+        self.tags = tags
+        self.balanced = balanced
+        self.initial_offset = initial_offset
+        self.initial_per_deck = initial_per_deck
+
+    @classmethod
+    def from_values(cls, name, value_tags, **kwargs):
+        """Build from tags keyed by card value (2-10, 11 for ace); missing values tag 0."""
+        return cls(name, [value_tags.get(value, 0) for value in _RANK_VALUES], **kwargs)
+
+    def initial_count(self, number_of_decks):
+        return self.initial_offset + self.initial_per_deck * number_of_decks
+
+    def running_count(self, seen, number_of_decks):
+        """Running count from per-rank counts of the cards dealt since the shuffle."""
+        return self.initial_count(number_of_decks) + sum(n * tag for n, tag in zip(seen, self.tags))
+
+    def true_count(self, running_count, remaining_decks):
+        if not self.balanced:
+            return running_count
+        if remaining_decks <= 0:
+            return 0
+        return running_count / remaining_decks
+
+    def __repr__(self):
+        return f"CountSystem({self.name!r})"
+
+
+HI_LO = CountSystem.from_values("Hi-Lo", {2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 10: -1, 11: -1})
+KO = CountSystem.from_values("KO", {2: 1, 3: 1, 4: 1, 5: 1, 6: 1, 7: 1, 10: -1, 11: -1},
+                             balanced=False, initial_offset=4, initial_per_deck=-4)
+HI_OPT_I = CountSystem.from_values("Hi-Opt I", {3: 1, 4: 1, 5: 1, 6: 1, 10: -1})
+HI_OPT_II = CountSystem.from_values("Hi-Opt II", {2: 1, 3: 1, 4: 2, 5: 2, 6: 1, 7: 1, 10: -2})
+OMEGA_II = CountSystem.from_values("Omega II", {2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 1, 9: -1, 10: -2})
+ZEN = CountSystem.from_values("Zen", {2: 1, 3: 1, 4: 2, 5: 2, 6: 2, 7: 1, 10: -2, 11: -1})
+
+SYSTEMS = {system.name: system for system in (HI_LO, KO, HI_OPT_I, HI_OPT_II, OMEGA_II, ZEN)}
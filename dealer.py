@@ -0,0 +1,163 @@
+"""
+Dealer Outcome Tables
+---------------------
+Probability of each dealer final hand (17-21, bust, blackjack; see
+ev.DEALER_OUTCOMES) by upcard, for a given number of decks.
+
+- dealer_table(decks) is exact for a fresh shoe: ev.dealer_distribution of
+  the full shoe less the upcard.
+- dealer_table(decks, by_count=True) also splits by Hi-Lo true-count bucket
+  (counting.true_count_bucket). Each bucket averages the exact distributions
+  of the shoe states seen at that count across `shoes` simulated shoes,
+  weighted by the chance of the upcard. Buckets no state reached copy the
+  nearest bucket that was.
+
+Tables are built once, cached as JSON under cache_dir (named with the deck
+count, the sampling settings and blackjack.ENGINE_VERSION) and kept in memory
+after the first load. Game(..., analytic_dealer=True) uses them to settle
+hands at their expected value instead of playing the dealer out.
+"""
+import json
+import os
+import random
+from functools import lru_cache
+
+import ev
+from blackjack import ENGINE_VERSION
+from counting import HI_LO, MIN_COUNT_BUCKET, N_COUNT_BUCKETS, count_bucket
+
+DEFAULT_CACHE_DIR = "tables_cache"
+N_OUTCOMES = len(ev.DEALER_OUTCOMES)
+
+
+class DealerTable:
+    """
+    distributions[bucket][upcard - 2] is the outcome distribution for that
+    upcard value (2-11) and count bucket index; exact tables have one bucket.
+    """
+    def __init__(self, number_of_decks, distributions, by_count=False):
+        self.number_of_decks = number_of_decks
+        self.by_count = by_count
+        self.distributions = [[tuple(dist) for dist in bucket] for bucket in distributions]
+
+        # Flat lookups for settling: stand EV per (bucket, upcard, score) and blackjack EV per (bucket, upcard)
+        self._stand = []
+        self._blackjack = []
+        for bucket in self.distributions:
+            for dist in bucket:
+                self._blackjack.append(1.5 * (1.0 - dist[ev.BLACKJACK]))
+                for score in range(22):
+                    win = dist[ev.BUST] + sum(dist[k] for k in range(5) if 17 + k < score)
+                    lose = sum(dist[k] for k in range(5) if 17 + k > score)
+                    if score < 21:
+                        lose += dist[ev.BLACKJACK]
+                    self._stand.append(win - lose)
+
+    def _index(self, upcard, true_count):
+        bucket = count_bucket(true_count) if self.by_count else 0
+        return bucket * 10 + upcard - 2
+
+    def distribution(self, upcard, true_count=0):
+        """Outcome probabilities (ev.DEALER_OUTCOMES order) for a dealer upcard value."""
+        index = self._index(upcard, true_count)
+        return self.distributions[index // 10][index % 10]
+
+    def stand_ev(self, score, upcard, true_count=0):
+        """EV per unit bet of standing on a (non-blackjack) score of at most 21."""
+        return self._stand[self._index(upcard, true_count) * 22 + score]
+
+    def blackjack_ev(self, upcard, true_count=0):
+        return self._blackjack[self._index(upcard, true_count)]
+
+    def to_dict(self):
+        return {"decks": self.number_of_decks, "by_count": self.by_count,
+                "outcomes": list(ev.DEALER_OUTCOMES), "distributions": self.distributions}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["decks"], data["distributions"], data["by_count"])
+
+
+def exact_distributions(number_of_decks):
+    """Distribution per upcard for a full shoe."""
+    full = ev.full_shoe(number_of_decks)
+    return [ev.dealer_distribution(upcard, ev.remove(full, upcard)) for upcard in ev.VALUES]
+
+
+def count_distributions(number_of_decks, shoes=200, step=10, penetration=0.75, seed=0):
+    """
+    Distribution per (count bucket, upcard), averaged over the shoe states
+    every `step` cards into `shoes` shuffled shoes, up to `penetration`.
+    """
+    # Hi-Lo tag of each card value 2-11 (ranks of one value share a tag)
+    tags = [HI_LO.tags[rank] for rank in (0, 1, 2, 3, 4, 5, 6, 7, 8, 12)]
+    full = ev.full_shoe(number_of_decks)
+    size = sum(full)
+    cards = [i for i, count in enumerate(full) for _ in range(count)]
+    sums = [[[0.0] * N_OUTCOMES for _ in range(10)] for _ in range(N_COUNT_BUCKETS)]
+    weights = [[0.0] * 10 for _ in range(N_COUNT_BUCKETS)]
+
+    rng = random.Random(seed)
+    for _ in range(shoes):
+        rng.shuffle(cards)
+        comp = list(full)
+        running_count = 0
+        for position in range(0, int(size * penetration), step):
+            if position:
+                for i in cards[position - step:position]:
+                    comp[i] -= 1
+                    running_count += tags[i]
+            remaining = size - position
+            bucket = count_bucket(running_count / (remaining / 52))
+            for i, count in enumerate(comp):
+                if not count:
+                    continue
+                weight = count / remaining
+                comp[i] -= 1
+                dist = ev.dealer_distribution(i + 2, tuple(comp))
+                comp[i] += 1
+                total = sums[bucket][i]
+                for k in range(N_OUTCOMES):
+                    total[k] += weight * dist[k]
+                weights[bucket][i] += weight
+
+    reached = [b for b in range(N_COUNT_BUCKETS) if all(weights[b])]
+    if not reached:
+        raise ValueError("No shoe state was sampled; use more shoes or a smaller step")
+    zero = -MIN_COUNT_BUCKET
+    distributions = []
+    for b in range(N_COUNT_BUCKETS):
+        if b not in reached:
+            # Nearest reached bucket, preferring the side toward zero on ties
+            b = min(reached, key=lambda r: (abs(r - b), abs(r - zero)))
+        distributions.append([[total / weights[b][i] for total in sums[b][i]] for i in range(10)])
+    return distributions
+
+
+def build_table(number_of_decks, by_count=False, **sampling):
+    if by_count:
+        return DealerTable(number_of_decks, count_distributions(number_of_decks, **sampling), by_count=True)
+    return DealerTable(number_of_decks, [exact_distributions(number_of_decks)])
+
+
+def table_path(cache_dir, number_of_decks, by_count=False, shoes=200, step=10, penetration=0.75, seed=0):
+    if by_count:
+        name = f"dealer_{number_of_decks}d_hilo_{shoes}x{step}_{penetration}_{seed}_v{ENGINE_VERSION}.json"
+        return os.path.join(cache_dir, name)
+    return os.path.join(cache_dir, f"dealer_{number_of_decks}d_v{ENGINE_VERSION}.json")
+
+
+@lru_cache(maxsize=None)
+def dealer_table(number_of_decks, by_count=False, cache_dir=DEFAULT_CACHE_DIR, **sampling):
+    """The table for a deck count, from memory, the disk cache, or built (and cached) now."""
+    path = table_path(cache_dir, number_of_decks, by_count, **sampling)
+    if os.path.exists(path):
+        with open(path) as f:
+            return DealerTable.from_dict(json.load(f))
+    table = build_table(number_of_decks, by_count, **sampling)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(table.to_dict(), f)
+    os.replace(tmp_path, path)
+    return table
@@ -0,0 +1,380 @@
+"""
+Distributed Runs
+----------------
+Spreads sessions over worker processes on any number of machines, for
+studies that outgrow one machine's process pool.
+
+A Coordinator listens on a TCP address (host, port) or a local socket path
+and splits every session into work units of unit_games consecutive games.
+Workers connect, take one unit at a time and send back its result:
+- "aggregate": the unit's merged recorders.AggregateRecorder
+- "store": the unit's games as a resultstore shard, which the coordinator
+  appends to the session's result set at `path`
+
+Games are seeded by runner.derive_seed as in run_session, and results are
+combined in unit order whatever order they arrive in, so a run gives the
+same result as run_aggregate(spec, games_per_task=unit_games) however many
+workers play it and however often a unit is re-issued. A unit is handed out
+again if its worker disconnects, or (with unit_timeout) if it's still out
+when there's nothing else left to hand out; whichever copy comes back first
+counts. If no worker is connected for worker_timeout seconds while units are
+still to be played (every worker died, or none ever came), run() raises
+RuntimeError instead of waiting for ever.
+
+    # on the coordinator
+    with Coordinator(("0.0.0.0", 5000), authkey="secret") as coordinator:
+        aggregates = coordinator.run([spec_a, spec_b])
+
+    # on every worker machine (with the same strategy modules importable)
+    python distributed.py worker coordinator-host:5000 --authkey secret
+
+Messages are pickles over multiprocessing.connection, so only run this on a
+network you trust. A Coordinator on an address other machines can reach
+refuses to start without an authkey; on a loopback address or socket path it
+makes up a random one (see .authkey) if none is given.
+run_distributed() runs the whole thing on localhost with worker processes,
+no network setup needed.
+"""
+import os
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from multiprocessing.connection import Client, Listener, wait
+from queue import Empty, Queue
+
+from runner import aggregate_games, session_meta, store_session
+
+MODES = ("aggregate", "store")
+
+
+def _authkey(authkey):
+    return authkey.encode() if isinstance(authkey, str) else authkey
+
+
+def parse_address(text):
+    """"host:port" as a TCP address; anything without a port is a local socket path."""
+    host, _, port = text.rpartition(":")
+    if host and port.isdigit():
+        return (host, int(port))
+    return text
+
+
+def is_loopback(address):
+    """Whether only this machine can reach the address: a loopback host, or a local socket path."""
+    if isinstance(address, str):
+        return True
+    host = address[0]
+    if host == "localhost":
+        return True
+    import ipaddress
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False  # some other host name
+
+
+def play_unit(spec, games, mode):
+    """Play one work unit (a range of the spec's games) and return what a worker sends back."""
+    if mode == "aggregate":
+        return aggregate_games(spec, games)
+    if mode == "store":
+        directory = tempfile.mkdtemp(prefix="bjshard")
+        try:
+            store_session(spec, directory, game_nums=games)
+            files = {}
+            for name in os.listdir(directory):
+                with open(os.path.join(directory, name), "rb") as f:
+                    files[name] = f.read()
+            return files
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+    raise ValueError(f"Unknown mode: {mode}")
+
+
+class Coordinator:
+    """
+    Hands out work units to the workers that connect to `address` (port 0
+    picks a free one; see .address) and combines what they send back.
+    Connected workers stay connected between run() calls; close() stops
+    them. worker_timeout (None: no limit) is how long run() waits with units
+    left and no worker connected. Without an authkey, a loopback address or
+    socket path gets a random one (.authkey, for the workers) and any other
+    address raises ValueError.
+    """
+
+    def __init__(self, address=("localhost", 0), authkey=None, unit_games=10, unit_timeout=None, poll=0.2,
+                 worker_timeout=600):
+        if not authkey:
+            # Workers' messages are unpickled, so only an authkey keeps other machines from running code here
+            if not is_loopback(address):
+                raise ValueError(f"{address!r} is reachable from other machines; it needs an authkey")
+            import secrets
+            authkey = secrets.token_hex(16)
+        self.authkey = _authkey(authkey)
+        self.unit_games = unit_games
+        self.unit_timeout = unit_timeout
+        self.worker_timeout = worker_timeout
+        self.poll = poll
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        self.workers = {}  # connection -> worker name
+        self._idle = deque()
+        self._connections = Queue()
+        self._accepting = threading.Thread(target=self._accept, daemon=True)
+        self._accepting.start()
+
+    def _accept(self):
+        while True:
+            try:
+                self._connections.put(self.listener.accept())
+            except OSError:
+                return  # the listener was closed
+            except Exception:
+                continue  # e.g. a client with the wrong authkey
+
+    def _drop(self, connection):
+        self.workers.pop(connection, None)
+        if connection in self._idle:
+            self._idle.remove(connection)
+        connection.close()
+
+    def _send(self, connection, message):
+        try:
+            connection.send(message)
+            return True
+        except OSError:
+            self._drop(connection)
+            return False
+
+    def run(self, specs, mode="aggregate", paths=None):
+        """
+        Play every game of the sessions (a SessionSpec or a list of them) on
+        the workers. Returns, per session, the merged AggregateRecorder
+        ("aggregate") or the opened ResultStore written at its path
+        ("store"; paths holds one per session).
+        """
+        single = not isinstance(specs, (list, tuple))
+        specs = [specs] if single else list(specs)
+        if mode not in MODES:
+            raise ValueError(f"Unknown mode: {mode}")
+        if mode == "store":
+            paths = [paths] if single else list(paths or ())
+            if len(paths) != len(specs):
+                raise ValueError("Store mode needs one path per session")
+
+        units = [(job, range(start, min(start + self.unit_games, spec.games)))
+                 for job, spec in enumerate(specs) for start in range(0, spec.games, self.unit_games)]
+        shard_dir = tempfile.mkdtemp(prefix="bjshards") if mode == "store" else None
+        try:
+            combined = self._combine(specs, units, self._serve(specs, units, mode, shard_dir), mode, paths)
+            return combined[0] if single else combined
+        finally:
+            if shard_dir is not None:
+                shutil.rmtree(shard_dir, ignore_errors=True)
+
+    def _serve(self, specs, units, mode, shard_dir):
+        pending = deque(range(len(units)))
+        results = {}
+        out = {}  # connection -> (unit id, time handed out)
+        unmanned_since = None  # when the last worker went (or when run() started without one)
+        while len(results) < len(units):
+            while True:
+                try:
+                    connection = self._connections.get_nowait()
+                except Empty:
+                    break
+                self.workers[connection] = None
+
+            if self.workers:
+                unmanned_since = None
+            elif unmanned_since is None:
+                unmanned_since = time.monotonic()
+            elif self.worker_timeout is not None and time.monotonic() - unmanned_since > self.worker_timeout:
+                raise RuntimeError(f"No worker connected for {self.worker_timeout:g}s with "
+                                   f"{len(units) - len(results)} of {len(units)} units unplayed")
+
+            for connection in wait(list(self.workers), timeout=self.poll):
+                try:
+                    message = connection.recv()
+                except (EOFError, OSError):
+                    message = None
+                if message is None:
+                    # Lost worker: its unit goes back to the front of the queue
+                    lost = out.pop(connection, None)
+                    if lost is not None and lost[0] not in results:
+                        pending.appendleft(lost[0])
+                    self._drop(connection)
+                    continue
+                kind = message[0]
+                if kind == "ready":
+                    self.workers[connection] = message[1]
+                elif kind == "done":
+                    unit_id, payload = message[1], message[2]
+                    out.pop(connection, None)
+                    if unit_id not in results:
+                        results[unit_id] = self._keep(unit_id, payload, mode, shard_dir)
+                elif kind == "error":
+                    raise RuntimeError(f"Worker {self.workers[connection]} failed on unit {message[1]}:\n{message[2]}")
+                if kind in ("ready", "done"):
+                    self._idle.append(connection)
+
+            # Hand out what's left, then re-issue units that have been out too long to idle workers
+            now = time.monotonic()
+            while self._idle and (pending or self.unit_timeout is not None):
+                while pending and pending[0] in results:
+                    pending.popleft()
+                if pending:
+                    unit_id = pending.popleft()
+                else:
+                    # A unit out on several workers is overdue once its latest copy is
+                    latest = {}
+                    for unit_id, handed_out in out.values():
+                        latest[unit_id] = max(handed_out, latest.get(unit_id, handed_out))
+                    overdue = [unit_id for unit_id, handed_out in latest.items()
+                               if unit_id not in results and now - handed_out > self.unit_timeout]
+                    if not overdue:
+                        break
+                    unit_id = min(overdue)
+                connection = self._idle.popleft()
+                job, games = units[unit_id]
+                if self._send(connection, ("unit", unit_id, specs[job], games, mode)):
+                    out[connection] = (unit_id, now)
+                else:
+                    pending.appendleft(unit_id)
+        return results
+
+    @staticmethod
+    def _keep(unit_id, payload, mode, shard_dir):
+        if mode == "aggregate":
+            return payload
+        # Shards go to disk as they arrive; they're appended in order once all are in
+        directory = os.path.join(shard_dir, str(unit_id))
+        os.makedirs(directory)
+        for name, data in payload.items():
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+        return directory
+
+    @staticmethod
+    def _combine(specs, units, results, mode, paths):
+        if mode == "aggregate":
+            from recorders import AggregateRecorder
+            combined = [AggregateRecorder() for _ in specs]
+            for unit_id, (job, _) in enumerate(units):
+                combined[job].merge(results[unit_id])
+            return combined
+
+        from resultstore import ResultStore, StoreRecorder
+        stores = []
+        for job, spec in enumerate(specs):
+            with StoreRecorder(paths[job], meta=session_meta(spec)) as recorder:
+                for unit_id, (unit_job, _) in enumerate(units):
+                    if unit_job == job:
+                        recorder.extend(ResultStore.open(results[unit_id]))
+            stores.append(ResultStore.open(paths[job]))
+        return stores
+
+    def close(self):
+        """Tell every connected worker to stop, and stop listening."""
+        while True:
+            try:
+                self.workers[self._connections.get_nowait()] = None
+            except Empty:
+                break
+        for connection in list(self.workers):
+            self._send(connection, ("stop",))
+            self._drop(connection)
+        self.listener.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_worker(address, authkey=None, name=None, connect_timeout=30):
+    """
+    Connect to a coordinator (retrying for up to connect_timeout seconds)
+    and play the units it hands out until it says stop or goes away.
+    Returns the number of units played.
+    """
+    name = name or f"{os.uname().nodename}:{os.getpid()}"
+    deadline = time.monotonic() + connect_timeout
+    while True:
+        try:
+            connection = Client(address, authkey=_authkey(authkey))
+            break
+        except (ConnectionRefusedError, FileNotFoundError):
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.2)
+
+    played = 0
+    with connection:
+        connection.send(("ready", name))
+        while True:
+            try:
+                message = connection.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == "stop":
+                break
+            _, unit_id, spec, games, mode = message
+            try:
+                payload = play_unit(spec, games, mode)
+            except Exception:
+                connection.send(("error", unit_id, traceback.format_exc()))
+                continue
+            connection.send(("done", unit_id, payload))
+            played += 1
+    return played
+
+
+def start_workers(address, count, authkey=None, connect_timeout=30):
+    """Start `count` worker processes on this machine; returns them (they exit when the coordinator closes)."""
+    from multiprocessing import Process
+    workers = [Process(target=run_worker, args=(address, authkey, None, connect_timeout), daemon=True)
+               for _ in range(count)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def run_distributed(specs, workers=2, mode="aggregate", paths=None, unit_games=10, unit_timeout=None):
+    """Coordinator plus `workers` local worker processes on a localhost port: run() in one call."""
+    with Coordinator(("localhost", 0), unit_games=unit_games, unit_timeout=unit_timeout) as coordinator:
+        processes = start_workers(coordinator.address, workers, coordinator.authkey)
+        result = coordinator.run(specs, mode, paths)
+    for process in processes:
+        process.join()
+    return result
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog="python distributed.py", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    worker = commands.add_parser("worker", help="play work units for a coordinator")
+    worker.add_argument("address", help="coordinator host:port, or a local socket path")
+    worker.add_argument("--authkey", help="shared key the coordinator was started with")
+    worker.add_argument("--processes", type=int, default=1, help="worker processes to run on this machine")
+    worker.add_argument("--connect-timeout", type=float, default=30, help="seconds to keep retrying the connection")
+    args = parser.parse_args(argv)
+
+    address = parse_address(args.address)
+    if args.processes == 1:
+        run_worker(address, args.authkey, connect_timeout=args.connect_timeout)
+    else:
+        for process in start_workers(address, args.processes, args.authkey, args.connect_timeout):
+            process.join()
+    return 0
+
+
+if __name__ == "__main__":
+    import sys
+    sys.exit(main())
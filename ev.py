@@ -0,0 +1,323 @@
+"""
+Exact EV Calculator
+-------------------
+Composition-dependent expected values of stand, hit, double and split for a
+player hand against a dealer upcard, given the exact cards left unseen.
+
+A composition is a tuple of 10 counts for card values 2-10 and ace (11). It
+holds every card the player can't see: the undealt shoe plus the dealer's
+hole card. Dealer final-hand distributions and player sub-results are
+memoized by composition in bounded LRU caches (CACHE_SIZE entries each).
+Dealer distributions are exact sums over every multiset of cards the dealer
+can draw, evaluated for a composition in one vectorized pass.
+
+Rules follow blackjack.Game:
+- the dealer stands on all 17s and never peeks, so a dealer blackjack takes
+  doubled and split bets in full (a player 21 still pushes against it)
+- blackjack pays 3:2, including a two-card 21 after a split
+- doubling is allowed on any two cards, including after a split, and only
+  on two cards (the game plays any other double as a hit)
+- no resplits: a pair dealt to a split hand plays as its total
+EVs are per unit of the original bet, and assume the balance covers every
+double and split. Splits are valued as two independent hands drawing from
+the same composition.
+
+fixed_evs() is the fast path for playing a hand, as PerfectPlayStrategy does:
+every action's EV for every hand against an upcard in one pass, with the
+dealer's distribution and the player's draws both taken from the composition
+at the decision (the cards the player goes on to draw aren't taken out of
+it). That's one dealer distribution per decision instead of hundreds; the
+exact functions above remain for checking it.
+"""
+from functools import lru_cache
+import numpy as np
+from blackjack import RANK_VALUES
+
+VALUES = tuple(range(2, 12))
+CACHE_SIZE = 1 << 18
+
+# Indexes into a dealer distribution
+DEALER_OUTCOMES = ("17", "18", "19", "20", "21", "bust", "blackjack")
+BUST = 5
+BLACKJACK = 6
+
+
+def composition(cards):
+    """Composition of a collection of card ints."""
+    counts = [0] * 10
+    for card in cards:
+        counts[RANK_VALUES[card % 13] - 2] += 1
+    return tuple(counts)
+
+
+def full_shoe(number_of_decks):
+    return tuple(4 * number_of_decks if value != 10 else 16 * number_of_decks for value in VALUES)
+
+
+def remove(comp, value):
+    """Composition with one card of the given value taken out."""
+    i = value - 2
+    if comp[i] == 0:
+        raise ValueError(f"No {value} left in the composition")
+    return comp[:i] + (comp[i] - 1,) + comp[i + 1:]
+
+
+def _add(hard, soft, value):
+    """Hard total and soft flag after adding a card of the given value."""
+    if value == 11:
+        return hard + 1, True
+    return hard + value, soft
+
+
+def _score(hard, soft):
+    return hard + 10 if soft and hard <= 11 else hard
+
+
+@lru_cache(maxsize=None)
+def _dealer_templates(upcard):
+    """
+    Every way the dealer can finish from an upcard, grouped by the multiset of
+    cards drawn: (multiplicities per value, number of cards, outcome, orderings).
+    The probability of one ordering only depends on its multiset, so a
+    composition's dealer distribution is a weighted sum over these.
+    """
+    templates = {}
+    counts = [0] * 10
+
+    def walk(hard, soft, first_draw):
+        for i in range(10):
+            counts[i] += 1
+            new_hard, new_soft = _add(hard, soft, i + 2)
+            score = _score(new_hard, new_soft)
+            if score > 21:
+                outcome = BUST
+            elif score >= 17:
+                outcome = BLACKJACK if first_draw and score == 21 else score - 17
+            else:
+                outcome = None
+                walk(new_hard, new_soft, False)
+            if outcome is not None:
+                key = (tuple(counts), outcome)
+                templates[key] = templates.get(key, 0) + 1
+            counts[i] -= 1
+
+    hard, soft = _add(0, False, upcard)
+    walk(hard, soft, True)
+    multiplicities = np.array([key[0] for key in templates], dtype=np.int64)
+    outcomes = np.array([key[1] for key in templates], dtype=np.int64)
+    orderings = np.array(list(templates.values()), dtype=np.float64)
+    return multiplicities, multiplicities.sum(axis=1), outcomes, orderings
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def dealer_distribution(upcard, comp):
+    """Probabilities of the dealer's final hand (DEALER_OUTCOMES) given the upcard value."""
+    multiplicities, sizes, outcomes, orderings = _dealer_templates(upcard)
+    counts = np.array(comp, dtype=np.float64)
+    n = counts.sum()
+    if n < sizes.max():
+        raise ValueError("The composition has too few cards to finish the dealer's hand")
+
+    # falling[k, v] = counts[v] * (counts[v] - 1) * ... (k factors); it hits 0 once a value runs out
+    max_k = multiplicities.max()
+    falling = np.ones((max_k + 1, 10))
+    total_falling = np.ones(sizes.max() + 1)
+    for k in range(1, max_k + 1):
+        falling[k] = falling[k - 1] * (counts - (k - 1))
+    for k in range(1, sizes.max() + 1):
+        total_falling[k] = total_falling[k - 1] * (n - (k - 1))
+
+    ways = falling[multiplicities, np.arange(10)].prod(axis=1)
+    probabilities = orderings * ways / total_falling[sizes]
+    return tuple(np.bincount(outcomes, weights=probabilities, minlength=len(DEALER_OUTCOMES)).tolist())
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def stand_ev(score, upcard, comp):
+    """EV of standing on a (non-blackjack) score."""
+    dealer = dealer_distribution(upcard, comp)
+    win = dealer[BUST]
+    lose = 0.0
+    for k in range(5):
+        if 17 + k < score:
+            win += dealer[k]
+        elif 17 + k > score:
+            lose += dealer[k]
+    # A dealer blackjack counts as 21
+    if score < 21:
+        lose += dealer[BLACKJACK]
+    return win - lose
+
+
+def blackjack_ev(upcard, comp):
+    """EV of a two-card 21: paid 3:2 unless the dealer also has blackjack."""
+    return 1.5 * (1.0 - dealer_distribution(upcard, comp)[BLACKJACK])
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def hit_ev(hard, soft, upcard, comp):
+    """EV of taking one card and then playing on (hit or stand) optimally."""
+    n = sum(comp)
+    ev = 0.0
+    for i, count in enumerate(comp):
+        if not count:
+            continue
+        p = count / n
+        new_hard, new_soft = _add(hard, soft, i + 2)
+        if new_hard > 21:
+            ev -= p
+            continue
+        new_comp = comp[:i] + (count - 1,) + comp[i + 1:]
+        score = _score(new_hard, new_soft)
+        best = stand_ev(score, upcard, new_comp)
+        if score < 21:
+            best = max(best, hit_ev(new_hard, new_soft, upcard, new_comp))
+        ev += p * best
+    return ev
+
+
+def double_ev(hard, soft, upcard, comp):
+    """EV of doubling: one card, then stand, for twice the stake."""
+    n = sum(comp)
+    ev = 0.0
+    for i, count in enumerate(comp):
+        if not count:
+            continue
+        p = count / n
+        new_hard, new_soft = _add(hard, soft, i + 2)
+        if new_hard > 21:
+            ev -= p
+        else:
+            ev += p * stand_ev(_score(new_hard, new_soft), upcard, comp[:i] + (count - 1,) + comp[i + 1:])
+    return 2 * ev
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def split_ev(value, upcard, comp):
+    """EV of splitting a pair of the given value (two hands, no resplits)."""
+    n = sum(comp)
+    start_hard, start_soft = _add(0, False, value)
+    ev = 0.0
+    for i, count in enumerate(comp):
+        if not count:
+            continue
+        p = count / n
+        hard, soft = _add(start_hard, start_soft, i + 2)
+        new_comp = comp[:i] + (count - 1,) + comp[i + 1:]
+        score = _score(hard, soft)
+        if score == 21:
+            ev += p * blackjack_ev(upcard, new_comp)
+        else:
+            ev += p * max(stand_ev(score, upcard, new_comp),
+                          hit_ev(hard, soft, upcard, new_comp),
+                          double_ev(hard, soft, upcard, new_comp))
+    return 2 * ev
+
+
+def hand_evs(hand, upcard, comp):
+    """
+    EV of every legal action for a blackjack.Hand against a dealer upcard value,
+    as {"stand": ..., "hit": ..., "double": ..., "split": ...}. comp excludes the
+    hand's cards and the upcard.
+    """
+    hard, soft = hand.hard_total, hand.aces > 0
+    score = _score(hard, soft)
+    if hand.is_blackjack():
+        return {"stand": blackjack_ev(upcard, comp)}
+    evs = {"stand": stand_ev(score, upcard, comp)}
+    if score < 21:
+        evs["hit"] = hit_ev(hard, soft, upcard, comp)
+    if hand.can_double():
+        evs["double"] = double_ev(hard, soft, upcard, comp)
+    if hand.can_split():
+        evs["split"] = split_ev(RANK_VALUES[hand.cards[0] % 13], upcard, comp)
+    return evs
+
+
+def best_action(hand, upcard, comp):
+    evs = hand_evs(hand, upcard, comp)
+    return max(evs, key=evs.get)
+
+
+@lru_cache(maxsize=1024)
+def fixed_evs(upcard, comp):
+    """
+    EVs of every action for every hand against an upcard, with the dealer's
+    distribution and every card drawn taken from comp as it stands (see the
+    module docstring), as {"stand": [EV by score 0-21], "hit", "double" and
+    "play" (the best of standing and hitting on): {(hard, soft): EV},
+    "blackjack": EV, "draws": [(card value, probability), ...]}.
+    """
+    dealer = dealer_distribution(upcard, comp)
+    n = sum(comp)
+    draws = [(i + 2, count / n) for i, count in enumerate(comp) if count]
+
+    stand = []
+    for score in range(22):
+        win = dealer[BUST] + sum(dealer[k] for k in range(5) if 17 + k < score)
+        lose = sum(dealer[k] for k in range(5) if 17 + k > score) + (dealer[BLACKJACK] if score < 21 else 0.0)
+        stand.append(win - lose)
+
+    # From the highest hard totals down, so every card drawn lands on a state already known;
+    # above hard 11 an ace can't count as 11, so soft and hard states are the same
+    hit, double, play = {}, {}, {}
+    for hard in range(21, 1, -1):
+        for soft in (True, False) if hard <= 11 else (False,):
+            hit_ev = double_ev = 0.0
+            for value, p in draws:
+                new_hard, new_soft = _add(hard, soft, value)
+                if new_hard > 21:
+                    hit_ev -= p
+                    double_ev -= p
+                else:
+                    hit_ev += p * play[new_hard, new_soft]
+                    double_ev += p * stand[_score(new_hard, new_soft)]
+            score = _score(hard, soft)
+            hit[hard, soft] = hit_ev
+            double[hard, soft] = 2 * double_ev
+            play[hard, soft] = max(stand[score], hit_ev) if score < 21 else stand[score]
+        if hard > 11:
+            for table in (hit, double, play):
+                table[hard, True] = table[hard, False]
+    return {"stand": stand, "hit": hit, "double": double, "play": play,
+            "blackjack": 1.5 * (1.0 - dealer[BLACKJACK]), "draws": draws}
+
+
+def fixed_split_ev(evs, value):
+    """EV of splitting a pair of the given value, from a fixed_evs table (as split_ev: two hands, no resplits)."""
+    start_hard, start_soft = _add(0, False, value)
+    ev = 0.0
+    for second, p in evs["draws"]:
+        hard, soft = _add(start_hard, start_soft, second)
+        if _score(hard, soft) == 21:
+            ev += p * evs["blackjack"]
+        else:
+            ev += p * max(evs["play"][hard, soft], evs["double"][hard, soft])
+    return 2 * ev
+
+
+def fixed_hand_evs(hand, upcard, comp):
+    """hand_evs from fixed_evs: the legal actions' EVs for a blackjack.Hand, at comp as it stands."""
+    evs = fixed_evs(upcard, comp)
+    if hand.is_blackjack():
+        return {"stand": evs["blackjack"]}
+    hard, soft = hand.hard_total, hand.aces > 0
+    score = _score(hard, soft)
+    actions = {"stand": evs["stand"][score]}
+    if score < 21:
+        actions["hit"] = evs["hit"][hard, soft]
+    if hand.can_double():
+        actions["double"] = evs["double"][hard, soft]
+    if hand.can_split():
+        actions["split"] = fixed_split_ev(evs, RANK_VALUES[hand.cards[0] % 13])
+    return actions
+
+
+def cache_info():
+    """Hit/miss statistics of every memo cache, by function name."""
+    return {func.__name__: func.cache_info() for func in (dealer_distribution, stand_ev, hit_ev, split_ev, fixed_evs)}
+
+
+def clear_caches():
+    for func in (dealer_distribution, stand_ev, hit_ev, split_ev, fixed_evs):
+        func.cache_clear()
@@ -0,0 +1,462 @@
+"""
+Importance Sampling
+-------------------
+Per-true-count EV estimates for the rare high counts (TC 4 and up) without
+the enormous ordinary runs it takes to see enough of them. Two ways:
+
+run_conditional() plays rounds straight from shoe states already at the
+count: for each bucket it draws compositions of the cards dealt so far
+(conditional_states: a uniform depth up to the cut card, then dealt cards
+whose running count puts the true count in the bucket), puts the dealt cards
+at the front of a shoe with the rest shuffled behind, and plays one round
+from there. Every sample lands in the bucket, so this is the fast path; the
+uniform depth stands in for where rounds actually start in a shoe, which is
+close but not exact (per-bucket EVs agree with long ordinary runs to within
+their noise).
+
+    aggregate = run_conditional(spec, buckets=range(4, 7))
+    rows = [row for row in aggregate.get_stats() if row["group"] == "true_count"]
+
+run_importance() keeps ordinary play exact instead. TiltedShoe shuffles
+with a bias: each card is drawn with probability proportional to (cards of
+its rank left) * exp(tilt * tag), tag being the count system's tag of the
+rank, so a positive tilt deals low cards early and drives the count up. Within a tag class the cards stay uniformly shuffled.
+The shoe keeps the likelihood ratio of its order so far against a fair
+shuffle; weighting every round by the ratio at the point its last card came
+out makes any per-round average an unbiased estimate of the same average in
+ordinary play. Games play as usual (rounds at their usual depths, reshuffles
+at the cut card), only through a TiltedShoe.
+
+ImportanceRecorder keeps those weighted tallies per strategy and per
+true-count bucket (counting.true_count_bucket of the betting count) and
+returns rows with the same columns as recorders.AggregateRecorder's, plus
+`share` (estimated share of all hands in the group) and `ess` (effective
+sample size; far fewer than `hands` means the tilt is too strong for that
+bucket, or its hands are strongly correlated). Per-bucket EVs are
+self-normalized weighted means; ev_sem is the matching ratio-estimator
+standard error, taken across games since hands of a game share the dealer,
+the shoe and its weight. Call start_game(n) before each game.
+
+    aggregate = run_importance(spec, target_count=5)
+    rows = [row for row in aggregate.get_stats() if row["group"] == "true_count"]
+
+ev_units (per initial bet) is the figure to compare across runs: bets are a
+fraction of the balance, and balances carried over from earlier shoes grew
+under the tilt, so ev in money drifts slightly with it.
+"""
+import math
+import random
+from functools import partial
+
+from blackjack import Game, Shoe
+from counting import HI_LO, MAX_COUNT_BUCKET, MIN_COUNT_BUCKET, true_count_bucket
+from recorders import AggregateRecorder, HandTally
+from runner import _map_chunks, derive_seed
+
+
+class TiltedShoe(Shoe):
+    """
+    A Shoe whose shuffles favour cards with a high tag under count_system
+    (tilt > 0) or a low one (tilt < 0). weight() is the likelihood ratio of
+    the cards dealt so far against a fair shuffle.
+    """
+
+    def __init__(self, number_of_decks, rng=None, penetration=0.60, burn=0, tilt=0.0, count_system=HI_LO):
+        self.tilt = tilt
+        tags = count_system.tags
+        self.tags = sorted(set(tags))
+        # Cards of each tag class, one list per tag in self.tags
+        self._classes = [[card for card in range(52) if tags[card % 13] == tag] * number_of_decks
+                         for tag in self.tags]
+        self._log_weights = [0.0] * (number_of_decks * 52 + 1)
+        super().__init__(number_of_decks, rng, penetration, burn)
+
+    def shuffle(self):
+        rng = self.rng
+        random = rng.random
+        tilt = self.tilt
+        factors = [math.exp(tilt * tag) for tag in self.tags]
+        counts = [len(cards) for cards in self._classes]
+        classes = range(len(counts))
+        log_weights = self._log_weights
+        order = []
+        log_weight = 0.0
+        left = self.size
+        for position in range(self.size):
+            # Draw a tag class in proportion to its cards left times its factor
+            total = 0.0
+            for k in classes:
+                total += counts[k] * factors[k]
+            target = random() * total
+            for k in classes:
+                target -= counts[k] * factors[k]
+                if target < 0 and counts[k]:
+                    break
+            else:
+                k = max(k for k in classes if counts[k])  # rounding left the draw past the end
+            counts[k] -= 1
+            order.append(k)
+            # Fair draw probability of the class over its tilted probability
+            log_weight += math.log(total / (left * factors[k]))
+            left -= 1
+            log_weights[position + 1] = log_weight
+
+        # Which cards of a class come out in its positions is still a fair shuffle
+        pools = []
+        for cards in self._classes:
+            pool = list(cards)
+            rng.shuffle(pool)
+            pools.append(pool)
+        self.cards[:] = bytes(pools[k].pop() for k in order)
+        self.cursor = self.burn
+
+    def weight(self):
+        """Likelihood ratio of the shoe's order up to the cursor (fair / tilted)."""
+        return math.exp(self._log_weights[self.cursor])
+
+    def snapshot(self):
+        state = super().snapshot()
+        state["log_weights"] = list(self._log_weights)
+        return state
+
+    def restore(self, state):
+        super().restore(state)
+        self._log_weights[:] = state["log_weights"]
+
+
+def tilt_for_count(target_count, number_of_decks, penetration=0.60, count_system=HI_LO):
+    """
+    The tilt that makes target_count the expected true count halfway to the
+    cut card, i.e. typical for the middle of the rounds of a shoe.
+    """
+    size = number_of_decks * 52
+    depth = size * penetration / 2
+    tags = count_system.tags
+
+    def expected_count(tilt):
+        factors = [math.exp(tilt * tag) for tag in tags]
+        mean_tag = sum(tag * factor for tag, factor in zip(tags, factors)) / sum(factors)
+        running_count = count_system.initial_count(number_of_decks) + depth * mean_tag
+        return count_system.true_count(running_count, (size - depth) / 52)
+
+    low, high = -5.0, 5.0
+    for _ in range(60):
+        middle = (low + high) / 2
+        if expected_count(middle) < target_count:
+            low = middle
+        else:
+            high = middle
+    return (low + high) / 2
+
+
+class WeightedStats:
+    """
+    Weighted mean and variance of a stream, with the self-normalized (ratio)
+    standard error taken across games: hands of a game share the dealer, the
+    shoe and its weight, so they aren't independent, but games are.
+    """
+    __slots__ = ("n", "sw", "swx", "swx2", "games")
+
+    def __init__(self):
+        self.n = 0
+        self.sw = self.swx = self.swx2 = 0.0
+        self.games = {}  # game number -> [sum of w, sum of w * x]
+
+    def add(self, x, w, game=0):
+        self.n += 1
+        wx = w * x
+        self.sw += w
+        self.swx += wx
+        self.swx2 += wx * x
+        sums = self.games.get(game)
+        if sums is None:
+            sums = self.games[game] = [0.0, 0.0]
+        sums[0] += w
+        sums[1] += wx
+
+    def merge(self, other):
+        self.n += other.n
+        self.sw += other.sw
+        self.swx += other.swx
+        self.swx2 += other.swx2
+        for game, (sw, swx) in other.games.items():
+            sums = self.games.setdefault(game, [0.0, 0.0])
+            sums[0] += sw
+            sums[1] += swx
+
+    @property
+    def mean(self):
+        return self.swx / self.sw if self.sw else 0.0
+
+    @property
+    def variance(self):
+        return max(self.swx2 / self.sw - self.mean ** 2, 0.0) if self.sw else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        games = len(self.games)
+        if games < 2 or not self.sw:
+            return 0.0
+        mean = self.mean
+        spread = sum((swx - mean * sw) ** 2 for sw, swx in self.games.values())
+        return math.sqrt(spread * games / (games - 1)) / self.sw
+
+    @property
+    def ess(self):
+        """Effective sample size: the independent, unweighted hands that would give the same standard error."""
+        sem = self.sem
+        return self.variance / (sem * sem) if sem else 0.0
+
+
+class WeightedTally:
+    """HandTally's figures, each hand weighted."""
+    __slots__ = ("counts", "wagered", "net", "units")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(HandTally.COUNTS, 0.0)
+        self.wagered = 0.0
+        self.net = WeightedStats()
+        self.units = WeightedStats()
+
+    def merge(self, other):
+        for name in HandTally.COUNTS:
+            self.counts[name] += other.counts[name]
+        self.wagered += other.wagered
+        self.net.merge(other.net)
+        self.units.merge(other.units)
+
+    def summary(self, total_weight):
+        net = self.net
+        # Weighted totals are scaled back to the hands sampled, so ratios like wagered / hands still hold
+        scale = net.n / net.sw if net.sw else 0.0
+        row = {
+            "hands": net.n,
+            "ev": net.mean,
+            "ev_std": net.std,
+            "ev_sem": net.sem,
+            "ev_units": self.units.mean,
+            "std_units": self.units.std,
+            "units_sem": self.units.sem,
+            "wagered": self.wagered * scale,
+            "share": net.sw / total_weight if total_weight else 0.0,
+            "ess": net.ess,
+        }
+        for name, rate in HandTally.RATES:
+            row[rate] = self.counts[name] / net.sw if net.sw else 0.0
+        return row
+
+
+class ImportanceRecorder:
+    """
+    Weighted per-strategy and per-true-count-bucket tallies of a game played
+    through a TiltedShoe. get_stats() rows: {"group": "strategy" or
+    "true_count", "key", ...AggregateRecorder's summary columns, "units_sem",
+    "share", "ess"}. Hands are filed under the current game number (see
+    start_game), the batches standard errors are taken over.
+    """
+
+    def __init__(self):
+        self.strategies = {}
+        self.counts = {}
+        self.hands = 0
+        # Summed weight of every hand, what a group's summed weight is a share of
+        self.weight = 0.0
+        self.game_num = 0
+
+    def start_game(self, game_num):
+        """File the following hands under game_num."""
+        self.game_num = game_num
+
+    def record(self, game, round_num, player, hand, result, dealer_score):
+        weight = game.shoe.weight()
+        initial_bet = hand.bet / 2 if hand.doubled else hand.bet
+        flags = (
+            ("wins", result == "win"),
+            ("losses", result == "lose"),
+            ("pushes", result == "push"),
+            ("blackjacks", hand.paid_blackjack),
+            ("busts", hand.is_busted()),
+            ("doubles", hand.doubled),
+        )
+        self.hands += 1
+        self.weight += weight
+        game_num = self.game_num
+        for groups, key in ((self.strategies, type(player.strategy).__name__),
+                            (self.counts, true_count_bucket(game.bet_true_count))):
+            tally = groups.get(key)
+            if tally is None:
+                tally = groups[key] = WeightedTally()
+            counts = tally.counts
+            for name, flag in flags:
+                if flag:
+                    counts[name] += weight
+            tally.wagered += weight * hand.bet
+            tally.net.add(hand.net, weight, game_num)
+            if initial_bet:
+                tally.units.add(hand.net / initial_bet, weight, game_num)
+
+    def merge(self, other):
+        for mine, theirs in ((self.strategies, other.strategies), (self.counts, other.counts)):
+            for key, tally in theirs.items():
+                mine.setdefault(key, WeightedTally()).merge(tally)
+        self.hands += other.hands
+        self.weight += other.weight
+        return self
+
+    def get_stats(self):
+        rows = []
+        for strategy, tally in self.strategies.items():
+            row = {"group": "strategy", "key": strategy, "strategy": strategy}
+            row.update(tally.summary(self.weight))
+            rows.append(row)
+        for bucket in sorted(self.counts):
+            row = {"group": "true_count", "key": bucket}
+            row.update(self.counts[bucket].summary(self.weight))
+            rows.append(row)
+        return rows
+
+    def close(self):
+        pass
+
+
+def importance_games(spec, game_nums, tilt):
+    """Play the given games of the session through TiltedShoes into one ImportanceRecorder."""
+    recorder = ImportanceRecorder()
+    for game_num in game_nums:
+        seed = derive_seed(spec.seed, game_num)
+        shoe = TiltedShoe(spec.number_of_decks, random.Random(seed), spec.penetration, tilt=tilt)
+        game = Game(spec.number_of_decks, spec.make_players(), seed=seed, recorder=recorder, shoe=shoe)
+        recorder.start_game(game_num)
+        game.play_rounds(spec.rounds)
+    return recorder
+
+
+def run_importance(spec, tilt=None, target_count=None, max_workers=1, games_per_task=1):
+    """
+    Play the session through TiltedShoes (tilt given, or the tilt_for_count of
+    target_count) and return the merged ImportanceRecorder. Game seeds follow
+    runner.derive_seed, so a run reproduces like run_aggregate.
+    """
+    if tilt is None:
+        tilt = 0.0 if target_count is None else tilt_for_count(target_count, spec.number_of_decks, spec.penetration)
+    recorder = ImportanceRecorder()
+    for partial_recorder in _map_chunks(partial(importance_games, tilt=tilt), spec, max_workers, games_per_task):
+        recorder.merge(partial_recorder)
+    return recorder
+
+
+def _split_draws(generator, sizes, draws):
+    """Per-group counts (len(sizes) x n) of draws[i] cards taken without replacement from groups of `sizes`."""
+    import numpy as np
+    left = sum(sizes)
+    counts = []
+    for size in sizes[:-1]:
+        left -= size
+        taken = generator.hypergeometric(size, left, draws) if left else draws
+        counts.append(taken)
+        draws = draws - taken
+    counts.append(draws)
+    return np.array(counts)
+
+
+def conditional_states(number_of_decks, bucket, samples, generator, penetration=0.60, count_system=HI_LO,
+                       batch=1 << 16):
+    """
+    `samples` round-start states (depth, per-rank counts of the cards dealt)
+    drawn from a fairly shuffled shoe at a uniform depth up to the cut card,
+    kept only if the true count is in `bucket` (counting.true_count_bucket),
+    so they follow the ordinary distribution of states in that bucket.
+    generator is a numpy.random.Generator. Returns two arrays, depths (n)
+    and seen (n x 13).
+    """
+    import numpy as np
+    size = number_of_decks * 52
+    cut = int(size * penetration)
+    rank_size = 4 * number_of_decks
+    tags = count_system.tags
+    # Draw how many cards of each tag class came out first (all the count depends on), and
+    # split the kept draws into ranks after
+    class_tags = sorted(set(tags))
+    class_ranks = [[rank for rank in range(13) if tags[rank] == tag] for tag in class_tags]
+    class_sizes = [len(ranks) * rank_size for ranks in class_ranks]
+    depths, seen = [], []
+    found = 0
+    while found < samples:
+        draws = generator.integers(0, cut + 1, size=batch)
+        dealt = _split_draws(generator, class_sizes, draws)
+        running_count = count_system.initial_count(number_of_decks) + np.array(class_tags) @ dealt
+        true_count = running_count / ((size - draws) / 52) if count_system.balanced else running_count
+        buckets = np.clip(np.floor(true_count), MIN_COUNT_BUCKET, MAX_COUNT_BUCKET)
+        keep = np.flatnonzero(buckets == bucket)[:samples - found]
+        by_rank = np.zeros((len(keep), 13), dtype=np.int64)
+        for ranks, class_dealt in zip(class_ranks, dealt[:, keep]):
+            by_rank[:, ranks] = _split_draws(generator, [rank_size] * len(ranks), class_dealt).T
+        depths.append(draws[keep])
+        seen.append(by_rank)
+        found += len(keep)
+    return np.concatenate(depths), np.concatenate(seen)
+
+
+def conditional_games(spec, game_nums, buckets):
+    """
+    For each game number, play spec.rounds single rounds per true-count bucket,
+    each from a state drawn by conditional_states and with every seat back at
+    spec.balance, into one AggregateRecorder.
+    """
+    import numpy as np
+    aggregate = AggregateRecorder()
+    decks = spec.number_of_decks
+    # The shoe's cards grouped by rank, and each card's place within its rank
+    deck = np.array([rank + 13 * suit for rank in range(13) for suit in range(4)] * decks, dtype=np.uint8)
+    deck = deck[np.argsort(deck % 13, kind="stable")]
+    deck_ranks = deck % 13
+    place = np.arange(len(deck)) - np.searchsorted(deck_ranks, deck_ranks)
+    for game_num in game_nums:
+        seed = derive_seed(spec.seed, game_num)
+        generator = np.random.default_rng(seed)
+        recorder = AggregateRecorder(prefix=f"{game_num}:")
+        shoe = Shoe(decks, random.Random(seed), spec.penetration)
+        players = spec.make_players()
+        game = Game(decks, players, seed=seed, recorder=recorder, shoe=shoe)
+        system = game.count_system
+        round_num = 0
+        for bucket in buckets:
+            depths, seen = conditional_states(decks, bucket, spec.rounds, generator, spec.penetration, system)
+            # Every shoe: the dealt cards first, then the rest in a fair random order
+            keys = generator.random((len(depths), len(deck)))
+            keys[place < seen[:, deck_ranks]] = -1.0
+            shoes = deck[np.argsort(keys, axis=1)]
+            for depth, dealt, cards in zip(depths.tolist(), seen.tolist(), shoes):
+                shoe.cards[:] = cards.tobytes()
+                shoe.cursor = depth
+                game.seen = dealt
+                game.running_count = system.running_count(dealt, decks)
+                game.cards_dealt = depth
+                game._true_count = None
+                for player in players:
+                    player.balance = spec.balance
+                game.play_round(round_num)
+                round_num += 1
+        aggregate.merge(recorder)
+    return aggregate
+
+
+def run_conditional(spec, buckets=range(4, MAX_COUNT_BUCKET + 1), max_workers=1, games_per_task=1):
+    """
+    Per-bucket EV from conditional compositions: spec.games x spec.rounds
+    rounds for every true-count bucket in `buckets`, each starting from a
+    shoe state drawn from (close to) the ordinary distribution of states in
+    that bucket.
+    Returns the merged AggregateRecorder; its true_count rows compare with
+    an ordinary run's directly (its player rows' bankroll figures don't mean
+    anything, as every round starts from spec.balance).
+    """
+    recorder = AggregateRecorder()
+    for partial_recorder in _map_chunks(partial(conditional_games, buckets=list(buckets)), spec, max_workers,
+                                        games_per_task):
+        recorder.merge(partial_recorder)
+    return recorder
@@ -0,0 +1,153 @@
+"""
+Instrumentation
+---------------
+Optional hooks for watching a Game while it plays: per-phase timers, event
+counters and a progress callback reporting rounds/sec and ETA.
+
+    instruments = Instruments(progress=print_progress, total_rounds=10000)
+    game = Game(6, players, instruments=instruments)
+    game.play_rounds(10000)
+    print(instruments.report())
+
+With no instruments attached, a round costs one check of a local variable.
+Attached, instruments wrap the game's phase methods in timers (on the game
+object, so the round Game.play_rounds plays is the same either way), count
+every player's decisions (through its decision cache, if it has one; the
+strategies are left alone) and count events after every round. Those phase methods are also what a sampling
+profiler shows.
+"""
+import time
+
+# Phase name -> Game methods that implement it
+PHASES = {
+    "bet": ("place_bets",),
+    "deal": ("deal_cards",),
+    "player_decisions": ("play_hands",),
+    "dealer": ("play_dealer",),
+    "settlement": ("settle", "settle_expected"),
+    "stats_recording": ("record_round",),
+}
+
+COUNTERS = ("rounds", "hands", "cards_dealt", "reshuffles", "splits", "doubles")
+
+
+def print_progress(rounds, rounds_per_sec, eta):
+    """Progress callback that prints one line, e.g. in place of print(f"Round: {i}")."""
+    eta_text = f", ETA {eta:.0f}s" if eta is not None else ""
+    print(f"Round {rounds}: {rounds_per_sec:.0f} rounds/s{eta_text}")
+
+
+class Instruments:
+    """
+    timing: time every phase of every round (two clock reads per phase).
+    progress: called as progress(rounds, rounds_per_sec, eta_seconds) every
+    progress_every rounds; eta is None unless total_rounds is given.
+    One Instruments can be attached to several games; totals add up.
+    """
+    def __init__(self, timing=True, progress=None, progress_every=1000, total_rounds=None):
+        self.timing = timing
+        self.progress = progress
+        self.progress_every = progress_every
+        self.total_rounds = total_rounds
+        # Player -> its counted play_turn
+        self._play_turns = {}
+        self.reset()
+
+    def reset(self):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.decisions = {}
+        self.phase_seconds = dict.fromkeys(PHASES, 0.0)
+        self.started = None
+
+    def attach(self, game):
+        """Time the game's phases, count its rounds and its strategies' decisions."""
+        game.instruments = self
+        if self.started is None:
+            self.started = time.perf_counter()
+        if self.timing:
+            for phase, methods in PHASES.items():
+                for method in methods:
+                    setattr(game, method, self._timed(phase, getattr(game, method)))
+        for player in game.players:
+            self.decisions.setdefault(type(player.strategy).__name__, 0)
+
+    def detach(self, game):
+        """Stop instrumenting the game; its phases go back to its own methods."""
+        game.instruments = None
+        for methods in PHASES.values():
+            for method in methods:
+                vars(game).pop(method, None)
+        for player in game.players:
+            self._play_turns.pop(player, None)
+
+    def play_turn(self, player):
+        """The player's play_turn (through its decision cache, if it has one), counting decisions by strategy."""
+        counted_play_turn = self._play_turns.get(player)
+        if counted_play_turn is None:
+            cache = player.decision_cache
+            play_turn = cache.play_turn if cache is not None else player.strategy.play_turn
+            name = type(player.strategy).__name__
+
+            def counted_play_turn(*args, **kwargs):
+                self.decisions[name] = self.decisions.get(name, 0) + 1
+                return play_turn(*args, **kwargs)
+
+            self._play_turns[player] = counted_play_turn
+        return counted_play_turn
+
+    def _timed(self, phase, method):
+        clock = time.perf_counter
+
+        def timed(*args):
+            start = clock()
+            result = method(*args)
+            self.phase_seconds[phase] += clock() - start
+            return result
+
+        return timed
+
+    def round_played(self, game, reshuffled, cards_dealt):
+        """Called by Game.play_rounds after every round: count it, and report progress when it's time."""
+        counters = self.counters
+        if self.started is None:
+            self.started = time.perf_counter()
+        counters["rounds"] += 1
+        counters["reshuffles"] += reshuffled
+        counters["cards_dealt"] += cards_dealt
+        for player in game.players:
+            hands = player.hands
+            counters["hands"] += len(hands)
+            # Every split adds exactly one hand
+            counters["splits"] += len(hands) - 1
+            for hand in hands:
+                if hand.doubled:
+                    counters["doubles"] += 1
+
+        if self.progress is not None and counters["rounds"] % self.progress_every == 0:
+            self.progress(*self.rate())
+
+    def rate(self):
+        """(rounds played, rounds/sec, ETA in seconds or None)."""
+        rounds = self.counters["rounds"]
+        elapsed = time.perf_counter() - self.started if self.started is not None else 0.0
+        rounds_per_sec = rounds / elapsed if elapsed > 0 else 0.0
+        eta = None
+        if self.total_rounds is not None and rounds_per_sec > 0:
+            eta = max(self.total_rounds - rounds, 0) / rounds_per_sec
+        return rounds, rounds_per_sec, eta
+
+    def report(self):
+        """Everything measured so far, as a plain dict."""
+        rounds, rounds_per_sec, eta = self.rate()
+        phase_total = sum(self.phase_seconds.values())
+        return {
+            "counters": dict(self.counters),
+            "decisions": dict(self.decisions),
+            "rounds_per_sec": rounds_per_sec,
+            "eta": eta,
+            "phase_seconds": dict(self.phase_seconds),
+            "phase_share": {
+                phase: (seconds / phase_total if phase_total else 0.0)
+                for phase, seconds in self.phase_seconds.items()
+            },
+        }
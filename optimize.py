@@ -0,0 +1,176 @@
+"""
+Bet Ramp Optimizer
+------------------
+Searches bet ramps (BASE_BET_FRACTION and BET_RAMP steps) for a strategy's
+playing decisions, to maximize one of:
+- "ev_per_hour": expected net per hour of play
+- "growth": expected log-growth of the bankroll per hour (Kelly)
+- "ev_ror": ev_per_hour, among ramps whose risk of ruin stays under max_ror
+
+Candidates are scored on the same shuffles of a shoebank.ShoeBank, so they
+are compared on identical cards, and weak ones are dropped early by
+successive halving: every rung doubles the shoes played and keeps the best
+`keep` share of the candidates. Each shoe starts from the same bankroll.
+
+    bank = ShoeBank.load_or_create("shoes", 6, 4000, seed=1)
+    result = optimize_ramp(strats.HiLoStrategy, bank, objective="growth", shoes=4000)
+    write_strategy("tuned.py", "TunedHiLo", strats.HiLoStrategy, result["best"])
+"""
+import math
+import random
+
+from recorders import risk_of_ruin
+from shoebank import play_shoes
+from strategies import with_betting
+
+OBJECTIVES = ("ev_per_hour", "growth", "ev_ror")
+
+
+def ramp_candidates(n, seed=0, base=0.01, max_steps=3, thresholds=range(1, 7),
+                    fractions=(0.02, 0.025, 0.03, 0.04, 0.05, 0.06, 0.08, 0.1)):
+    """
+    n distinct random ramps: 1 to max_steps steps at increasing true-count
+    thresholds with increasing bankroll fractions, all above `base`.
+    Each candidate is {"base": fraction, "ramp": ((min true count, fraction), ...)}.
+    """
+    rng = random.Random(seed)
+    thresholds = list(thresholds)
+    fractions = [fraction for fraction in fractions if fraction > base]
+    candidates = {}
+    max_steps = min(max_steps, len(thresholds), len(fractions))
+    attempts = 0
+    while len(candidates) < n and attempts < 100 * n:
+        attempts += 1
+        steps = rng.randint(1, max_steps)
+        counts = sorted(rng.sample(thresholds, steps), reverse=True)
+        sizes = sorted(rng.sample(fractions, steps), reverse=True)
+        ramp = tuple(zip(counts, sizes))
+        candidates[ramp] = {"base": base, "ramp": ramp}
+    return list(candidates.values())
+
+
+def _evaluate(strategy, candidate, bank, start, shoes, seats, balance, penetration):
+    strategy = with_betting(strategy, candidate["ramp"], candidate["base"])
+    return play_shoes(strategy, bank, shoes, start, seats, balance, penetration, 0)
+
+
+def score(nets, rounds, objective, seats=1, balance=1000, rounds_per_hour=100, max_ror=0.05):
+    """Objective value of a candidate's per-shoe nets over `rounds` rounds."""
+    if not rounds:
+        return -math.inf
+    hours = rounds / rounds_per_hour
+    if objective == "growth":
+        bankroll = seats * balance
+        total = 0.0
+        for net in nets:
+            if net <= -bankroll:
+                return -math.inf
+            total += math.log1p(net / bankroll)
+        return total / hours
+    ev_per_hour = sum(nets) / hours
+    if objective == "ev_ror":
+        mean = sum(nets) / len(nets)
+        variance = sum((net - mean) ** 2 for net in nets) / (len(nets) - 1) if len(nets) > 1 else 0.0
+        if risk_of_ruin(mean, variance, seats * balance) > max_ror:
+            return -math.inf
+    return ev_per_hour
+
+
+def optimize_ramp(strategy, bank, candidates=None, objective="growth", shoes=2000, first_rung=100, keep=0.5,
+                  seats=1, balance=1000, penetration=0.60, rounds_per_hour=100, max_ror=0.05, max_workers=None):
+    """
+    Find the best bet ramp for a strategy class's playing decisions.
+    candidates defaults to ramp_candidates(32). Returns {"best": candidate,
+    "score", "feasible": False if every candidate ruins or breaks the risk cap,
+    "shoes": shoes the winner was scored on, "leaderboard":
+    [(score, shoes played, candidate), ...] best first}.
+    """
+    if objective not in OBJECTIVES:
+        raise ValueError(f"Unknown objective: {objective}")
+    if shoes > len(bank):
+        raise ValueError(f"The bank holds {len(bank)} shuffles; {shoes} needed")
+    candidates = list(candidates) if candidates is not None else ramp_candidates(32)
+
+    nets = [[] for _ in candidates]
+    rounds = [0] * len(candidates)
+    scores = [-math.inf] * len(candidates)
+    played = [0] * len(candidates)
+    alive = list(range(len(candidates)))
+    evaluated = 0
+    rung = first_rung
+
+    from concurrent.futures import ProcessPoolExecutor
+    executor = ProcessPoolExecutor(max_workers=max_workers) if max_workers != 1 else None
+    try:
+        while True:
+            rung = min(rung, shoes)
+            args = [(strategy, candidates[i], bank, evaluated, rung - evaluated, seats, balance, penetration)
+                    for i in alive]
+            if executor is None:
+                results = [_evaluate(*arg) for arg in args]
+            else:
+                results = list(executor.map(_evaluate, *zip(*args)))
+            for i, (shoe_nets, shoe_rounds) in zip(alive, results):
+                nets[i].extend(shoe_nets)
+                rounds[i] += shoe_rounds
+                played[i] = rung
+                scores[i] = score(nets[i], rounds[i], objective, seats, balance, rounds_per_hour, max_ror)
+
+            if rung >= shoes or len(alive) <= 1:
+                break
+            alive.sort(key=scores.__getitem__, reverse=True)
+            alive = alive[:max(1, math.ceil(len(alive) * keep))]
+            evaluated = rung
+            rung *= 2
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    # Candidates dropped early only have scores over fewer shoes; rank by shoes played first
+    order = sorted(range(len(candidates)), key=lambda i: (played[i], scores[i]), reverse=True)
+    best = order[0]
+    return {
+        "best": candidates[best],
+        "score": scores[best],
+        "feasible": scores[best] > -math.inf,
+        "shoes": played[best],
+        "leaderboard": [(scores[i], played[i], candidates[i]) for i in order],
+    }
+
+
+def write_strategy(path, name, strategy, candidate, note=None):
+    """
+    Write a module defining `name`, a subclass of the strategy class that bets
+    with the candidate's ramp, and return the class imported from it (so it
+    pickles, e.g. for process pools, as long as the module stays importable).
+    """
+    import importlib.util
+    import os
+    import sys
+    ramp = tuple(tuple(step) for step in candidate["ramp"])
+    lines = [
+        '"""',
+        name,
+        "-" * len(name),
+        note or f"{strategy.__name__} with a bet ramp found by optimize.py.",
+        '"""',
+        f"from {strategy.__module__} import {strategy.__name__}",
+        "",
+        "",
+        f"class {name}({strategy.__name__}):",
+        f"    BASE_BET_FRACTION = {candidate['base']!r}",
+        f"    BET_RAMP = {ramp!r}",
+    ]
+    if "PURE_DECISIONS" in vars(strategy):
+        # Games only memoize decisions of a class that declares them pure itself
+        lines.append(f"    PURE_DECISIONS = {strategy.PURE_DECISIONS!r}")
+    lines.append("")
+    with open(path, "w") as f:
+        f.write("\n".join(lines))
+
+    module_name = os.path.splitext(os.path.basename(path))[0]
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return getattr(module, name)
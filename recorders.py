@@ -0,0 +1,476 @@
+"""
+Stats Recorders
+---------------
+Where Game.play_round sends one row per finished hand.
+
+- StatsRecorder (the default) keeps every row as a dict, which is what
+  Game.get_stats() has always returned. Fine for small runs.
+- ColumnarRecorder writes rows into preallocated typed column buffers and
+  flushes them in fixed-size chunks to Parquet, Arrow IPC or CSV, so memory
+  stays flat however many rounds are played.
+- NullRecorder discards everything, for runs that only care about the
+  players' balances.
+- resultstore.StoreRecorder writes the same columns as raw fixed-width
+  arrays that reopen memory-mapped, for result sets too big to re-parse.
+- AggregateRecorder keeps no rows at all, only streaming totals and running
+  mean/variance per player, per strategy and per true-count bucket. Its
+  memory doesn't grow with rounds played, and partial results merge, so
+  aggregates from many games or workers combine into one.
+
+A recorder needs record(game, round_num, player, hand, result, dealer_score),
+get_stats() and close(). One that also has snapshot() and restore(state) is
+saved and restored along with its game (see checkpoint.py).
+"""
+import copy
+import math
+from array import array
+from counting import true_count_bucket
+
+# Column name and array typecode (None for string columns), in Game.stats order
+COLUMNS = (
+    ("round", "q"),
+    ("name", None),
+    ("balance", "d"),
+    ("hand", None),
+    ("score", "h"),
+    ("betAmount", "d"),
+    ("win", "b"),
+    ("loss", "b"),
+    ("tie", "b"),
+    ("double", "b"),
+    ("blackjack", "b"),
+    ("bust", "b"),
+    ("dealer_bust", "b"),
+    ("dealer_score", "h"),
+    ("dealer_hand", None),
+    ("decks", "d"),
+    ("running_count", "q"),
+    ("true_count", "d"),
+    # The true count the round's bets were placed at; true_count is taken after the round, so it
+    # depends on the hand's own cards
+    ("bet_true_count", "d"),
+)
+
+_ARROW_TYPES = {"q": "int64", "d": "float64", "h": "int16", "b": "int8", None: "string"}
+
+
+class StatsRecorder:
+    """Keeps one dict per hand in memory."""
+
+    def __init__(self):
+        self.rows = []
+
+    def record(self, game, round_num, player, hand, result, dealer_score):
+        score = hand.get_score()
+        self.rows.append(
+            {"round": round_num,
+            "name": player.name,
+            "balance": player.balance,
+            "hand": hand.card_names(),
+            "score": score,
+            "betAmount": hand.bet,
+
+            "win": 1 if result == "win" else 0,
+            "loss": 1 if result == "lose" else 0,
+            "tie": 1 if result == "push" else 0,
+            "double": 1 if hand.doubled else 0,
+            "blackjack": 1 if hand.paid_blackjack else 0,
+            "bust": 1 if hand.is_busted() else 0,
+
+            "dealer_bust": 1 if dealer_score > 21 else 0,
+            "dealer_score": dealer_score,
+            "dealer_hand": game.dealer.hands[0].card_names(),
+
+            "decks": game.total_cards / 52,
+            "running_count": game.running_count,
+            "true_count": round(game.get_true_count(), 3),
+            "bet_true_count": round(game.bet_true_count, 3),
+            }
+        )
+
+    def get_stats(self):
+        return self.rows
+
+    def snapshot(self):
+        return len(self.rows)
+
+    def restore(self, rows):
+        # Rows are kept in memory: a recorder in a new process only has those recorded since
+        del self.rows[rows:]
+
+    def close(self):
+        pass
+
+
+class NullRecorder:
+    """Records nothing."""
+
+    def record(self, game, round_num, player, hand, result, dealer_score):
+        pass
+
+    def get_stats(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class ColumnarRecorder:
+    """
+    Buffers rows column by column and appends them to path every chunk_size rows.
+
+    format is "parquet", "arrow" (IPC file) or "csv"; by default it comes from
+    the file extension. Parquet and Arrow need pyarrow. constants adds fixed
+    columns to every row (e.g. {"game_num": 3}). Card columns are stored as the
+    str() of the card-name list, as pandas writes them; record_cards=False
+    leaves them empty. Call close() (or use a with block) to write the tail.
+    """
+
+    def __init__(self, path, format=None, chunk_size=65536, constants=None, record_cards=True):
+        if format is None:
+            extension = str(path).rsplit(".", 1)[-1].lower()
+            format = {"parquet": "parquet", "arrow": "arrow", "ipc": "arrow", "feather": "arrow"}.get(extension, "csv")
+        if format not in ("parquet", "arrow", "csv"):
+            raise ValueError(f"Unknown format: {format}")
+
+        self.path = path
+        self.format = format
+        self.chunk_size = chunk_size
+        self.constants = dict(constants or {})
+        self.record_cards = record_cards
+
+        self.buffers = {
+            name: (array(typecode, bytes(array(typecode).itemsize * chunk_size)) if typecode else [""] * chunk_size)
+            for name, typecode in COLUMNS
+        }
+        self.size = 0
+        self.rows_written = 0
+        self._writer = None
+        self._file = None
+
+    def record(self, game, round_num, player, hand, result, dealer_score):
+        i = self.size
+        buffers = self.buffers
+        score = hand.get_score()
+        buffers["round"][i] = round_num
+        buffers["name"][i] = player.name
+        buffers["balance"][i] = player.balance
+        buffers["score"][i] = score
+        buffers["betAmount"][i] = hand.bet
+        buffers["win"][i] = result == "win"
+        buffers["loss"][i] = result == "lose"
+        buffers["tie"][i] = result == "push"
+        buffers["double"][i] = hand.doubled
+        buffers["blackjack"][i] = hand.paid_blackjack
+        buffers["bust"][i] = hand.is_busted()
+        buffers["dealer_bust"][i] = dealer_score > 21
+        buffers["dealer_score"][i] = dealer_score
+        buffers["decks"][i] = game.total_cards / 52
+        buffers["running_count"][i] = game.running_count
+        buffers["true_count"][i] = round(game.get_true_count(), 3)
+        buffers["bet_true_count"][i] = round(game.bet_true_count, 3)
+        if self.record_cards:
+            buffers["hand"][i] = str(hand.card_names())
+            buffers["dealer_hand"][i] = str(game.dealer.hands[0].card_names())
+
+        self.size = i + 1
+        if self.size == self.chunk_size:
+            self.flush()
+
+    def _row(self, i):
+        row = {name: self.buffers[name][i] for name, _ in COLUMNS}
+        row.update(self.constants)
+        return row
+
+    def get_stats(self):
+        """Rows still in memory; only complete if nothing has been flushed yet."""
+        if self.rows_written:
+            raise ValueError(f"{self.rows_written} rows were already flushed to {self.path}; read them from there")
+        return [self._row(i) for i in range(self.size)]
+
+    def flush(self):
+        if self.size == 0:
+            return
+        if self.format == "csv":
+            self._flush_csv()
+        else:
+            self._flush_arrow()
+        self.rows_written += self.size
+        self.size = 0
+
+    def _flush_csv(self):
+        if self._writer is None:
+            import csv
+            self._file = open(self.path, "w", newline="")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow([name for name, _ in COLUMNS] + list(self.constants))
+        constants = list(self.constants.values())
+        columns = [self.buffers[name] for name, _ in COLUMNS]
+        self._writer.writerows(
+            [column[i] for column in columns] + constants for i in range(self.size)
+        )
+
+    def _flush_arrow(self):
+        import numpy as np
+        import pyarrow as pa
+
+        arrays = []
+        fields = []
+        for name, typecode in COLUMNS:
+            buffer = self.buffers[name]
+            if typecode is None:
+                arrays.append(pa.array(buffer[:self.size], type=pa.string()))
+            else:
+                arrays.append(pa.array(np.frombuffer(buffer, dtype=_ARROW_TYPES[typecode])[:self.size]))
+            fields.append(pa.field(name, getattr(pa, _ARROW_TYPES[typecode])()))
+        for name, value in self.constants.items():
+            column = pa.array([value] * self.size)
+            arrays.append(column)
+            fields.append(pa.field(name, column.type))
+        batch = pa.RecordBatch.from_arrays(arrays, schema=pa.schema(fields))
+
+        if self._writer is None:
+            if self.format == "parquet":
+                import pyarrow.parquet as pq
+                self._writer = pq.ParquetWriter(self.path, batch.schema)
+            else:
+                self._writer = pa.ipc.new_file(self.path, batch.schema)
+        self._writer.write_batch(batch)
+
+    def close(self):
+        self.flush()
+        if self._writer is not None and self.format != "csv":
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+        self._writer = None
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def risk_of_ruin(mean, variance, bankroll):
+    """
+    Chance of ever losing `bankroll` when each hand nets `mean` on average with
+    the given variance (diffusion approximation, flat bets).
+    """
+    if bankroll <= 0:
+        return 1.0
+    if mean <= 0:
+        return 1.0
+    if variance <= 0:
+        return 0.0
+    return math.exp(-2 * mean * bankroll / variance)
+
+
+class RunningStats:
+    """Count, mean and variance of a stream (Welford); merge() combines two streams exactly."""
+    __slots__ = ("n", "mean", "m2")
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if n == 0:
+            return
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta * delta * self.n * other.n / n
+        self.n = n
+
+    @property
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def sem(self):
+        """Standard error of the mean."""
+        return math.sqrt(self.variance / self.n) if self.n > 1 else 0.0
+
+
+class HandTally:
+    """
+    Outcome counts of a group of hands, plus running stats of the net result
+    in money (net) and in units of the hand's initial bet (units).
+    """
+    __slots__ = ("wins", "losses", "pushes", "blackjacks", "busts", "doubles", "wagered", "net", "units")
+    COUNTS = ("wins", "losses", "pushes", "blackjacks", "busts", "doubles")
+    RATES = tuple(zip(COUNTS, ("win_rate", "loss_rate", "push_rate", "blackjack_rate", "bust_rate", "double_rate")))
+
+    def __init__(self):
+        self.wins = self.losses = self.pushes = 0
+        self.blackjacks = self.busts = self.doubles = 0
+        self.wagered = 0.0
+        self.net = RunningStats()
+        self.units = RunningStats()
+
+    def merge(self, other):
+        for name in self.COUNTS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        self.wagered += other.wagered
+        self.net.merge(other.net)
+        self.units.merge(other.units)
+
+    def summary(self):
+        hands = self.net.n
+        row = {
+            "hands": hands,
+            "ev": self.net.mean,
+            "ev_std": self.net.std,
+            "ev_sem": self.net.sem,
+            "ev_units": self.units.mean,
+            "std_units": self.units.std,
+            "wagered": self.wagered,
+        }
+        for name, rate in self.RATES:
+            row[rate] = getattr(self, name) / hands if hands else 0.0
+        return row
+
+
+class BankrollTally:
+    """One player's balance path: where it started, its peak and its deepest drawdown."""
+    __slots__ = ("strategy", "start", "balance", "peak", "low", "max_drawdown")
+
+    def __init__(self, strategy, start):
+        self.strategy = strategy
+        self.start = self.balance = self.peak = self.low = start
+        self.max_drawdown = 0.0
+
+    def update(self, balance):
+        self.balance = balance
+        if balance > self.peak:
+            self.peak = balance
+        elif self.peak - balance > self.max_drawdown:
+            self.max_drawdown = self.peak - balance
+        if balance < self.low:
+            self.low = balance
+
+
+class AggregateRecorder:
+    """
+    Streaming per-group statistics instead of per-hand rows.
+
+    Groups are players (by name), strategies (by class name) and true-count
+    buckets (counting.true_count_bucket of the count the round's bets were
+    placed at). get_stats() returns one summary row per group; merge() folds
+    in another AggregateRecorder, e.g. one per game or worker.
+    When merging games that reuse player names, pass a distinct prefix to each
+    recorder so the bankroll paths stay apart.
+    """
+
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.players = {}
+        self.strategies = {}
+        self.counts = {}
+        self.bankrolls = {}
+        self._round_net = {}
+
+    def record(self, game, round_num, player, hand, result, dealer_score):
+        name = self.prefix + player.name
+        strategy = type(player.strategy).__name__
+        bucket = true_count_bucket(game.bet_true_count)
+        net = hand.net
+        initial_bet = hand.bet / 2 if hand.doubled else hand.bet
+
+        win = result == "win"
+        loss = result == "lose"
+        push = result == "push"
+        blackjack = hand.paid_blackjack
+        bust = hand.is_busted()
+        for groups, key in ((self.players, name), (self.strategies, strategy), (self.counts, bucket)):
+            tally = groups.get(key)
+            if tally is None:
+                tally = groups[key] = HandTally()
+            tally.wins += win
+            tally.losses += loss
+            tally.pushes += push
+            tally.blackjacks += blackjack
+            tally.busts += bust
+            tally.doubles += hand.doubled
+            tally.wagered += hand.bet
+            tally.net.add(net)
+            if initial_bet:
+                tally.units.add(net / initial_bet)
+
+        # player.balance is already settled for the whole round, so the
+        # bankroll path moves once per round, on the player's last hand
+        round_net = self._round_net.get(name, 0) + net
+        if hand is not player.hands[-1]:
+            self._round_net[name] = round_net
+            return
+        self._round_net[name] = 0
+        bankroll = self.bankrolls.get(name)
+        if bankroll is None:
+            bankroll = self.bankrolls[name] = BankrollTally(strategy, player.balance - round_net)
+        bankroll.update(player.balance)
+
+    def snapshot(self):
+        return copy.deepcopy(self.__dict__)
+
+    def restore(self, state):
+        self.__dict__.update(copy.deepcopy(state))
+
+    def merge(self, other):
+        for mine, theirs in ((self.players, other.players), (self.strategies, other.strategies), (self.counts, other.counts)):
+            for key, tally in theirs.items():
+                mine.setdefault(key, HandTally()).merge(tally)
+        for name, bankroll in other.bankrolls.items():
+            if name in self.bankrolls:
+                raise ValueError(f"Both aggregates followed a bankroll named {name!r}; give each a distinct prefix")
+            self.bankrolls[name] = bankroll
+        return self
+
+    def get_stats(self):
+        rows = []
+        for name, tally in self.players.items():
+            bankroll = self.bankrolls[name]
+            row = {"group": "player", "key": name, "strategy": bankroll.strategy}
+            row.update(tally.summary())
+            row.update({
+                "start_balance": bankroll.start,
+                "balance": bankroll.balance,
+                "peak_balance": bankroll.peak,
+                "max_drawdown": bankroll.max_drawdown,
+                "ruined": bankroll.low <= 0,
+                "risk_of_ruin": risk_of_ruin(tally.net.mean, tally.net.variance, bankroll.start),
+            })
+            rows.append(row)
+        for strategy, tally in self.strategies.items():
+            bankrolls = [b for b in self.bankrolls.values() if b.strategy == strategy]
+            row = {"group": "strategy", "key": strategy, "strategy": strategy}
+            row.update(tally.summary())
+            start = sum(b.start for b in bankrolls) / len(bankrolls) if bankrolls else 0.0
+            row.update({
+                "players": len(bankrolls),
+                "in_profit": sum(b.balance > b.start for b in bankrolls) / len(bankrolls) if bankrolls else 0.0,
+                "max_drawdown": max((b.max_drawdown for b in bankrolls), default=0.0),
+                "ruined": sum(b.low <= 0 for b in bankrolls),
+                "risk_of_ruin": risk_of_ruin(tally.net.mean, tally.net.variance, start),
+            })
+            rows.append(row)
+        for bucket in sorted(self.counts):
+            row = {"group": "true_count", "key": bucket}
+            row.update(self.counts[bucket].summary())
+            rows.append(row)
+        return rows
+
+    def close(self):
+        pass
@@ -0,0 +1,520 @@
+"""
+Result Store
+------------
+Binary, memory-mappable per-hand results, in place of multi-hundred-MB CSVs.
+
+A result set is a directory:
+- meta.json: row count, column types, player names, each player's strategy,
+  the row range and deck count of every game, the engine version and any
+  caller metadata (seeds, session settings, ...)
+- <column>.bin: one raw fixed-width array per column, in row order
+
+Columns are the recorders.COLUMNS (Game.stats) columns plus "game". Player
+names are stored as codes into meta["names"], and the hand and dealer_hand
+columns as CARD_SLOTS card ints per row, padded with NO_CARD, instead of
+stringified lists.
+
+Rows of a game are contiguous and, as the engine writes them, ordered by
+round, so selecting games or a round range is slicing, not filtering (a game
+whose rounds were appended out of order is filtered instead). Opening a set only reads meta.json;
+columns are memory-mapped on first use, so reopening one of any size takes
+milliseconds.
+
+    with StoreRecorder("HiLo_100G.bjr", meta={"seed": 42}) as recorder:
+        for game_num in range(100):
+            recorder.start_game(game_num)
+            Game(6, players, seed=game_num, recorder=recorder).play_rounds(500)
+
+    results = ResultStore.open("HiLo_100G.bjr")
+    df = results.to_pandas(["game", "round", "name", "balance"], games=range(10))
+
+Writing needs nothing beyond the standard library; reading needs NumPy
+(and pandas for to_pandas).
+"""
+import json
+import os
+import sys
+from array import array
+
+from blackjack import ENGINE_VERSION, card_name
+from recorders import COLUMNS
+
+FORMAT = "bjresults"
+# 2 added bet_true_count; sets of version 1 open without it
+FORMAT_VERSION = 2
+META_FILE = "meta.json"
+
+# Cards stored per hand; no hand reaches 21 with more than 11 cards, so 12 holds a busting one too
+CARD_SLOTS = 12
+NO_CARD = 255
+CARD_COLUMNS = ("hand", "dealer_hand")
+
+# Column name and array typecode, in file order; names are uint16 codes, cards are CARD_SLOTS bytes per row
+STORE_COLUMNS = (("game", "i"),) + tuple(
+    (name, "H" if name == "name" else "B" if name in CARD_COLUMNS else typecode)
+    for name, typecode in COLUMNS
+)
+
+_PAD = bytes([NO_CARD]) * CARD_SLOTS
+
+
+def _dtype(typecode):
+    """NumPy dtype string of an array typecode, in this machine's byte order."""
+    kind = "f" if typecode in "fd" else "u" if typecode.isupper() else "i"
+    order = "<" if sys.byteorder == "little" else ">"
+    return f"{order}{kind}{array(typecode).itemsize}"
+
+
+def column_path(path, name):
+    return os.path.join(path, f"{name}.bin")
+
+
+class StoreRecorder:
+    """
+    Recorder that writes a result set at path (a directory, created or
+    overwritten). Rows are buffered column by column and appended every
+    chunk_size rows; meta.json is rewritten after every flush, so an
+    interrupted run leaves a readable set of the rows flushed so far.
+
+    Rows are filed under the current game number: call start_game(n) before
+    each game (games must not be revisited). meta is stored as meta["meta"].
+    record_cards=False stores every card slot as NO_CARD.
+
+    resume=True carries on the set already at path instead of overwriting it
+    (meta and game_num are then ignored); a Game.restore from a checkpoint
+    then cuts it back to the checkpoint's rows (see checkpoint.py).
+    """
+
+    def __init__(self, path, game_num=0, chunk_size=65536, meta=None, record_cards=True, resume=False):
+        import uuid
+        self.path = path
+        self.chunk_size = chunk_size
+        self.record_cards = record_cards
+        os.makedirs(path, exist_ok=True)
+
+        self.meta = {
+            "format": FORMAT,
+            "version": FORMAT_VERSION,
+            # Tells apart result sets later written to the same path (e.g. for caches kept beside them)
+            "id": uuid.uuid4().hex,
+            "engine": ENGINE_VERSION,
+            "rows": 0,
+            "columns": {name: [_dtype(typecode), CARD_SLOTS if name in CARD_COLUMNS else 1]
+                        for name, typecode in STORE_COLUMNS},
+            "names": [],
+            "strategies": {},
+            "games": {},
+            "meta": dict(meta or {}),
+        }
+        self._name_codes = {}
+        self.game_num = None
+        resume = resume and os.path.exists(os.path.join(path, META_FILE))
+        if resume:
+            with open(os.path.join(path, META_FILE)) as f:
+                self.meta = json.load(f)
+            self._name_codes = {name: code for code, name in enumerate(self.meta["names"])}
+        self._files = {name: open(column_path(path, name), "ab" if resume else "wb") for name, _ in STORE_COLUMNS}
+        if resume:
+            # Drop whatever a writer that died mid-flush left past meta's rows
+            self._truncate(self.meta["rows"])
+        self.buffers = {
+            name: (bytearray(CARD_SLOTS * chunk_size) if name in CARD_COLUMNS
+                   else array(typecode, bytes(array(typecode).itemsize * chunk_size)))
+            for name, typecode in STORE_COLUMNS
+        }
+        self.size = 0
+        if self.meta["games"]:
+            # Resumed: carry on the last game written
+            self.game_num = int(max(self.meta["games"], key=lambda n: self.meta["games"][n]["start"]))
+            self._game = self.meta["games"][str(self.game_num)]
+        else:
+            self.start_game(game_num)
+
+    def start_game(self, game_num):
+        """File the following rows under game_num."""
+        if game_num == self.game_num:
+            return
+        if str(game_num) in self.meta["games"]:
+            raise ValueError(f"Game {game_num} already has rows in {self.path}")
+        row = self.meta["rows"] + self.size
+        if self.game_num is not None:
+            self._game["stop"] = row
+            if self._game["start"] == row:
+                # Nothing was recorded under it (e.g. the default game 0 of a set that starts later)
+                del self.meta["games"][str(self.game_num)]
+        self.game_num = game_num
+        self._game = self.meta["games"][str(game_num)] = {"start": row, "stop": row, "decks": None}
+
+    def record(self, game, round_num, player, hand, result, dealer_score):
+        i = self.size
+        buffers = self.buffers
+        name_code = self._name_codes.get(player.name)
+        if name_code is None:
+            name_code = self._new_name(player.name, type(player.strategy).__name__)
+        buffers["game"][i] = self.game_num
+        buffers["round"][i] = round_num
+        buffers["name"][i] = name_code
+        buffers["balance"][i] = player.balance
+        buffers["score"][i] = hand.get_score()
+        buffers["betAmount"][i] = hand.bet
+        buffers["win"][i] = result == "win"
+        buffers["loss"][i] = result == "lose"
+        buffers["tie"][i] = result == "push"
+        buffers["double"][i] = hand.doubled
+        buffers["blackjack"][i] = hand.paid_blackjack
+        buffers["bust"][i] = hand.is_busted()
+        buffers["dealer_bust"][i] = dealer_score > 21
+        buffers["dealer_score"][i] = dealer_score
+        buffers["decks"][i] = game.total_cards / 52
+        buffers["running_count"][i] = game.running_count
+        buffers["true_count"][i] = round(game.get_true_count(), 3)
+        buffers["bet_true_count"][i] = round(game.bet_true_count, 3)
+
+        offset = i * CARD_SLOTS
+        for name, cards in (("hand", hand.cards), ("dealer_hand", game.dealer.hands[0].cards)):
+            buffer = buffers[name]
+            buffer[offset:offset + CARD_SLOTS] = _PAD
+            if self.record_cards:
+                cards = cards[:CARD_SLOTS]
+                buffer[offset:offset + len(cards)] = bytes(cards)
+
+        if self._game["decks"] is None:
+            self._game["decks"] = game.total_cards // 52
+        self.size = i + 1
+        if self.size == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        size = self.size
+        if size:
+            for name, _ in STORE_COLUMNS:
+                buffer = memoryview(self.buffers[name])
+                width = CARD_SLOTS if name in CARD_COLUMNS else 1
+                self._files[name].write(buffer[:size * width])
+                self._files[name].flush()
+            self.meta["rows"] += size
+            self._game["stop"] = self.meta["rows"]
+            self.size = 0
+        self._write_meta()
+
+    def append(self, game_num, columns, names, decks=None):
+        """
+        Bulk-append rows of one game (continuing the current game if it's the
+        same one): columns maps every stored column but game to an array of
+        its values (name as codes into `names`, cards as n x CARD_SLOTS).
+        bet_true_count may be left out (rows recorded before it was), and is
+        then NaN. Needs NumPy.
+        """
+        import numpy as np
+        self.flush()
+        self.start_game(game_num)
+        codes = np.array([self._name_codes[name] if name in self._name_codes else self._new_name(name)
+                          for name in names], dtype=np.int64)
+        n = None
+        for name, typecode in STORE_COLUMNS:
+            if name == "game":
+                continue
+            if name == "bet_true_count" and name not in columns:
+                continue  # filled in below, once the row count is known
+            values = np.asarray(columns[name])
+            if name == "name":
+                values = codes[values]
+            values = np.ascontiguousarray(values, dtype=_dtype(typecode))
+            if n is None:
+                n = len(values)
+            elif len(values) != n:
+                raise ValueError(f"Column {name} has {len(values)} rows, not {n}")
+            self._files[name].write(values.tobytes())
+        if "bet_true_count" not in columns:
+            self._files["bet_true_count"].write(np.full(n or 0, np.nan, dtype=_dtype("d")).tobytes())
+        self._files["game"].write(np.full(n or 0, game_num, dtype=_dtype("i")).tobytes())
+        for f in self._files.values():
+            f.flush()
+        self.meta["rows"] += n or 0
+        self._game["stop"] = self.meta["rows"]
+        if decks is not None:
+            self._game["decks"] = decks
+        self._write_meta()
+
+    def extend(self, store):
+        """Append every game of another result set (a ResultStore), in row order. Needs NumPy."""
+        columns = [name for name, _ in STORE_COLUMNS if name != "game" and name in store.meta["columns"]]
+        for game_num in sorted(store.games, key=lambda game_num: store.games[game_num]["start"]):
+            self.append(game_num, store.select(columns, games=game_num), store.names, store.games[game_num]["decks"])
+        for name, strategy in store.strategies.items():
+            self.meta["strategies"].setdefault(name, strategy)
+        self._write_meta()
+
+    def snapshot(self):
+        """Flush, and return the set's meta as it stands (what restore cuts the set back to)."""
+        self.flush()
+        return {"game_num": self.game_num, "meta": json.loads(json.dumps(self.meta))}
+
+    def restore(self, state):
+        """Drop every row written since the snapshot, and what's buffered."""
+        meta = json.loads(json.dumps(state["meta"]))
+        if meta["id"] != self.meta["id"]:
+            raise ValueError(f"Snapshot is of a different result set than {self.path}")
+        self.size = 0
+        self._truncate(meta["rows"])
+        self.meta = meta
+        self._name_codes = {name: code for code, name in enumerate(meta["names"])}
+        self.game_num = state["game_num"]
+        self._game = meta["games"][str(self.game_num)]
+        self._write_meta()
+
+    def _truncate(self, rows):
+        """Cut every column file back to its first rows rows."""
+        for name, typecode in STORE_COLUMNS:
+            width = CARD_SLOTS if name in CARD_COLUMNS else array(typecode).itemsize
+            f = self._files[name]
+            f.flush()
+            f.truncate(rows * width)
+            f.seek(0, os.SEEK_END)
+
+    def _new_name(self, name, strategy=None):
+        code = len(self.meta["names"])
+        self._name_codes[name] = code
+        self.meta["names"].append(name)
+        if strategy is not None:
+            self.meta["strategies"][name] = strategy
+        return code
+
+    def _write_meta(self):
+        path = os.path.join(self.path, META_FILE)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, path)
+
+    def get_stats(self):
+        """Flush and open the result set as written so far."""
+        self.flush()
+        return ResultStore.open(self.path)
+
+    def close(self):
+        if self._files is None:
+            return
+        self.flush()
+        for f in self._files.values():
+            f.close()
+        self._files = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ResultStore:
+    """
+    A result set opened read-only. Columns are NumPy views of memory-mapped
+    files; a selection that is one contiguous row range stays a view,
+    anything else is copied.
+    """
+
+    def __init__(self, path, meta):
+        self.path = path
+        self.meta = meta
+        self.names = meta["names"]
+        self.strategies = meta["strategies"]
+        self.games = {int(game_num): info for game_num, info in meta["games"].items()}
+        self._columns = {}
+        self._rounds_sorted = {}
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT:
+            raise ValueError(f"{path} is not a result store")
+        if meta["version"] > FORMAT_VERSION:
+            raise ValueError(f"{path} is format version {meta['version']}; this reader knows {FORMAT_VERSION}")
+        return cls(path, meta)
+
+    def __len__(self):
+        return self.meta["rows"]
+
+    @property
+    def columns(self):
+        return list(self.meta["columns"])
+
+    def column(self, name):
+        """Whole column as a memory-mapped array (n_rows x CARD_SLOTS for card columns)."""
+        column = self._columns.get(name)
+        if column is None:
+            import numpy as np
+            dtype, width = self.meta["columns"][name]
+            shape = (len(self), width) if width > 1 else (len(self),)
+            if len(self):
+                # Files can run past meta's row count if a writer died mid-flush; only mapped rows count
+                column = np.memmap(column_path(self.path, name), dtype=dtype, mode="r", shape=shape)
+            else:
+                column = np.empty(shape, dtype=dtype)
+            self._columns[name] = column
+        return column
+
+    def row_ranges(self, games=None, rounds=None):
+        """
+        [(start, stop), ...] row ranges of the selected games (an int or an
+        iterable; None for all) restricted to rounds in [first, last)
+        (a range, or a (first, last) pair; None for all). A game whose
+        rounds aren't in order gives a range per run of matching rows.
+        """
+        if games is None:
+            if rounds is None:
+                return [(0, len(self))]
+            games = sorted(self.games, key=lambda game_num: self.games[game_num]["start"])
+        elif isinstance(games, int):
+            games = [games]
+        if rounds is not None:
+            first, last = (rounds.start, rounds.stop) if isinstance(rounds, range) else rounds
+            round_column = self.column("round")
+
+        ranges = []
+        for game_num in games:
+            info = self.games.get(game_num)
+            if info is None:
+                raise KeyError(f"No game {game_num} in {self.path}")
+            start, stop = info["start"], min(info["stop"], len(self))
+            if rounds is None:
+                game_ranges = [(start, stop)]
+            else:
+                game_ranges = self._round_ranges(game_num, round_column[start:stop], start, first, last)
+            for start, stop in game_ranges:
+                if start >= stop:
+                    continue
+                if ranges and ranges[-1][1] == start:
+                    ranges[-1] = (ranges[-1][0], stop)
+                else:
+                    ranges.append((start, stop))
+        return ranges
+
+    def _round_ranges(self, game_num, game_rounds, offset, first, last):
+        """Row ranges of one game's rows (game_rounds, from row offset) with first <= round < last."""
+        import numpy as np
+        is_sorted = self._rounds_sorted.get(game_num)
+        if is_sorted is None:
+            is_sorted = self._rounds_sorted[game_num] = bool(np.all(game_rounds[1:] >= game_rounds[:-1]))
+        if is_sorted:
+            return [(offset + int(game_rounds.searchsorted(first, "left")),
+                     offset + int(game_rounds.searchsorted(last, "left")))]
+        # Out of order (e.g. appended so): filter, and hand back the runs of matching rows
+        matches = np.flatnonzero((game_rounds >= first) & (game_rounds < last))
+        if not len(matches):
+            return []
+        breaks = np.flatnonzero(np.diff(matches) > 1) + 1
+        starts = matches[np.concatenate(([0], breaks))]
+        stops = matches[np.concatenate((breaks - 1, [len(matches) - 1]))] + 1
+        return [(offset + int(start), offset + int(stop)) for start, stop in zip(starts, stops)]
+
+    def select(self, columns=None, games=None, rounds=None):
+        """{column name: array} for the selected rows (see row_ranges)."""
+        import numpy as np
+        ranges = self.row_ranges(games, rounds)
+        selected = {}
+        for name in (columns if columns is not None else self.columns):
+            column = self.column(name)
+            if len(ranges) == 1:
+                start, stop = ranges[0]
+                selected[name] = column[start:stop]
+            elif ranges:
+                selected[name] = np.concatenate([column[start:stop] for start, stop in ranges])
+            else:
+                selected[name] = column[:0]
+        return selected
+
+    def to_pandas(self, columns=None, games=None, rounds=None):
+        """
+        DataFrame of the selected rows. name becomes a categorical, and
+        "strategy" (each player's strategy class, also categorical) can be
+        asked for as a column. Card columns, if asked for, hold lists of card
+        names like Game.get_stats(); they're left out by default since they
+        are the one slow column.
+        """
+        import numpy as np
+        import pandas as pd
+
+        if columns is None:
+            columns = [name for name in self.columns if name not in CARD_COLUMNS]
+        wanted = list(columns)
+        stored = [name for name in wanted if name != "strategy"]
+        if "strategy" in wanted and "name" not in stored:
+            stored.append("name")
+        selected = self.select(stored, games, rounds)
+
+        data = {}
+        for name in wanted:
+            if name == "name":
+                data[name] = pd.Categorical.from_codes(selected["name"], self.names)
+            elif name == "strategy":
+                strategies = [self.strategies.get(player, "unknown") for player in self.names]
+                categories = sorted(set(strategies))
+                codes = np.array([categories.index(strategy) for strategy in strategies], dtype=np.int16)
+                data[name] = pd.Categorical.from_codes(codes[selected["name"]], categories)
+            elif name in CARD_COLUMNS:
+                data[name] = [card_names(row) for row in selected[name]]
+            else:
+                data[name] = selected[name]
+        return pd.DataFrame(data, copy=False)
+
+
+def card_names(codes):
+    """Card names of one row of a card column."""
+    return [card_name(int(card)) for card in codes if card != NO_CARD]
+
+
+def convert_csv(csv_path, path, chunk_rows=1_000_000, meta=None, cards=True):
+    """
+    Convert a CSV of Game.get_stats() rows (like the notebooks' outputs) into
+    a result set at path, chunk_rows rows at a time. Games come from a
+    game_num column if there is one (each game's rows must be contiguous);
+    otherwise a new game starts wherever the round goes back or the deck
+    count changes (as when a notebook concatenated several sessions), and
+    games are numbered from 0. cards=False skips parsing the card lists.
+    Returns the opened ResultStore.
+    """
+    import numpy as np
+    import pandas as pd
+
+    card_codes = {card_name(card): card for card in range(52)}
+
+    def parse_cards(cells):
+        parsed = np.full((len(cells), CARD_SLOTS), NO_CARD, dtype=np.uint8)
+        if cards:
+            for i, cell in enumerate(cells):
+                if not isinstance(cell, str):
+                    continue  # written with record_cards=False
+                names = [name.strip(" '\"") for name in cell.strip("[]").split(",") if name.strip()]
+                parsed[i, :len(names)] = [card_codes[name] for name in names[:CARD_SLOTS]]
+        return parsed
+
+    # Last game number, round and deck count seen, carried across chunks
+    game, last_round, last_decks = 0, None, None
+    with StoreRecorder(path, meta=meta) as recorder:
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_rows):
+            if "game_num" in chunk:
+                games = chunk["game_num"].to_numpy()
+            else:
+                rounds, decks = chunk["round"].to_numpy(), chunk["decks"].to_numpy()
+                new_game = np.zeros(len(chunk), dtype=bool)
+                new_game[1:] = (rounds[1:] < rounds[:-1]) | (decks[1:] != decks[:-1])
+                if last_round is not None:
+                    new_game[0] = rounds[0] < last_round or decks[0] != last_decks
+                games = game + np.cumsum(new_game)
+                game, last_round, last_decks = int(games[-1]), rounds[-1], decks[-1]
+            bounds = (np.flatnonzero(np.diff(games)) + 1).tolist()
+            for start, stop in zip([0] + bounds, bounds + [len(chunk)]):
+                rows = chunk.iloc[start:stop]
+                names = rows["name"].astype("category")
+                columns = {
+                    name: rows[name].to_numpy() for name, _ in COLUMNS
+                    if name not in CARD_COLUMNS and name != "name" and name in rows
+                }
+                columns["name"] = names.cat.codes.to_numpy()
+                for name in CARD_COLUMNS:
+                    columns[name] = parse_cards(rows[name].to_numpy())
+                # A game split across chunks just carries on
+                recorder.append(int(games[start]), columns, list(names.cat.categories), int(rows["decks"].iloc[0]))
+    return ResultStore.open(path)
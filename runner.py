@@ -0,0 +1,303 @@
+"""
+Session Runner
+--------------
+Runs a simulation session (several independent games of many rounds) across
+a process pool.
+
+Every game gets its own seed derived from the session's master seed, so a
+session reproduces exactly no matter how many workers play it, and results
+are merged back in game order.
+
+store_session() plays the games into a memory-mapped resultstore result
+set instead of a list of rows.
+
+distributed.py spreads the same games over worker processes on other
+machines.
+
+importance.py estimates per-true-count EVs at the rare high counts without
+playing whole shoes to reach them.
+
+run_sequential() plays games until the EV estimates are as precise as asked
+for, instead of a fixed number of games.
+
+Example:
+    spec = SessionSpec([strats.HiLoStrategy] * 6, number_of_decks=6, rounds=500, games=100, seed=42)
+    results = run_session(spec)
+    pd.DataFrame(results).to_csv("HiLo_100G500R6D6P.csv", index=False)
+"""
+import hashlib
+import math
+from blackjack import Game, Player
+from recorders import AggregateRecorder
+
+
+def derive_seed(master_seed, game_num):
+    """Deterministic 64-bit seed for one game of a session."""
+    digest = hashlib.sha256(f"{master_seed}:{game_num}".encode()).digest()
+    return int.from_bytes(digest[:8], "little")
+
+
+class SessionSpec:
+    """
+    What to simulate: one strategy class per seat, table rules and session size.
+    names defaults to "<StrategyClass> <seat number>".
+    """
+    def __init__(self, strategies, number_of_decks=6, rounds=500, games=1, seed=0, balance=1000, names=None,
+                 penetration=0.60):
+        self.strategies = list(strategies)
+        self.number_of_decks = number_of_decks
+        self.penetration = penetration
+        self.rounds = rounds
+        self.games = games
+        self.seed = seed
+        self.balance = balance
+        self.names = list(names) if names is not None else [
+            f"{strategy.__name__} {seat + 1}" for seat, strategy in enumerate(self.strategies)
+        ]
+        if len(self.names) != len(self.strategies):
+            raise ValueError("Need exactly one name per seat")
+
+    def make_players(self):
+        return [
+            Player(name=name, strategy=strategy(), balance=self.balance)
+            for name, strategy in zip(self.names, self.strategies)
+        ]
+
+    def make_game(self, game_num, recorder=None):
+        return Game(self.number_of_decks, self.make_players(), seed=derive_seed(self.seed, game_num), recorder=recorder,
+                    penetration=self.penetration)
+
+
+def run_game(spec, game_num):
+    """Play one game of the session and return its stats rows tagged with game_num."""
+    game = spec.make_game(game_num)
+    game.play_rounds(spec.rounds)
+    stats = game.get_stats()
+    for row in stats:
+        row["game_num"] = game_num
+    return stats
+
+
+def aggregate_game(spec, game_num):
+    """Play one game of the session into an AggregateRecorder (player names prefixed "<game_num>:")."""
+    recorder = AggregateRecorder(prefix=f"{game_num}:")
+    game = spec.make_game(game_num, recorder=recorder)
+    game.play_rounds(spec.rounds)
+    return recorder
+
+
+def session_meta(spec):
+    """The session settings and every game's seed, as stored in a result set's metadata."""
+    return {
+        "strategies": [strategy.__name__ for strategy in spec.strategies],
+        "decks": spec.number_of_decks,
+        "penetration": spec.penetration,
+        "rounds": spec.rounds,
+        "games": spec.games,
+        "seed": spec.seed,
+        "balance": spec.balance,
+        "game_seeds": {game_num: derive_seed(spec.seed, game_num) for game_num in range(spec.games)},
+    }
+
+
+def store_session(spec, path, chunk_size=65536, record_cards=True, game_nums=None, max_workers=1,
+                  games_per_task=1):
+    """
+    Play the session's games (or just game_nums) in order into a resultstore
+    result set at path (the session settings and every game's seed go in its
+    metadata) and return it opened. With max_workers other than 1, every
+    games_per_task games are played by a process pool into a shard of their
+    own beside path, and the shards are appended in order (which needs NumPy).
+    """
+    from resultstore import ResultStore, StoreRecorder
+    if game_nums is None:
+        game_nums = range(spec.games)
+    with StoreRecorder(path, chunk_size=chunk_size, meta=session_meta(spec), record_cards=record_cards) as recorder:
+        if max_workers == 1:
+            for game_num in game_nums:
+                recorder.start_game(game_num)
+                spec.make_game(game_num, recorder=recorder).play_rounds(spec.rounds)
+            return recorder.get_stats()
+
+        import os
+        import shutil
+        import tempfile
+        from concurrent.futures import ProcessPoolExecutor
+        game_nums = list(game_nums)
+        chunks = [game_nums[i:i + games_per_task] for i in range(0, len(game_nums), games_per_task)]
+        shard_root = tempfile.mkdtemp(prefix="bjshards", dir=os.path.dirname(os.path.abspath(path)))
+        shards = [os.path.join(shard_root, str(i)) for i in range(len(chunks))]
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                for shard in executor.map(_store_games, [spec] * len(chunks), chunks, shards,
+                                          [chunk_size] * len(chunks), [record_cards] * len(chunks)):
+                    recorder.extend(ResultStore.open(shard))
+                    shutil.rmtree(shard)
+        finally:
+            shutil.rmtree(shard_root, ignore_errors=True)
+        return recorder.get_stats()
+
+
+def _store_games(spec, game_nums, path, chunk_size, record_cards):
+    store_session(spec, path, chunk_size, record_cards, game_nums)
+    return path
+
+
+def _run_games(spec, game_nums):
+    return [run_game(spec, game_num) for game_num in game_nums]
+
+
+def aggregate_games(spec, game_nums):
+    """Play the given games of the session into one merged AggregateRecorder."""
+    aggregate = AggregateRecorder()
+    for game_num in game_nums:
+        aggregate.merge(aggregate_game(spec, game_num))
+    return aggregate
+
+
+def _map_chunks(function, spec, max_workers, games_per_task):
+    game_nums = list(range(spec.games))
+    chunks = [game_nums[i:i + games_per_task] for i in range(0, len(game_nums), games_per_task)]
+    if max_workers == 1:
+        return list(map(function, [spec] * len(chunks), chunks))
+    # Imported here so in-process runs (and pool workers) don't load multiprocessing's machinery
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(function, [spec] * len(chunks), chunks))
+
+
+def run_session(spec, max_workers=None, games_per_task=1):
+    """
+    Play every game of the session and return all stats rows in game order.
+    max_workers=1 plays in this process; otherwise games are spread over a
+    ProcessPoolExecutor, games_per_task at a time.
+    """
+    chunk_results = _map_chunks(_run_games, spec, max_workers, games_per_task)
+    return [row for chunk in chunk_results for stats in chunk for row in stats]
+
+
+def run_aggregate(spec, max_workers=None, games_per_task=1):
+    """
+    Like run_session, but every game keeps only streaming aggregates and the
+    merged AggregateRecorder comes back; memory doesn't grow with rounds.
+    """
+    aggregate = AggregateRecorder()
+    for partial in _map_chunks(aggregate_games, spec, max_workers, games_per_task):
+        aggregate.merge(partial)
+    return aggregate
+
+
+def _game_totals(aggregate, metric):
+    """{strategy: (hands, summed result)} of one game's AggregateRecorder."""
+    totals = {}
+    for name, tally in aggregate.strategies.items():
+        stats = tally.units if metric == "units" else tally.net
+        totals[name] = (stats.n, stats.mean * stats.n)
+    return totals
+
+
+def _game_deviations(games, name):
+    """
+    A strategy's EV per hand over the games played so far, its hands, and
+    every game's deviation from that EV, linearized per average game (the
+    ratio estimator's terms; their spread is the EV's standard error).
+    """
+    hands = [game.get(name, (0, 0.0))[0] for game in games]
+    totals = [game.get(name, (0, 0.0))[1] for game in games]
+    total_hands = sum(hands)
+    ev = sum(totals) / total_hands if total_hands else 0.0
+    mean_hands = total_hands / len(games)
+    return ev, total_hands, [(total - ev * n) / mean_hands for n, total in zip(hands, totals)]
+
+
+def _half_width(deviations, z):
+    games = len(deviations)
+    if games < 2:
+        return float("inf")
+    return z * math.sqrt(sum(deviation * deviation for deviation in deviations) / (games * (games - 1)))
+
+
+def _interval(ev, deviations, z):
+    half_width = _half_width(deviations, z)
+    return {"ev": ev, "half_width": half_width, "low": ev - half_width, "high": ev + half_width}
+
+
+def run_sequential(spec, half_width, confidence=0.95, compare=None, metric="units",
+                   max_rounds=1_000_000, min_games=2, games_per_check=1, max_workers=1):
+    """
+    Play games of the session (spec.games is ignored) until every strategy's EV
+    per hand is known to within +/- half_width at the given confidence, or
+    until max_rounds rounds have been played (in whole games, so up to
+    spec.rounds - 1 more).
+
+    Hands at one table share the dealer's hand and the shoe, and rounds of a
+    shoe share its composition, so they aren't independent draws; games are
+    (each has its own seed). Intervals therefore come from the spread of the
+    per-game results, and a difference is taken game by game, which also
+    lets the seats' shared luck cancel out of it.
+
+    metric is "units" (EV per unit of initial bet) or "money" (EV per hand in
+    balance). compare=(strategy_a, strategy_b) (class names) targets the EV
+    difference a - b instead. Precision is checked every games_per_check games
+    of spec.rounds rounds; with max_workers != 1 each such wave of games is
+    spread over a process pool. Game seeds follow derive_seed as in
+    run_session, so a run is reproducible for a given games_per_check.
+
+    Returns {"converged", "rounds", "games", "confidence", "target",
+    "estimates": {strategy: {"hands", "ev", "half_width", "low", "high"}},
+    "difference": {...} or None, "aggregate": AggregateRecorder}.
+    """
+    if metric not in ("units", "money"):
+        raise ValueError(f"Unknown metric: {metric}")
+    if max_rounds < 1:
+        raise ValueError(f"max_rounds must be at least 1, not {max_rounds}")
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    aggregate = AggregateRecorder()
+    games = []  # per game: {strategy: (hands, summed result)}
+    executor = None
+    if max_workers != 1:
+        from concurrent.futures import ProcessPoolExecutor
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    max_games = -(-max_rounds // spec.rounds)  # rounded up
+    game_num = 0
+    converged = False
+    try:
+        while game_num < max_games:
+            wave = range(game_num, min(game_num + games_per_check, max_games))
+            if executor is None:
+                partials = [aggregate_game(spec, n) for n in wave]
+            else:
+                partials = executor.map(aggregate_game, [spec] * len(wave), wave)
+            for partial in partials:
+                aggregate.merge(partial)
+                games.append(_game_totals(partial, metric))
+            game_num = wave.stop
+
+            deviations = {name: _game_deviations(games, name) for name in aggregate.strategies}
+            estimates = {name: {"hands": hands, **_interval(ev, terms, z)}
+                         for name, (ev, hands, terms) in deviations.items()}
+            difference = None
+            if compare is not None:
+                first, second = deviations[compare[0]], deviations[compare[1]]
+                difference = _interval(first[0] - second[0], [a - b for a, b in zip(first[2], second[2])], z)
+                widths = [difference["half_width"]]
+            else:
+                widths = [estimate["half_width"] for estimate in estimates.values()]
+            if game_num >= min_games and max(widths) <= half_width:
+                converged = True
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return {
+        "converged": converged,
+        "rounds": game_num * spec.rounds,
+        "games": game_num,
+        "confidence": confidence,
+        "target": half_width,
+        "estimates": estimates,
+        "difference": difference,
+        "aggregate": aggregate,
+    }
@@ -0,0 +1,213 @@
+"""
+Shoe Bank
+---------
+Pre-generated shuffles on disk, for common-random-numbers comparisons.
+
+A bank file holds `shuffles` shoe orders of a fixed deck count, generated
+from one seed, one row of card bytes per shuffle behind a small header. It is
+memory-mapped when opened, so a bank of any size costs nothing to reopen and
+is shared between processes by the OS page cache.
+
+A BankedShoe deals the bank's shuffles in order instead of shuffling itself.
+Games with different strategies then see exactly the same card sequence in
+every shoe, and their decisions only change which of those cards each one
+draws. run_paired() plays several strategies shoe by shoe through the same
+bank and measures their differences on matched shoes, which removes most of
+the card noise from the comparison.
+
+    bank = ShoeBank.load_or_create("shoes", number_of_decks=6, shuffles=5000, seed=42)
+    result = run_paired([strats.HiLoStrategy, strats.BasicStrategyCharts], bank, shoes=5000)
+"""
+import mmap
+import os
+import random
+import struct
+
+from blackjack import Game, Player, Shoe
+from recorders import NullRecorder, RunningStats
+
+_MAGIC = b"BJSHOE01"
+# magic, decks, cards per shuffle, number of shuffles, seed
+_HEADER = struct.Struct("<8sIIQQ")
+
+
+class ShoeBank:
+    """
+    `shuffles` shoe orders of `number_of_decks` decks each, as rows of card ints
+    in `buffer` (bytes, bytearray or an mmap of a bank file).
+    """
+    def __init__(self, buffer, number_of_decks, shuffles, seed, offset=0, path=None):
+        self.buffer = buffer
+        self.view = memoryview(buffer)[offset:]
+        self.number_of_decks = number_of_decks
+        self.shoe_size = number_of_decks * 52
+        self.shuffles = shuffles
+        self.seed = seed
+        self.path = path
+        if len(self.view) < shuffles * self.shoe_size:
+            raise ValueError("The buffer is too short for the bank it describes")
+
+    @classmethod
+    def generate(cls, number_of_decks, shuffles, seed):
+        """Build a bank in memory. The same arguments always give the same shuffles."""
+        if not 0 <= seed < 1 << 64:
+            raise ValueError("Bank seeds are unsigned 64-bit integers")
+        rng = random.Random(seed)
+        cards = bytearray(range(52)) * number_of_decks
+        buffer = bytearray()
+        for _ in range(shuffles):
+            rng.shuffle(cards)
+            buffer += cards
+        return cls(buffer, number_of_decks, shuffles, seed)
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(_HEADER.pack(_MAGIC, self.number_of_decks, self.shoe_size, self.shuffles, self.seed))
+            f.write(self.view[:self.shuffles * self.shoe_size])
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a bank file (read-only)."""
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, number_of_decks, shoe_size, shuffles, seed = _HEADER.unpack_from(mapped)
+        if magic != _MAGIC or shoe_size != number_of_decks * 52:
+            mapped.close()
+            raise ValueError(f"{path} is not a shoe bank")
+        return cls(mapped, number_of_decks, shuffles, seed, offset=_HEADER.size, path=path)
+
+    @classmethod
+    def load_or_create(cls, directory, number_of_decks, shuffles, seed):
+        """Open the bank for (decks, seed) in directory, generating it first if it's missing or too small."""
+        path = os.path.join(directory, f"shoes_{number_of_decks}d_{seed}.bin")
+        if os.path.exists(path):
+            bank = cls.open(path)
+            if bank.shuffles >= shuffles:
+                return bank
+            bank.close()
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary name first so a half-written bank is never picked up
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        cls.generate(number_of_decks, shuffles, seed).save(tmp_path)
+        os.replace(tmp_path, path)
+        return cls.open(path)
+
+    def shuffle(self, index):
+        """Card order of one shuffle, as a read-only memoryview."""
+        if not 0 <= index < self.shuffles:
+            raise IndexError(f"The bank only holds {self.shuffles} shuffles")
+        start = index * self.shoe_size
+        return self.view[start:start + self.shoe_size]
+
+    def __len__(self):
+        return self.shuffles
+
+    def close(self):
+        self.view.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __getstate__(self):
+        # Other processes map the file again rather than receive a copy of it
+        if self.path is not None:
+            return {"path": self.path}
+        return {"buffer": bytes(self.view[:self.shuffles * self.shoe_size]), "number_of_decks": self.number_of_decks,
+                "shuffles": self.shuffles, "seed": self.seed}
+
+    def __setstate__(self, state):
+        if "path" in state:
+            bank = ShoeBank.open(state["path"])
+        else:
+            bank = ShoeBank(state["buffer"], state["number_of_decks"], state["shuffles"], state["seed"])
+        self.__dict__.update(bank.__dict__)
+
+
+class BankedShoe(Shoe):
+    """A Shoe that deals the bank's shuffles in order, from shuffle `start`, instead of shuffling."""
+
+    def __init__(self, bank, start=0, penetration=0.60, burn=0):
+        self.bank = bank
+        self.index = start - 1
+        super().__init__(bank.number_of_decks, None, penetration, burn)
+
+    def shuffle(self):
+        self.index += 1
+        self.cards[:] = self.bank.shuffle(self.index)
+        self.cursor = self.burn
+
+    def snapshot(self):
+        # The bank holds the order; only where in it the shoe is needs saving
+        return {"index": self.index, "cursor": self.cursor}
+
+    def restore(self, state):
+        self.index = state["index"]
+        if self.index >= 0:
+            self.cards[:] = self.bank.shuffle(self.index)
+        self.cursor = state["cursor"]
+
+
+def play_shoes(strategy, bank, shoes, start, seats, balance, penetration, burn):
+    """Per-shoe net result of each seat, playing every shoe from the same bankroll."""
+    players = [Player(name=f"{strategy.__name__} {seat + 1}", strategy=strategy(), balance=balance)
+               for seat in range(seats)]
+    shoe = BankedShoe(bank, start, penetration, burn)
+    game = Game(bank.number_of_decks, players, recorder=NullRecorder(), shoe=shoe)
+    nets = []
+    round_num = 0
+    for shoe_num in range(shoes):
+        if shoe_num:
+            game.reshuffle()
+        for player in players:
+            player.balance = balance
+            player.win_streak = player.loss_streak = 0
+        while not shoe.needs_shuffle():
+            game.play_round(round_num)
+            round_num += 1
+        nets.append(sum(player.balance - balance for player in players))
+    return nets, round_num
+
+
+def run_paired(strategies, bank, shoes, start=0, seats=1, balance=1000, penetration=0.60, burn=0, max_workers=1):
+    """
+    Play each strategy (a class) through the same `shoes` shuffles of the bank,
+    resetting every seat to `balance` at each shoe, and compare them shoe by
+    shoe. With max_workers != 1 the strategies play in parallel processes.
+
+    Returns {"shoes", "rounds": {strategy: rounds played},
+    "net": {strategy: RunningStats of the per-shoe net},
+    "paired": {strategy: RunningStats of (net - first strategy's net)}}.
+    The paired stats' sem is the standard error of the EV difference per shoe;
+    set against the unpaired error sqrt(sem_a**2 + sem_b**2) it shows how much
+    the shared cards saved. Results are keyed by class name, so the
+    strategies' names must differ.
+    """
+    names = [strategy.__name__ for strategy in strategies]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Strategies share a name ({', '.join(duplicates)}); their results would overwrite each other")
+    if start + shoes > len(bank):
+        raise ValueError(f"The bank holds {len(bank)} shuffles; {start + shoes} needed")
+    args = [(strategy, bank, shoes, start, seats, balance, penetration, burn) for strategy in strategies]
+    if max_workers == 1:
+        played = [play_shoes(*arg) for arg in args]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            played = list(executor.map(play_shoes, *zip(*args)))
+    per_shoe = {}
+    rounds = {}
+    for name, (nets, rounds_played) in zip(names, played):
+        per_shoe[name] = nets
+        rounds[name] = rounds_played
+
+    net = {}
+    paired = {}
+    for name in names:
+        stats = net[name] = RunningStats()
+        for value in per_shoe[name]:
+            stats.add(value)
+    for name in names[1:]:
+        stats = paired[name] = RunningStats()
+        for value, reference in zip(per_shoe[name], per_shoe[names[0]]):
+            stats.add(value - reference)
+    return {"shoes": shoes, "rounds": rounds, "net": net, "paired": paired}
@@ -10,7 +10,8 @@ This module contains various blackjack playing strategies, including:
 Reference: https://www.qfit.com/card-counting-systems.htm
 """
 import math
-from blackjack import Hand
+from blackjack import Hand, ACE, EIGHT, RANK_VALUES
+from tables import ActionTable, ACTIONS, N_TOTALS, N_UPCARDS, MIN_COUNT_BUCKET, MAX_COUNT_BUCKET, read_chart, write_chart
 
 class BaseStrategy:
     def __init__(self):
@@ -20,11 +21,30 @@ class BaseStrategy:
     Provides default implementations for all strategy decisions.
     Subclasses should override these methods to implement specific strategies.
     """
+    # Bets are a fraction of the bankroll: BET_RAMP holds (min true count, fraction)
+    # steps, highest count first, and BASE_BET_FRACTION applies below every step.
+    BASE_BET_FRACTION = 0.01
+    BET_RAMP = ()
+    # PURE_DECISIONS declares that play_turn depends only on the state a
+    # blackjack.DecisionCache keys on, so games memoize its decisions;
+    # DECISION_COUNT_STEP is the true-count step that state includes (None if
+    # the count doesn't matter). Worth it when play_turn does more work than a
+    # dict lookup. Only a class that sets it in its own body is memoized: a
+    # subclass may play on anything else (the shoe, its own history), so it
+    # isn't unless it declares it again.
+    PURE_DECISIONS = False
+    DECISION_COUNT_STEP = None
+
     def place_bet(self, player, true_count=0):
-        return round(player.balance * 0.01, 2)
+        fraction = self.BASE_BET_FRACTION
+        for min_count, step_fraction in self.BET_RAMP:
+            if true_count >= min_count:
+                fraction = step_fraction
+                break
+        return round(player.balance * fraction, 2)
     
     def decide_split(self, hand, dealer_card, true_count):
-        return hand.cards[0].split("_")[0] in ["Ace", "8"] and (hand.cards[0].split("_")[1] == hand.cards[0].split("_")[0])
+        return hand.is_pair and hand.cards[0] % 13 in (ACE, EIGHT)
             
     def decide_hit(self, hand, dealer_card, true_count):  
         return hand.get_score()<17
@@ -76,14 +96,7 @@ class HiLo_bettingOnly(BaseStrategy):
     Uses a simple card counting system to adjust betting.
     The true count is calculated based on the number of high cards remaining in the deck.
     """
-    def place_bet(self, player, true_count):
-        if true_count >= 5:
-            return round(player.balance * 0.1, 2)
-        elif true_count >= 4:
-            return round(player.balance * 0.05, 2)
-        elif true_count >= 2:
-            return round(player.balance * 0.025, 2)
-        return round(player.balance * 0.01, 2)
+    BET_RAMP = ((5, 0.1), (4, 0.05), (2, 0.025))
 
     def decide_double(self, hand, dealer_card, true_count):
         return False
@@ -131,86 +144,174 @@ class BasicStrategyCharts(HiLo_bettingOnly):
     """
     #Assuming Doubling After Split IS NOT Allowed
     #Using True Count betting Style
+    # Plays on the hand and upcard alone, and through more branches than a cache lookup takes
+    PURE_DECISIONS = True
+
     def place_bet(self, player, true_count):
         return super().place_bet(player, true_count)
     
-    def decide_double(self, card1, card2, is_Soft, dealer_card, hand_value):
+    def decide_double(self, pair_value, is_Soft, dealer_value, hand_value):
         if is_Soft:
-            if dealer_card in ["2", "3", "4", "5", "6"]:
-                if dealer_card == "8" and hand_value == 19:
-                    return True
+            if 2 <= dealer_value <= 6:
                 if hand_value == 18:
                     return True
-                if hand_value ==  17 and dealer_card in ["3", "4", "5", "6"]:
+                if hand_value == 17 and 3 <= dealer_value <= 6:
                     return True
-                if (hand_value == 16 or hand_value == 15) and dealer_card in ["4", "5", "6"]:
+                if (hand_value == 16 or hand_value == 15) and 4 <= dealer_value <= 6:
                     return True
-                if (hand_value == 14 or hand_value == 13) and dealer_card in ["5", "6"]:
+                if (hand_value == 14 or hand_value == 13) and 5 <= dealer_value <= 6:
                     return True
             return False
         else:
             if hand_value == 11:
                 return True
-            if hand_value == 10 and dealer_card in ["2", "3", "4", "5", "6", "7", "8", "9"]:
+            if hand_value == 10 and 2 <= dealer_value <= 9:
                 return True
-            if hand_value==9 and dealer_card in ["3", "4", "5", "6"]:
+            if hand_value == 9 and 3 <= dealer_value <= 6:
                 return True
             return False
-                
-      
-    def decide_stand(self, card1, card2, is_Soft, dealer_card, hand_value):
+
+    def decide_stand(self, pair_value, is_Soft, dealer_value, hand_value):
         if is_Soft:
-            if hand_value == 20:
+            if hand_value >= 20:
                 return True
-            if hand_value == 19 and dealer_card != "6":
+            if hand_value == 19 and dealer_value != 6:
                 return True
-            if hand_value == 18 and dealer_card in [ "7", "8"]:
+            if hand_value == 18 and dealer_value in (7, 8):
                 return True
             return False
         else:
             if hand_value >= 17:
                 return True
-            if hand_value in [13,14,15,16] and dealer_card in ["2","3", "4", "5", "6"]:
+            if 13 <= hand_value <= 16 and 2 <= dealer_value <= 6:
                 return True
-            if hand_value in [12] and dealer_card in ["4", "5", "6"]:
+            if hand_value == 12 and 4 <= dealer_value <= 6:
                 return True
             return False
 
-    def decide_split(self, card1, card2, is_Soft, dealer_card, hand_value):
-        if card1 != card2:
+    def decide_split(self, pair_value, is_Soft, dealer_value, hand_value):
+        # pair_value is the value of the paired rank, or None when the hand is not a pair
+        if pair_value is None:
             return False
-        if card1 in ["Ace", "8"]:
+        if pair_value in (11, 8):
             return True
-        if card1 in ["2", "3", "6","7", "9"]:
-            if (card1 == "2" or card1=="3") and dealer_card in ["4", "5", "6", "7"]:
+        if pair_value in (2, 3, 6, 7, 9):
+            if pair_value in (2, 3) and 4 <= dealer_value <= 7:
                 return True
-            if card1 in ["7", "6", "9"] and dealer_card in ["2", "3", "4", "5", "6"]:
-                return False if card1 =="6" and dealer_card == "2" else True
-            
-            if card1 == "9" and dealer_card in ["8", "9"]:
+            if pair_value in (7, 6, 9) and 2 <= dealer_value <= 6:
+                return False if pair_value == 6 and dealer_value == 2 else True
+
+            if pair_value == 9 and dealer_value in (8, 9):
                 return True
 
-            if card1 == dealer_card:
+            if pair_value == dealer_value:
                 return True
-            
+
         return False
 
     def play_turn(self, hand, dealer_card, true_count=0):
 
         hand_value = hand.get_score()
-        card1 = hand.cards[0].split("_")[1]
-        card2 = hand.cards[1].split("_")[1]
-        is_Soft = card1 == "Ace" or card2 == "Ace"
-        dealer_card = dealer_card.split("_")[1]
+        pair_value = RANK_VALUES[hand.cards[0] % 13] if hand.is_pair else None
+        is_Soft = hand.is_soft()
+        dealer_value = RANK_VALUES[dealer_card % 13]
 
-        if self.decide_split(card1, card2, is_Soft, dealer_card, hand_value):
+        if self.decide_split(pair_value, is_Soft, dealer_value, hand_value):
             return "split"
-        elif self.decide_double(card1, card2, is_Soft, dealer_card, hand_value):
+        elif self.decide_double(pair_value, is_Soft, dealer_value, hand_value):
             return "double"
-        elif self.decide_stand(card1, card2, is_Soft, dealer_card, hand_value):
+        elif self.decide_stand(pair_value, is_Soft, dealer_value, hand_value):
             return "stand"
         else:
             return "hit"
 
-    
-        
\ No newline at end of file
+
+def with_betting(strategy, bet_ramp=None, base_bet_fraction=None):
+    """
+    Subclass of a strategy class that plays the same way but bets with the given
+    ramp ((min true count, fraction) steps, highest first) and base fraction.
+    """
+    attrs = {"__module__": strategy.__module__}
+    if bet_ramp is not None:
+        attrs["BET_RAMP"] = tuple(sorted((tuple(step) for step in bet_ramp), reverse=True))
+    if base_bet_fraction is not None:
+        attrs["BASE_BET_FRACTION"] = base_bet_fraction
+    if "PURE_DECISIONS" in vars(strategy):
+        # It plays exactly as the strategy does
+        attrs["PURE_DECISIONS"] = strategy.PURE_DECISIONS
+    return type(strategy.__name__, (strategy,), attrs)
+
+
+class TableStrategy(BaseStrategy):
+    """
+    Compiled Lookup-Table Strategy
+    ------------------------------
+    Plays every decision with a single lookup into an ActionTable indexed by
+    (true-count bucket, hard/soft/pair, total, dealer upcard). Build one from
+    any strategy with compile() or from a chart file with from_chart(); the
+    same table drives batch.BatchGame. Betting follows BASE_BET_FRACTION and
+    BET_RAMP, copied from the compiled strategy.
+    """
+    def __init__(self, table, base_bet_fraction=None, bet_ramp=None):
+        self.table = table
+        if base_bet_fraction is not None:
+            self.BASE_BET_FRACTION = base_bet_fraction
+        if bet_ramp is not None:
+            self.BET_RAMP = tuple(bet_ramp)
+
+    @classmethod
+    def compile(cls, strategy, counted=True):
+        return cls(ActionTable.from_strategy(strategy, counted), strategy.BASE_BET_FRACTION, strategy.BET_RAMP)
+
+    @classmethod
+    def from_chart(cls, path, counted=None, base_bet_fraction=None, bet_ramp=None):
+        return cls(read_chart(path, counted), base_bet_fraction, bet_ramp)
+
+    def to_chart(self, path):
+        write_chart(self.table, path)
+
+    def play_turn(self, hand, dealer_card, true_count=0):
+        table = self.table
+        if table.counted:
+            bucket = int(true_count // 1)
+            bucket = min(max(bucket, MIN_COUNT_BUCKET), MAX_COUNT_BUCKET) - MIN_COUNT_BUCKET
+        else:
+            bucket = 0
+
+        if hand.is_pair:
+            category = 2
+            total = RANK_VALUES[hand.cards[0] % 13]
+        elif hand.aces and hand.hard_total <= 11:
+            category = 1
+            total = hand.hard_total + 10
+        else:
+            category = 0
+            total = hand.hard_total
+        if total >= N_TOTALS:
+            return "stand"
+
+        index = ((bucket * 3 + category) * N_TOTALS + total) * N_UPCARDS + RANK_VALUES[dealer_card % 13] - 2
+        return ACTIONS[table.actions[index]]
+
+
+class PerfectPlayStrategy(BaseStrategy):
+    """
+    Perfect Play Strategy
+    ---------------------
+    Picks the action with the highest composition-dependent EV (see ev.py)
+    for the cards the player hasn't seen this shoe. The game it sits at
+    attaches itself through attach(), so it can't be compiled into a table.
+    Decisions come from ev.fixed_evs, one table per upcard and composition; exact=True
+    uses the exact (much slower) ev.hand_evs instead.
+    """
+    def __init__(self, exact=False):
+        import ev  # NumPy-backed, so only loaded when this strategy is used
+        self.hand_evs = ev.hand_evs if exact else ev.fixed_hand_evs
+        self.game = None
+
+    def attach(self, game):
+        self.game = game
+
+    def play_turn(self, hand, dealer_card, true_count=0):
+        evs = self.hand_evs(hand, RANK_VALUES[dealer_card % 13], self.game.unseen_composition())
+        return max(evs, key=evs.get)
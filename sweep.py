@@ -0,0 +1,150 @@
+"""
+Parameter Sweeps
+----------------
+Runs a grid of simulation configurations (decks x penetration x strategy x
+bet ramp x seats x seeds) in parallel, caching every cell's results on disk.
+
+A cell's cache file is named after a hash of its configuration (seed
+included) and blackjack.ENGINE_VERSION, and is written as soon as the cell
+finishes. Re-running a sweep only plays the cells that aren't cached yet, so
+an interrupted sweep resumes where it stopped, and overlapping sweeps share
+cells.
+
+    cells = expand(decks=range(4, 9), strategies=["HiLoStrategy", "BasicStrategyCharts"],
+                   seats=[1, 6], seeds=range(10), rounds=500, games=10)
+    rows = run_sweep(cells)
+    pd.DataFrame(rows)
+
+Each cell plays `games` games of `rounds` rounds with `seats` players of one
+strategy into a recorders.AggregateRecorder; its rows are the aggregate's
+summary rows, with the cell's configuration added as columns.
+"""
+import hashlib
+import importlib
+import itertools
+import json
+import os
+
+from blackjack import ENGINE_VERSION
+from runner import SessionSpec, aggregate_games
+import strategies as strats
+
+DEFAULT_CACHE_DIR = "sweep_cache"
+
+
+def strategy_name(strategy):
+    """Config name of a strategy: a strategies.py class name, or "module.Class" for others."""
+    if isinstance(strategy, str):
+        return strategy
+    if strategy.__module__ == strats.__name__:
+        return strategy.__name__
+    return f"{strategy.__module__}.{strategy.__qualname__}"
+
+
+def resolve_strategy(name):
+    """Strategy class for a config name (see strategy_name)."""
+    module_name, _, class_name = name.rpartition(".")
+    module = importlib.import_module(module_name) if module_name else strats
+    return getattr(module, class_name)
+
+
+def expand(decks=(6,), penetration=(0.60,), strategies=("BasicStrategyCharts",), bet_ramps=(None,),
+           seats=(1,), seeds=(0,), rounds=500, games=1, balance=1000):
+    """
+    Every combination of the given values, as a list of cell configs (plain
+    dicts). A bet ramp is None (the strategy's own) or a sequence of
+    (min true count, bankroll fraction) steps.
+    """
+    cells = []
+    for n_decks, pen, strategy, ramp, n_seats, seed in itertools.product(
+            decks, penetration, strategies, bet_ramps, seats, seeds):
+        cells.append({
+            "decks": n_decks,
+            "penetration": pen,
+            "strategy": strategy_name(strategy),
+            "bet_ramp": [list(step) for step in ramp] if ramp is not None else None,
+            "seats": n_seats,
+            "seed": seed,
+            "rounds": rounds,
+            "games": games,
+            "balance": balance,
+        })
+    return cells
+
+
+def cell_key(cell):
+    """Content hash of a cell config and the engine version."""
+    payload = json.dumps({"cell": cell, "engine": ENGINE_VERSION}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cell_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], f"{key}.json")
+
+
+def run_cell(cell):
+    """Play one cell and return its summary rows (without the config columns)."""
+    strategy = resolve_strategy(cell["strategy"])
+    if cell["bet_ramp"] is not None:
+        strategy = strats.with_betting(strategy, bet_ramp=cell["bet_ramp"])
+    spec = SessionSpec([strategy] * cell["seats"], number_of_decks=cell["decks"], rounds=cell["rounds"],
+                       games=cell["games"], seed=cell["seed"], balance=cell["balance"],
+                       penetration=cell["penetration"])
+    return aggregate_games(spec, range(spec.games)).get_stats()
+
+
+def load_cell(cache_dir, cell):
+    """Cached rows of a cell, or None if it hasn't been run."""
+    path = cell_path(cache_dir, cell_key(cell))
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)["rows"]
+
+
+def _store_cell(cache_dir, cell, rows):
+    key = cell_key(cell)
+    path = cell_path(cache_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename, so an interrupted write never leaves a cell that looks finished
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"cell": cell, "engine": ENGINE_VERSION, "rows": rows}, f)
+    os.replace(tmp_path, path)
+
+
+def _with_config(cell, rows):
+    config = {name: (json.dumps(value) if isinstance(value, list) else value) for name, value in cell.items()}
+    return [{**config, **row} for row in rows]
+
+
+def run_sweep(cells, cache_dir=DEFAULT_CACHE_DIR, max_workers=None, progress=None):
+    """
+    Run every cell that isn't cached yet (in a process pool; max_workers=1
+    plays in this process) and return all cells' rows in cell order.
+    progress, if given, is called as progress(done, total) after each cell.
+    """
+    results = [load_cell(cache_dir, cell) for cell in cells]
+    pending = [i for i, rows in enumerate(results) if rows is None]
+    done = len(cells) - len(pending)
+
+    if max_workers == 1:
+        for i in pending:
+            results[i] = run_cell(cells[i])
+            _store_cell(cache_dir, cells[i], results[i])
+            done += 1
+            if progress is not None:
+                progress(done, len(cells))
+    elif pending:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_cell, cells[i]): i for i in pending}
+            for future in as_completed(futures):
+                i = futures[future]
+                results[i] = future.result()
+                _store_cell(cache_dir, cells[i], results[i])
+                done += 1
+                if progress is not None:
+                    progress(done, len(cells))
+
+    return [row for cell, rows in zip(cells, results) for row in _with_config(cell, rows)]
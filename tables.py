@@ -0,0 +1,237 @@
+"""
+Strategy Tables
+---------------
+Action tables compiled from a strategy's play_turn decisions.
+
+A table holds one action per (true-count bucket, hand category, player total,
+dealer upcard), so a decision is a single index into a flat bytearray. Hands
+are categorised as hard, soft or pair; pair rows are indexed by the value of
+the paired card instead of the hand total. Tables only capture strategies
+whose decisions depend on those four things (every strategy in strategies.py
+does).
+"""
+from blackjack import Hand, ACE, RANK_VALUES, make_card
+from counting import MIN_COUNT_BUCKET, MAX_COUNT_BUCKET, N_COUNT_BUCKETS, count_bucket
+
+STAND, HIT, DOUBLE, SPLIT = range(4)
+ACTIONS = ("stand", "hit", "double", "split")
+ACTION_CODES = {name: code for code, name in enumerate(ACTIONS)}
+
+HARD, SOFT, PAIR = range(3)
+CATEGORIES = ("hard", "soft", "pair")
+
+N_TOTALS = 22
+UPCARDS = tuple(range(2, 12))  # dealer upcard values, ace = 11
+N_UPCARDS = len(UPCARDS)
+
+def hand_key(hand):
+    """(category, total) for a hand; pairs use the paired card's value as the total."""
+    if hand.is_pair:
+        return PAIR, RANK_VALUES[hand.cards[0] % 13]
+    total = hand.hard_total
+    if hand.aces and total <= 11:
+        return SOFT, total + 10
+    return HARD, total
+
+
+def _rank_of_value(value):
+    return ACE if value == 11 else value - 2
+
+
+def probe_hand(category, total):
+    """Build a representative hand for a table cell, or None if the cell can't occur."""
+    if category == HARD:
+        if total < 4 or total > 21:
+            return None
+        if total <= 11:
+            ranks = [0, total - 4] if total > 4 else [0, 0]
+        elif total < 20:
+            ranks = [8, total - 12]
+        elif total == 20:
+            ranks = [8, 9]  # 10 + Jack
+        else:
+            ranks = [8, 7, 0]  # 10 + 9 + 2
+    elif category == SOFT:
+        if total < 12 or total > 21:
+            return None
+        ranks = [ACE, ACE if total == 12 else _rank_of_value(total - 11)]
+    else:
+        if total < 2 or total > 11:
+            return None
+        ranks = [_rank_of_value(total)] * 2
+
+    hand = Hand()
+    for rank in ranks:
+        hand.add_card(make_card(rank))
+    # Hard 4 and soft 12 only occur as pairs, but a hand can still land there unpaired
+    hand.is_pair = category == PAIR
+    return hand
+
+
+class ActionTable:
+    """Flat action table indexed by (count bucket, category, total, upcard)."""
+
+    def __init__(self, actions, counted=True):
+        self.counted = counted
+        self.n_buckets = N_COUNT_BUCKETS if counted else 1
+        self.actions = bytearray(actions)
+        if len(self.actions) != self.n_buckets * 3 * N_TOTALS * N_UPCARDS:
+            raise ValueError("Action table has the wrong size")
+
+    @property
+    def shape(self):
+        return (self.n_buckets, 3, N_TOTALS, N_UPCARDS)
+
+    def index(self, bucket, category, total, upcard_value):
+        return ((bucket * 3 + category) * N_TOTALS + total) * N_UPCARDS + upcard_value - 2
+
+    def lookup(self, true_count, category, total, upcard_value):
+        bucket = count_bucket(true_count) if self.counted else 0
+        return self.actions[self.index(bucket, category, total, upcard_value)]
+
+    @classmethod
+    def from_strategy(cls, strategy, counted=True):
+        """Probe strategy.play_turn for every cell of the table."""
+        if isinstance(getattr(strategy, "table", None), ActionTable):
+            return strategy.table
+        n_buckets = N_COUNT_BUCKETS if counted else 1
+        actions = bytearray(n_buckets * 3 * N_TOTALS * N_UPCARDS)
+        table = cls(actions, counted)
+        for bucket in range(n_buckets):
+            true_count = bucket + MIN_COUNT_BUCKET if counted else 0
+            for category in (HARD, SOFT, PAIR):
+                for total in range(N_TOTALS):
+                    hand = probe_hand(category, total)
+                    if hand is None:
+                        continue
+                    for upcard in UPCARDS:
+                        choice = strategy.play_turn(
+                            hand=hand,
+                            dealer_card=make_card(_rank_of_value(upcard)),
+                            true_count=true_count
+                        )
+                        table.actions[table.index(bucket, category, total, upcard)] = ACTION_CODES.get(choice, STAND)
+        return table
+
+    def copy(self):
+        return ActionTable(self.actions, self.counted)
+
+
+# Chart files
+# -----------
+# CSV with a header "count,hand,2,3,4,5,6,7,8,9,10,A" and one row per hand, e.g.
+#   *,hard 16,S,S,S,S,S,H,H,H,H,H
+#   >=0,hard 16,.,.,.,.,.,.,.,.,S,.
+# Cells are S(tand), H(it), D(ouble) or P (split); "." leaves the cell as it is.
+# The count column selects true-count buckets: "*" for all, "N" for floor(tc) == N,
+# ">=N" or "<N" for ranges. Rows apply in order, so deviation rows after the
+# base chart override it.
+CHART_LETTERS = "SHDP"
+UPCARD_LABELS = ("2", "3", "4", "5", "6", "7", "8", "9", "10", "A")
+CHART_ROWS = (
+    [(HARD, total) for total in range(4, 22)]
+    + [(SOFT, total) for total in range(12, 22)]
+    + [(PAIR, total) for total in range(2, 12)]
+)
+
+
+def _hand_label(category, total):
+    return f"{CATEGORIES[category]} {'A' if category == PAIR and total == 11 else total}"
+
+
+def _parse_hand_label(label):
+    category, total = label.split()
+    total = 11 if total.upper() == "A" else int(total)
+    return CATEGORIES.index(category.lower()), total
+
+
+def _buckets_for(selector, n_buckets):
+    if n_buckets == 1:
+        return [0]
+    selector = selector.strip()
+    if selector in ("", "*"):
+        return list(range(n_buckets))
+    if selector.startswith(">="):
+        low = int(selector[2:])
+        return [b for b in range(n_buckets) if b + MIN_COUNT_BUCKET >= low]
+    if selector.startswith("<"):
+        high = int(selector[1:])
+        return [b for b in range(n_buckets) if b + MIN_COUNT_BUCKET < high]
+    return [count_bucket(int(selector))]
+
+
+def write_chart(table, path):
+    """Write a table as a chart: base rows at true count 0, then per-bucket deviations."""
+    base = count_bucket(0) if table.counted else 0
+
+    def row_cells(bucket, category, total):
+        return [CHART_LETTERS[table.actions[table.index(bucket, category, total, up)]] for up in UPCARDS]
+
+    lines = ["count,hand," + ",".join(UPCARD_LABELS)]
+    for category, total in CHART_ROWS:
+        lines.append(",".join(["*", _hand_label(category, total)] + row_cells(base, category, total)))
+    for bucket in range(table.n_buckets):
+        if bucket == base:
+            continue
+        for category, total in CHART_ROWS:
+            base_cells = row_cells(base, category, total)
+            cells = row_cells(bucket, category, total)
+            if cells != base_cells:
+                cells = [cell if cell != base_cell else "." for cell, base_cell in zip(cells, base_cells)]
+                lines.append(",".join([str(bucket + MIN_COUNT_BUCKET), _hand_label(category, total)] + cells))
+    with open(path, "w") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def read_chart(path, counted=None):
+    """
+    Load a chart file into an ActionTable. Hard and soft hands the chart
+    leaves out default to hit below 17 and stand otherwise; pairs it leaves
+    out play as their total (the hard row of twice the card, soft 12 for
+    aces). counted defaults to whether the chart has any rows that select
+    specific counts.
+    """
+    with open(path) as f:
+        rows = [line.strip().split(",") for line in f if line.strip() and not line.startswith("#")]
+    header, rows = rows[0], rows[1:]
+    if [cell.strip() for cell in header[2:]] != list(UPCARD_LABELS):
+        raise ValueError(f"{path}: expected upcard columns {','.join(UPCARD_LABELS)}")
+    if counted is None:
+        counted = any(row[0].strip() not in ("", "*") for row in rows)
+
+    n_buckets = N_COUNT_BUCKETS if counted else 1
+    table = ActionTable(bytearray(n_buckets * 3 * N_TOTALS * N_UPCARDS), counted)
+    parsed = []
+    for line_num, row in enumerate(rows, start=2):
+        if len(row) != 2 + N_UPCARDS:
+            raise ValueError(f"{path}:{line_num}: expected {2 + N_UPCARDS} cells")
+        parsed.append((line_num, row, _parse_hand_label(row[1])))
+
+    def fill(pairs):
+        for line_num, row, (category, total) in parsed:
+            if (category == PAIR) != pairs:
+                continue
+            for bucket in _buckets_for(row[0], n_buckets):
+                for upcard, cell in zip(UPCARDS, row[2:]):
+                    cell = cell.strip().upper()
+                    if cell in ("", "."):
+                        continue
+                    if cell not in CHART_LETTERS:
+                        raise ValueError(f"{path}:{line_num}: unknown action {cell!r}")
+                    table.actions[table.index(bucket, category, total, upcard)] = CHART_LETTERS.index(cell)
+
+    for bucket in range(n_buckets):
+        for category, total in CHART_ROWS:
+            if category != PAIR:
+                for upcard in UPCARDS:
+                    table.actions[table.index(bucket, category, total, upcard)] = HIT if total < 17 else STAND
+    fill(pairs=False)
+    # Pairs default to their total's row as read, so they can't default to hitting e.g. 10,10
+    for bucket in range(n_buckets):
+        for value in range(2, 12):
+            category, total = (SOFT, 12) if value == 11 else (HARD, 2 * value)
+            for upcard in UPCARDS:
+                action = table.actions[table.index(bucket, category, total, upcard)]
+                table.actions[table.index(bucket, PAIR, value, upcard)] = action
+    fill(pairs=True)
+    return table
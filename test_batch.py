@@ -0,0 +1,21 @@
+import pytest
+
+import strategies as strats
+from batch import COMPARED_COLUMNS, cross_check
+
+# The per-table standard errors make z about standard normal, so |z| over 4 on
+# any of the seven columns means the engines disagree rather than bad luck
+MAX_Z = 4.0
+
+
+@pytest.mark.parametrize("strategy, seed", [
+    (strats.BaseStrategy, 0),
+    (strats.HiLoStrategy, 0),
+    (strats.HiLo_decisionOnly, 3),
+    (strats.BasicStrategyCharts, 1),
+])
+def test_batch_engine_agrees_with_game(strategy, seed):
+    comparison = cross_check(strategy(), seed=seed)
+    assert set(comparison) == set(COMPARED_COLUMNS)
+    for column, (game_rate, batch_rate, z) in comparison.items():
+        assert abs(z) < MAX_Z, f"{column}: Game {game_rate:.4f} vs BatchGame {batch_rate:.4f} (z = {z:.2f})"
@@ -0,0 +1,13 @@
+from charts import _two_card_hands, best_action
+from tables import SOFT, STAND
+
+
+def test_soft_21_has_no_two_card_hands():
+    # Its only two-card hand, A+10, is a blackjack
+    assert _two_card_hands(SOFT, 21) == []
+    assert all(best_action(SOFT, 21, upcard, 6) is None for upcard in range(2, 12))
+
+
+def test_soft_20_is_ace_nine():
+    assert _two_card_hands(SOFT, 20) == [(9, 11)]
+    assert best_action(SOFT, 20, 6, 6) == STAND
@@ -0,0 +1,18 @@
+import pytest
+
+import strategies as strats
+from distributed import Coordinator, run_distributed
+from runner import SessionSpec, run_aggregate
+
+
+def test_two_workers_match_run_aggregate():
+    spec = SessionSpec([strats.BaseStrategy, strats.HiLoStrategy], rounds=50, games=6, seed=7)
+    # Units of 2 games, so both workers get some and results come back out of order
+    distributed = run_distributed(spec, workers=2, unit_games=2)
+    local = run_aggregate(spec, max_workers=1, games_per_task=2)
+    assert distributed.get_stats() == local.get_stats()
+
+
+def test_reachable_address_needs_an_authkey():
+    with pytest.raises(ValueError):
+        Coordinator(("0.0.0.0", 0))
@@ -0,0 +1,17 @@
+from tables import HARD, HIT, PAIR, SOFT, STAND, UPCARD_LABELS, read_chart
+
+
+def test_chart_without_pairs_plays_pairs_as_their_total(tmp_path):
+    chart = tmp_path / "no_pairs.csv"
+    chart.write_text("count,hand," + ",".join(UPCARD_LABELS) + "\n"
+                     "*,hard 16," + ",".join(["S"] * 5 + ["H"] * 5) + "\n")
+    table = read_chart(chart)
+
+    def action(category, total, upcard):
+        return table.actions[table.index(0, category, total, upcard)]
+
+    assert action(PAIR, 10, 6) == STAND  # 10,10 is hard 20
+    assert action(PAIR, 9, 6) == STAND
+    assert action(PAIR, 8, 6) == action(HARD, 16, 6) == STAND
+    assert action(PAIR, 8, 10) == action(HARD, 16, 10) == HIT
+    assert action(PAIR, 11, 6) == action(SOFT, 12, 6) == HIT